@@ -0,0 +1,69 @@
+"""
+Zip archives streamed as they are written, for bulk downloads
+"""
+import os
+import time
+import zipfile
+from typing import Iterable, Iterator, Set, Tuple
+
+
+class ZipSink:
+    """
+    Write-only file object that collects the bytes zipfile produces
+    It can't seek, so zipfile writes sizes and CRCs in data descriptors after
+    each entry instead of going back to the local headers.
+    """
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+    
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._offset += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._offset
+    
+    def flush(self) -> None:
+        pass
+    
+    def take(self) -> bytes:
+        """Returns and forgets the bytes written since the last call"""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def unique_name(filename: str, used: Set[str]) -> str:
+    """Entry name for a file: its base name, numbered if already taken"""
+    name = os.path.basename(filename.replace("\\", "/")) or "document"
+    stem, ext = os.path.splitext(name)
+    number = 1
+    while name in used:
+        number += 1
+        name = f"{stem} ({number}){ext}"
+    used.add(name)
+    return name
+
+
+def stream_zip(entries: Iterable[Tuple[str, Iterable[bytes]]]) -> Iterator[bytes]:
+    """
+    Yields a zip archive of (filename, chunks) entries as the chunks come
+    Entries are stored (documents are compressed before encryption already)
+    and always zip64, so their size needn't be known in advance. Memory stays
+    at one chunk whatever the size of the archive.
+    """
+    sink = ZipSink()
+    used = set()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for filename, chunks in entries:
+            info = zipfile.ZipInfo(unique_name(filename, used), date_time=date_time)
+            with archive.open(info, "w", force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield sink.take()
+            yield sink.take()
+    yield sink.take()
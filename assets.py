@@ -0,0 +1,138 @@
+"""
+Static assets and pages served from memory
+Assets are read once, get content-hashed URLs (style.<hash>.css) that are
+cached as immutable, and are compressed once with gzip (and brotli when the
+package is installed). Pages have no per-user server-side data, so they are
+rendered once and revalidated with strong ETags.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional: brotli variants are skipped without it
+    brotli = None
+
+# Hashed URLs change with the content, so they can be cached forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Other URLs are revalidated on every use (a 304 when unchanged)
+REVALIDATE = "no-cache"
+
+# Preferred first when the client accepts several with the same weight
+ENCODINGS = ("br", "gzip")
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Content codings of an Accept-Encoding header with their weights (q=0 refuses)"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        accepted[coding] = weight
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available) -> Optional[str]:
+    """Best encoding of `available` the client accepts (None: send as is)"""
+    accepted = accepted_encodings(accept_encoding)
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        weight = accepted.get(encoding, accepted.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison, as RFC 9110 requires)"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class Resource:
+    """Bytes served from memory, with precompressed variants and a strong ETag per variant"""
+    
+    def __init__(self, content: bytes, media_type: str):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.variants = {None: content}
+        
+        compressed = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(content, quality=11)
+        for encoding, data in compressed.items():
+            # Tiny files may not shrink
+            if len(data) < len(content):
+                self.variants[encoding] = data
+    
+    def etag(self, encoding: Optional[str]) -> str:
+        return f'"{self.digest[:32]}-{encoding}"' if encoding else f'"{self.digest[:32]}"'
+    
+    def response(self, request: Request, cache_control: str) -> Response:
+        """The variant the request accepts, or 304 if the client has it already"""
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""), self.variants)
+        headers = {"ETag": self.etag(encoding), "Cache-Control": cache_control}
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        
+        if etag_matches(request.headers.get("If-None-Match", ""), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+class AssetStore:
+    """
+    Files of a directory, each served under its own name (revalidated) and
+    under a name with a content hash (immutable): dashboard.js and
+    dashboard.<hash>.js. Templates link to the hashed names with url().
+    """
+    
+    def __init__(self, directory: str, url_prefix: str = "/static"):
+        self.url_prefix = url_prefix
+        self._files: Dict[str, Tuple[Resource, str]] = {}
+        self._urls: Dict[str, str] = {}
+        
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    content = f.read()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+                    media_type += "; charset=utf-8"
+                resource = Resource(content, media_type)
+                
+                stem, ext = os.path.splitext(relative)
+                hashed = f"{stem}.{resource.digest[:12]}{ext}"
+                self._files[relative] = (resource, REVALIDATE)
+                self._files[hashed] = (resource, IMMUTABLE)
+                self._urls[relative] = f"{url_prefix}/{hashed}"
+    
+    def url(self, name: str) -> str:
+        """Content-hashed URL of an asset (its plain URL if unknown)"""
+        return self._urls.get(name, f"{self.url_prefix}/{name}")
+    
+    def get(self, path: str) -> Optional[Tuple[Resource, str]]:
+        """(resource, Cache-Control) of a request path relative to the prefix"""
+        return self._files.get(path)
@@ -1,20 +1,48 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from models import User
+from cache import TTLCache
+from coordination import publish_user_change
+from executors import BoundedExecutor
+from metrics import span
 from config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
 
 
+class Principal(NamedTuple):
+    """Identity of an authenticated user (what request handlers need from User)"""
+    id: int
+    email: str
+    username: str
+
+
+# Principals by user id, so authenticated requests don't query the users table
+principal_cache = TTLCache(
+    max_size=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS
+)
+
+# bcrypt takes ~250 ms of CPU per call; it runs here instead of on the event loop
+password_executor = BoundedExecutor(
+    "password-hash",
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies if password matches hash"""
     # Truncate password to 72 bytes to avoid bcrypt limitation
     if len(plain_password.encode('utf-8')) > 72:
         plain_password = plain_password[:72]
-    return pwd_context.verify(plain_password, hashed_password)
+    with span("bcrypt"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
@@ -22,13 +50,23 @@ def get_password_hash(password: str) -> str:
     # Truncate password to 72 bytes to avoid bcrypt limitation
     if len(password.encode('utf-8')) > 72:
         password = password[:72]
-    return pwd_context.hash(password)
+    with span("bcrypt"):
+        return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifies a password on the password hashing pool"""
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Generates a password hash on the password hashing pool"""
+    return await password_executor.run(get_password_hash, password)
 
 
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     """Authenticates user with email and password"""
     user = db.query(User).filter(User.email == email).first()
-    print(user)
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
@@ -36,6 +74,27 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     return user
 
 
+async def authenticate_user_async(db: AsyncSession, email: str, password: str) -> Optional[User]:
+    """Authenticates user with email and password without blocking the event loop"""
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    # Give the connection back to the pool while waiting for bcrypt; the
+    # detached user keeps its loaded attributes
+    await db.close()
+    if not user:
+        return None
+    if not await verify_password_async(password, user.hashed_password):
+        return None
+    return user
+
+
+def token_claims(user: User) -> dict:
+    """Claims for a user's access token; identity claims are optional"""
+    claims = {"sub": str(user.id)}
+    if settings.TOKEN_IDENTITY_CLAIMS:
+        claims.update({"email": user.email, "username": user.username})
+    return claims
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a JWT token"""
     to_encode = data.copy()
@@ -49,17 +108,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def create_resume_token(user_id: int, document_id: int, etag: str, offset: int = 0) -> str:
+    """
+    Creates a token to resume a download without counting another view
+    `offset` is the first byte of the response it comes with: resumed ranges
+    must start after it. Its audience keeps it from being accepted as an
+    access token.
+    """
+    expire = datetime.utcnow() + timedelta(seconds=settings.DOWNLOAD_RESUME_WINDOW_SECONDS)
+    claims = {
+        "aud": "download-resume", "uid": user_id, "doc": document_id, "etag": etag, "off": offset, "exp": expire
+    }
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def decode_resume_token(token: str) -> Optional[dict]:
+    """Decodes and validates a resume token"""
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM], audience="download-resume"
+        )
+    except JWTError:
+        return None
+    # Tokens without an audience (access tokens) pass jwt.decode
+    if payload.get("aud") != "download-resume":
+        return None
+    return payload
+
+
 def decode_token(token: str) -> Optional[dict]:
     """Decodes and validates a JWT token"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        with span("jwt_decode"):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return payload
     except JWTError:
         return None
 
 
-def get_current_user(db: Session, token: str) -> Optional[User]:
-    """Gets current user from JWT token"""
+async def get_current_user(db: AsyncSession, token: str) -> Optional[Principal]:
+    """
+    Gets current user from JWT token
+    Identity claims in the token are used directly; otherwise the user is read
+    from the principal cache, and from the database only on a miss
+    """
     payload = decode_token(token)
     if payload is None:
         return None
@@ -67,7 +159,51 @@ def get_current_user(db: Session, token: str) -> Optional[User]:
     user_id = payload.get("sub")
     if user_id is None:
         return None
+    user_id = int(user_id)
     
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    return user
+    if settings.TOKEN_IDENTITY_CLAIMS and "email" in payload and "username" in payload:
+        return Principal(id=user_id, email=payload["email"], username=payload["username"])
+    
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    
+    with span("user_lookup"):
+        row = (await db.execute(
+            select(User.id, User.email, User.username).where(User.id == user_id)
+        )).first()
+    if row is None:
+        return None
+    
+    principal = Principal(id=row.id, email=row.email, username=row.username)
+    principal_cache.set(user_id, principal)
+    return principal
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drops a user from the principal cache (call when the user changes)"""
+    principal_cache.invalidate(user_id)
+
+
+# Invalidation hooks: users changed through the ORM are dropped from the
+# cache once the change is committed, and the change is published in the same
+# transaction for the other processes (coordination.run_invalidation_listener)
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _track_changed_user(mapper, connection, target):
+    publish_user_change(connection, target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_user_ids", None)
 
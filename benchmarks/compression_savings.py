@@ -0,0 +1,175 @@
+"""
+Benchmark: storage and bandwidth saved by compressing documents before encryption
+
+Encrypts a corpus of sample files with each codec/level (plus no compression)
+and reports the stored size, the bytes sent for a gzip-accepting download, and
+encrypt/decrypt throughput. Already-compressed formats are detected by their
+magic bytes and stored as they are, like uploads.
+
+The default corpus is generated (CSV, JSON logs, office XML, source text, and
+JPEG/ZIP/random binaries); pass --corpus to use a directory of real files.
+
+Usage:
+    python benchmarks/compression_savings.py
+    python benchmarks/compression_savings.py --corpus ~/Documents --levels 1 6 9
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from harness import setup_environment
+
+MB = 1024 * 1024
+
+
+def generate_corpus(scale: float) -> dict:
+    """Sample files of the kinds users send; sizes multiplied by scale"""
+    rng = random.Random(42)
+    size = lambda mb: int(mb * scale * MB)
+    corpus = {}
+    
+    names = ["acme", "globex", "initech", "umbrella", "hooli", "stark", "wayne", "wonka"]
+    statuses = ["paid", "pending", "refunded", "shipped"]
+    rows = ["id,date,customer,amount,status"]
+    length = 0
+    while length < size(4):
+        rows.append(
+            f"{len(rows)},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+            f"{rng.choice(names)},{rng.randint(1, 99999) / 100:.2f},{rng.choice(statuses)}"
+        )
+        length += len(rows[-1]) + 1
+    corpus["orders.csv"] = "\n".join(rows).encode()[:size(4)]
+    
+    levels = ["INFO", "INFO", "INFO", "WARNING", "ERROR"]
+    paths = ["/api/documents", "/api/me", "/api/login", "/api/documents/sent", "/dashboard"]
+    lines = []
+    length = 0
+    while length < size(4):
+        lines.append(
+            f'{{"ts": "2024-05-{rng.randint(1, 31):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:'
+            f'{rng.randint(0, 59):02d}Z", "level": "{rng.choice(levels)}", "path": "{rng.choice(paths)}", '
+            f'"status": {rng.choice([200, 200, 200, 404, 503])}, "ms": {rng.random() * 50:.3f}, '
+            f'"request_id": "{rng.getrandbits(64):016x}"}}'
+        )
+        length += len(lines[-1]) + 1
+    corpus["app.log"] = "\n".join(lines).encode()[:size(4)]
+    
+    cells = []
+    length = 0
+    while length < size(2):
+        cells.append(
+            f'<w:p><w:pPr><w:pStyle w:val="Normal"/></w:pPr><w:r><w:rPr><w:b/></w:rPr>'
+            f'<w:t xml:space="preserve">Clause {len(cells)}: {rng.choice(names)} agrees to '
+            f'{rng.choice(statuses)} terms</w:t></w:r></w:p>'
+        )
+        length += len(cells[-1])
+    corpus["contract.xml"] = ('<?xml version="1.0"?><w:document><w:body>' + "".join(cells)).encode()[:size(2)]
+    
+    # Real prose and code: this repository's sources and docs, repeated
+    text = b""
+    for directory, _, files in os.walk("."):
+        for name in sorted(files):
+            if name.endswith((".py", ".md", ".js", ".html", ".css")):
+                with open(os.path.join(directory, name), "rb") as f:
+                    text += f.read()
+    corpus["sources.txt"] = (text * (size(1) // max(len(text), 1) + 1))[:size(1)]
+    
+    corpus["photo.jpg"] = b"\xff\xd8\xff\xe0" + os.urandom(size(2) - 4)
+    corpus["archive.zip"] = b"PK\x03\x04" + os.urandom(size(2) - 4)
+    corpus["random.bin"] = os.urandom(size(2))
+    return corpus
+
+
+def load_corpus(directory: str) -> dict:
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def measure(encryptor, content: bytes, codec) -> dict:
+    """Encrypts and decrypts one file; returns sizes and timings"""
+    from compression import GzipEncoder, choose_codec
+    from encryption import iter_chunks
+    
+    codec = choose_codec(content, codec)
+    started = time.perf_counter()
+    blob = encryptor.encrypt_file(content, codec)
+    encrypt_seconds = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    assert encryptor.decrypt_file(blob) == content
+    decrypt_seconds = time.perf_counter() - started
+    
+    # Bytes on the wire for a client that accepts gzip (as the download endpoint decides)
+    sent = len(content)
+    if codec is not None and codec.name == "zlib" and len(blob) < len(content):
+        sent = sum(len(part) for part in encryptor.decrypt_stream(iter_chunks(blob), GzipEncoder()))
+    
+    return {"stored": len(blob), "sent": sent, "encrypt": encrypt_seconds, "decrypt": decrypt_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of files to use instead of the generated corpus")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size multiplier for the generated corpus")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9], help="zlib levels to compare")
+    parser.add_argument("--zstd-levels", type=int, nargs="+", default=[3, 10], help="zstd levels (needs zstandard)")
+    args = parser.parse_args()
+    
+    setup_environment()
+    
+    from compression import ZlibCodec, ZstdCodec, zstandard
+    from encryption import DocumentEncryption
+    from config import settings
+    
+    encryptor = DocumentEncryption(settings.ENCRYPTION_KEY)
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.scale)
+    if not corpus:
+        print("[ERROR] The corpus is empty")
+        sys.exit(1)
+    
+    configs = [("none", None)] + [(f"zlib-{level}", ZlibCodec(level)) for level in args.levels]
+    if zstandard is not None:
+        configs += [(f"zstd-{level}", ZstdCodec(level)) for level in args.zstd_levels]
+    else:
+        print("[*] zstandard is not installed: zstd levels skipped")
+    
+    total = sum(len(content) for content in corpus.values())
+    print(f"\n[*] {len(corpus)} files, {total / MB:.1f} MiB\n")
+    
+    results = {name: {file: measure(encryptor, content, codec) for file, content in corpus.items()}
+               for name, codec in configs}
+    
+    # Stored size per file, as a percentage of the original
+    width = max(len(file) for file in corpus) + 2
+    print(f"{'file':<{width}} {'size':>10}" + "".join(f" {name:>9}" for name, _ in configs))
+    print("-" * (width + 11 + 10 * len(configs)))
+    for file, content in corpus.items():
+        row = f"{file:<{width}} {len(content) / MB:>8.2f}Mi"
+        for name, _ in configs:
+            row += f" {results[name][file]['stored'] * 100 / max(len(content), 1):>8.1f}%"
+        print(row)
+    
+    print(f"\n{'codec':<10} {'stored':>10} {'saved':>8} {'sent':>10} {'saved':>8} {'enc MB/s':>10} {'dec MB/s':>10}")
+    print("-" * 72)
+    for name, _ in configs:
+        stored = sum(r["stored"] for r in results[name].values())
+        sent = sum(r["sent"] for r in results[name].values())
+        encrypt = sum(r["encrypt"] for r in results[name].values())
+        decrypt = sum(r["decrypt"] for r in results[name].values())
+        print(
+            f"{name:<10} {stored / MB:>8.2f}Mi {(1 - stored / total) * 100:>7.1f}% "
+            f"{sent / MB:>8.2f}Mi {(1 - sent / total) * 100:>7.1f}% "
+            f"{total / MB / encrypt:>10.0f} {total / MB / decrypt:>10.0f}"
+        )
+    print("\n[*] sent: bytes of a download by a client that accepts gzip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: throughput of concurrent uploads and downloads per crypto pool size
+
+Every client uploads a document and downloads it back, repeatedly, against a
+real uvicorn server. AES runs on the crypto pool (CRYPTO_WORKERS), so the
+aggregate throughput should grow with the number of workers up to the number
+of cores, while /api/me keeps answering quickly. Workers = 0 runs AES inline
+on the event loop, for comparison.
+
+Usage:
+    python benchmarks/crypto_throughput.py --workers 0 1 2 4 --clients 8 --size 8MB
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from harness import setup_environment, parse_size, percentile, free_port, start_server, stop_server
+
+
+async def transfer_loop(client, recipient_id, data, rounds):
+    """Uploads and downloads `data` `rounds` times; returns bytes moved"""
+    moved = 0
+    for _ in range(rounds):
+        response = await client.post(
+            "/api/documents/upload",
+            files={"file": ("bench.bin", data)},
+            data={"recipient_id": str(recipient_id)}
+        )
+        assert response.status_code == 200, response.text
+        document_id = response.json()["document_id"]
+        
+        response = await client.get(f"/api/documents/{document_id}/download")
+        assert response.status_code == 200 and len(response.content) == len(data), response.text
+        moved += 2 * len(data)
+    return moved
+
+
+async def probe_loop(client, stop, latencies):
+    """Times GET /api/me until `stop` is set"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/me")
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.text
+        await asyncio.sleep(0.01)
+
+
+async def run_clients(base_url, token, recipient_id, args):
+    import httpx
+    
+    data = os.urandom(parse_size(args.size))
+    cookies = {"access_token": token}
+    limits = httpx.Limits(max_connections=args.clients + 5)
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, limits=limits, timeout=600) as client:
+        stop = asyncio.Event()
+        latencies = []
+        probe = asyncio.create_task(probe_loop(client, stop, latencies))
+        
+        started = time.perf_counter()
+        moved = await asyncio.gather(*[
+            transfer_loop(client, recipient_id, data, args.rounds) for _ in range(args.clients)
+        ])
+        elapsed = time.perf_counter() - started
+        
+        stop.set()
+        await probe
+    
+    return sum(moved), elapsed, latencies
+
+
+def run_child(workers: int, args):
+    """Measures one pool size in this process and prints the result as JSON"""
+    setup_environment(CRYPTO_WORKERS=workers)
+    
+    from database import SessionLocal, init_db
+    from models import User
+    from auth import create_access_token
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@bench", username="sender", hashed_password="-")
+    recipient = User(email="recipient@bench", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.commit()
+    token = create_access_token(data={"sub": str(sender.id)})
+    recipient_id = recipient.id
+    db.close()
+    
+    import main as app_module
+    port = free_port()
+    server, thread = start_server(app_module.app, port)
+    try:
+        moved, elapsed, latencies = asyncio.run(
+            run_clients(f"http://127.0.0.1:{port}", token, recipient_id, args)
+        )
+    finally:
+        stop_server(server, thread)
+    
+    print(json.dumps({
+        "workers": workers,
+        "mb_per_second": moved / elapsed / (1024 * 1024),
+        "me_p99_ms": percentile(latencies, 0.99) if latencies else None,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="Crypto pool sizes to compare (0 = inline on the event loop)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--rounds", type=int, default=3, help="Upload + download rounds per client")
+    parser.add_argument("--size", default="8MB", help="Document size")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child is not None:
+        run_child(args.child, args)
+        return
+    
+    print(f"\n[*] {args.clients} clients x {args.rounds} rounds of {args.size} up + down, {os.cpu_count()} cores\n")
+    print(f"{'workers':>8} {'MB/s':>10} {'speedup':>8} {'/api/me p99 ms':>15}")
+    print("-" * 44)
+    
+    # Settings are read at import time, so every pool size runs in its own process
+    base = None
+    for workers in args.workers:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", str(workers),
+            "--clients", str(args.clients), "--rounds", str(args.rounds), "--size", args.size
+        ]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        base = base or result["mb_per_second"]
+        p99 = result["me_p99_ms"]
+        print(f"{workers:>8} {result['mb_per_second']:>10.1f} {result['mb_per_second'] / base:>7.2f}x "
+              f"{p99 if p99 is None else round(p99, 1):>15}")
+
+
+if __name__ == "__main__":
+    main()
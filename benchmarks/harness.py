@@ -0,0 +1,110 @@
+"""
+Helpers shared by the benchmarks: environment, sizes, seeding and a real uvicorn server
+(seed.py parses its size distributions with parse_distribution; keep this module
+free of application imports at load time)
+"""
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNITS = {"KB": 1024, "MB": 1024 * 1024, "GB": 1024 * 1024 * 1024}
+
+
+def setup_environment(**overrides) -> str:
+    """
+    Points the application at a temporary database and blob store
+    Must run before the app modules are imported; extra settings go in overrides
+    """
+    workdir = tempfile.mkdtemp(prefix="briefcase-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["BLOB_STORAGE_PATH"] = os.path.join(workdir, "blobs")
+    os.environ["REAPER_ENABLED"] = "false"
+    for name, value in overrides.items():
+        os.environ[name] = str(value)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    return workdir
+
+
+def parse_size(value: str) -> int:
+    """Parses sizes such as 512, 1KB or 100MB"""
+    value = value.strip().upper()
+    for unit, factor in UNITS.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(value)
+
+
+def parse_distribution(spec: str) -> List[Tuple[int, float]]:
+    """Parses a size distribution such as 4KB:60,256KB:30,4MB:10 into (size, weight) pairs"""
+    distribution = []
+    for item in spec.split(","):
+        size, _, weight = item.partition(":")
+        distribution.append((parse_size(size), float(weight or 1)))
+    return distribution
+
+
+def pick_size(distribution: List[Tuple[int, float]], rng: random.Random) -> int:
+    sizes, weights = zip(*distribution)
+    return rng.choices(sizes, weights)[0]
+
+
+def seed_users(count: int, hashed_password: str) -> List[int]:
+    """Inserts users user<n>@bench sharing one password hash (seed.py bulk inserts); returns their ids"""
+    from seed import insert_users
+    
+    return insert_users(count, [hashed_password], prefix="user", domain="bench")
+
+
+def seed_documents(db, user_ids: List[int], count: int, distribution, rng: random.Random) -> List[Tuple[int, int, int]]:
+    """
+    Inserts `count` documents between random users, sized after `distribution`,
+    without expiry or view limit (seed.py bulk inserts and shared blobs).
+    Returns (id, recipient id, size).
+    """
+    from sqlalchemy import select
+    from models import Document
+    from seed import document_rows, insert_rows, shared_contents
+    
+    contents = shared_contents(distribution, rng)
+    insert_rows(Document.__table__, document_rows(user_ids, count, contents, distribution, rng, lifecycle=False),
+                batch_size=10000, label="documents")
+    
+    return [
+        (row.id, row.recipient_id, row.plaintext_size)
+        for row in db.execute(select(Document.id, Document.recipient_id, Document.plaintext_size).order_by(Document.id))
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port):
+    """Starts uvicorn in a background thread and waits until it accepts requests"""
+    import uvicorn
+    
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def stop_server(server, thread):
+    server.should_exit = True
+    thread.join(timeout=10)
@@ -0,0 +1,97 @@
+"""
+Benchmark: GET /api/documents latency as the average document size grows
+
+The listing must only read metadata, so its latency should stay flat whether
+documents hold 1 KB or 100 MB of encrypted content. Rows are stored with inline
+encrypted_content (the worst case: legacy rows kept in the table).
+
+Usage:
+    python benchmarks/list_documents.py --documents 10 --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from harness import setup_environment, parse_size
+
+DEFAULT_SIZES = ["1KB", "100KB", "1MB", "10MB", "100MB"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="Average document sizes to test")
+    parser.add_argument("--documents", type=int, default=10, help="Documents per user and direction")
+    parser.add_argument("--requests", type=int, default=50, help="Timed list requests per size")
+    parser.add_argument("--max-ratio", type=float, default=3.0,
+                        help="Fail if the slowest median exceeds the fastest by this factor")
+    args = parser.parse_args()
+    
+    setup_environment()
+    
+    from fastapi.testclient import TestClient
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from auth import create_access_token
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@bench", username="sender", hashed_password="-")
+    recipient = User(email="recipient@bench", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.commit()
+    sender_id, recipient_id = sender.id, recipient.id
+    
+    import main as app_module
+    client = TestClient(app_module.app)
+    client.cookies.set("access_token", create_access_token(data={"sub": str(sender_id)}))
+    
+    print(f"\n[*] Listing {args.documents * 2} documents, {args.requests} requests per size\n")
+    print(f"{'size':>10} {'median ms':>10} {'p95 ms':>10}")
+    print("-" * 32)
+    
+    medians = []
+    block = os.urandom(1024 * 1024)
+    for label in args.sizes:
+        size = parse_size(label)
+        content = (block * (size // len(block) + 1))[:size]
+        
+        # Replace the documents with ones of the current size
+        db.query(Document).delete()
+        for i in range(args.documents):
+            db.add(Document(filename=f"sent-{i}.bin", encrypted_content=content,
+                            sender_id=sender_id, recipient_id=recipient_id))
+            db.add(Document(filename=f"received-{i}.bin", encrypted_content=content,
+                            sender_id=recipient_id, recipient_id=sender_id))
+        db.commit()
+        db.expunge_all()
+        del content
+        
+        client.get("/api/documents")  # Warm up
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get("/api/documents")
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+        
+        timings.sort()
+        median = statistics.median(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        medians.append(median)
+        print(f"{label:>10} {median:>10.2f} {p95:>10.2f}")
+    
+    db.close()
+    ratio = max(medians) / min(medians)
+    print("-" * 32)
+    print(f"[*] Slowest/fastest median ratio: {ratio:.2f} (max allowed {args.max_ratio})")
+    
+    if ratio > args.max_ratio:
+        print("[X] List latency grows with document size")
+        sys.exit(1)
+    print("[OK] List latency is independent of document size")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: GET /api/me latency while a storm of logins is in flight
+
+Each login runs bcrypt (~250 ms of CPU). Password hashing runs on a bounded
+pool, so other requests must keep their latency while logins queue up.
+Runs a real uvicorn server and measures /api/me p99 with and without
+`--logins` concurrent login loops.
+
+Usage:
+    python benchmarks/login_storm.py --logins 50 --requests 200
+    python benchmarks/login_storm.py --inline   # bcrypt on the event loop, for comparison
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from harness import setup_environment, percentile, free_port, start_server, stop_server
+
+PASSWORD = "password123"
+
+
+async def measure_me(client, token, count, interval):
+    """Latencies (ms) of `count` sequential GET /api/me requests"""
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get("/api/me", cookies={"access_token": token})
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.text
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def login_loop(client, email, stop, results):
+    """Logs in repeatedly until `stop` is set"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post("/api/login", json={"email": email, "password": PASSWORD})
+        results.append((response.status_code, (time.perf_counter() - started) * 1000))
+
+
+async def run(base_url, token, email, args):
+    import httpx
+    
+    limits = httpx.Limits(max_connections=args.logins + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await measure_me(client, token, 10, 0)
+        baseline = await measure_me(client, token, args.requests, args.interval)
+        
+        stop = asyncio.Event()
+        logins = []
+        storm = [asyncio.create_task(login_loop(client, email, stop, logins)) for _ in range(args.logins)]
+        # Let every login reach the server before measuring
+        await asyncio.sleep(0.5)
+        under_storm = await measure_me(client, token, args.requests, args.interval)
+        stop.set()
+        await asyncio.gather(*storm)
+    
+    return baseline, under_storm, logins
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50, help="Concurrent login loops")
+    parser.add_argument("--requests", type=int, default=200, help="Timed /api/me requests per phase")
+    parser.add_argument("--interval", type=float, default=0.01, help="Pause between /api/me requests (s)")
+    parser.add_argument("--inline", action="store_true", help="Run bcrypt on the event loop (no pool)")
+    parser.add_argument("--max-p99-ms", type=float, default=100.0,
+                        help="Fail if /api/me p99 under the storm exceeds this")
+    args = parser.parse_args()
+    
+    # Room for every login in the queue: this measures latency, not rejection
+    overrides = {"PASSWORD_HASH_MAX_QUEUE": args.logins}
+    if args.inline:
+        overrides["PASSWORD_HASH_WORKERS"] = 0
+    setup_environment(**overrides)
+    
+    from database import SessionLocal, init_db
+    from models import User
+    from auth import create_access_token, get_password_hash, password_executor
+    
+    init_db()
+    db = SessionLocal()
+    user = User(email="storm@bench", username="storm", hashed_password=get_password_hash(PASSWORD))
+    db.add(user)
+    db.commit()
+    token = create_access_token(data={"sub": str(user.id)})
+    email = user.email
+    db.close()
+    
+    import main as app_module
+    port = free_port()
+    server, thread = start_server(app_module.app, port)
+    
+    mode = "inline (event loop)" if args.inline else f"pool of {password_executor.max_workers} workers"
+    print(f"\n[*] {args.logins} concurrent logins, bcrypt {mode}, {args.requests} /api/me requests per phase\n")
+    
+    try:
+        baseline, under_storm, logins = asyncio.run(run(f"http://127.0.0.1:{port}", token, email, args))
+    finally:
+        stop_server(server, thread)
+    
+    print(f"{'phase':<14} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    print("-" * 47)
+    for label, values in (("idle", baseline), ("login storm", under_storm)):
+        print(f"{label:<14} {statistics.median(values):>10.1f} {percentile(values, 0.99):>10.1f} {max(values):>10.1f}")
+    
+    succeeded = [ms for code, ms in logins if code == 200]
+    rejected = sum(1 for code, _ in logins if code == 503)
+    print(f"\n[*] Logins: {len(succeeded)} succeeded, {rejected} rejected (503)")
+    if succeeded:
+        print(f"[*] Login p50 {statistics.median(succeeded):.0f} ms, p99 {percentile(succeeded, 0.99):.0f} ms")
+    stats = password_executor.stats()
+    print(f"[*] Password pool: max queued {stats['max_queued']}, completed {stats['completed']}, rejected {stats['rejected']}")
+    
+    p99 = percentile(under_storm, 0.99)
+    if p99 > args.max_p99_ms:
+        print(f"\n[!] /api/me p99 under the storm is {p99:.1f} ms (limit {args.max_p99_ms:.0f} ms)")
+        sys.exit(1)
+    print(f"\n[OK] /api/me p99 stays under {args.max_p99_ms:.0f} ms during the login storm")
+
+
+if __name__ == "__main__":
+    main()
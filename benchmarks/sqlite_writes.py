@@ -0,0 +1,137 @@
+"""
+Benchmark: SQLite write throughput with and without the tuning profile
+
+Writer threads repeat the application's write transactions (an upload insert,
+and a download's read-then-increment of view_count) while reader threads run
+listing queries. Runs once with SQLite defaults (SQLITE_TUNING=false) and once
+with the tuning profile (WAL, synchronous=NORMAL, busy_timeout, mmap, cache).
+
+Usage:
+    python benchmarks/sqlite_writes.py --writers 8 --readers 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from harness import setup_environment
+
+
+def run_child(tuned: bool, args):
+    """Measures one profile in this process and prints the result as JSON"""
+    setup_environment(SQLITE_TUNING=tuned, DB_POOL_SIZE=args.writers + args.readers)
+    
+    from sqlalchemy import update
+    from sqlalchemy.exc import OperationalError
+    from database import SessionLocal, init_db
+    from models import User, Document
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@bench", username="sender", hashed_password="-")
+    recipient = User(email="recipient@bench", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.flush()
+    documents = [Document(filename=f"doc-{i}.bin", sender_id=sender.id, recipient_id=recipient.id) for i in range(100)]
+    db.add_all(documents)
+    db.commit()
+    sender_id, recipient_id = sender.id, recipient.id
+    document_ids = [document.id for document in documents]
+    db.close()
+    
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    
+    def add(name):
+        with lock:
+            counts[name] += 1
+    
+    def writer(number):
+        session = SessionLocal()
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            try:
+                if i % 2:
+                    session.add(Document(filename=f"upload-{number}-{i}.bin",
+                                         sender_id=sender_id, recipient_id=recipient_id))
+                else:
+                    # A download: read the document, then count the view
+                    document_id = document_ids[i % len(document_ids)]
+                    session.get(Document, document_id)
+                    session.execute(
+                        update(Document)
+                        .where(Document.id == document_id)
+                        .values(view_count=Document.view_count + 1)
+                    )
+                session.commit()
+                add("writes")
+            except OperationalError:
+                session.rollback()
+                add("locked")
+        session.close()
+    
+    def reader():
+        session = SessionLocal()
+        while time.perf_counter() < deadline:
+            session.query(Document.id, Document.filename).filter(
+                Document.recipient_id == recipient_id,
+                Document.is_deleted == False
+            ).order_by(Document.created_at.desc()).limit(50).all()
+            session.rollback()
+            add("reads")
+        session.close()
+    
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    print(json.dumps({
+        "writes_per_second": counts["writes"] / elapsed,
+        "reads_per_second": counts["reads"] / elapsed,
+        "locked": counts["locked"],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8, help="Concurrent writer threads")
+    parser.add_argument("--readers", type=int, default=4, help="Concurrent reader threads")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration per profile")
+    parser.add_argument("--child", choices=["default", "tuned"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        run_child(args.child == "tuned", args)
+        return
+    
+    print(f"\n[*] {args.writers} writers, {args.readers} readers, {args.seconds:.0f}s per profile\n")
+    print(f"{'profile':<10} {'writes/s':>10} {'reads/s':>10} {'locked':>8}")
+    print("-" * 41)
+    
+    # Settings are read at import time, so every profile runs in its own process
+    results = {}
+    for profile in ("default", "tuned"):
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", profile,
+            "--writers", str(args.writers), "--readers", str(args.readers), "--seconds", str(args.seconds)
+        ]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = results[profile] = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:<10} {result['writes_per_second']:>10.0f} {result['reads_per_second']:>10.0f} {result['locked']:>8}")
+    
+    speedup = results["tuned"]["writes_per_second"] / max(results["default"]["writes_per_second"], 1e-9)
+    print(f"\n[*] Write throughput with the tuning profile: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Benchmark suite: login, list, upload and download throughput and latency, and AES MB/s
+
+Seeds `--users` users and `--documents` documents (sizes drawn from
+`--sizes`) into a temporary database with bulk inserts, then drives the real
+app in-process (ASGI transport) and over a uvicorn server with `--concurrency`
+concurrent clients, each mode in its own process. DocumentEncryption
+throughput is measured without the app.
+
+Results are written as JSON (`--output`) so runs on two commits can be diffed;
+`--compare` prints the change of every figure against an earlier result.
+Runs are reproducible for a given `--seed` (same users, documents and sizes).
+
+Usage:
+    python benchmarks/suite.py --users 50 --documents 1000 --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+    python benchmarks/suite.py --modes inprocess --sizes 4KB:60,256KB:30,4MB:10
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from harness import (
+    ROOT, setup_environment, parse_size, parse_distribution, pick_size, seed_users, seed_documents,
+    percentile, free_port, start_server, stop_server
+)
+
+PASSWORD = "password123"
+MB = 1024 * 1024
+
+
+def summarize(latencies, elapsed: float, moved: int) -> dict:
+    """Throughput and latency percentiles (ms) of one operation"""
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "mb_per_second": round(moved / elapsed / MB, 2),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p90_ms": round(percentile(latencies, 0.90), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+async def measure(requests: int, concurrency: int, call) -> dict:
+    """Runs call(i) for i in range(requests) on `concurrency` clients; call returns bytes moved"""
+    pending = iter(range(requests))
+    latencies = []
+    moved = 0
+    
+    async def client():
+        nonlocal moved
+        for i in pending:
+            started = time.perf_counter()
+            size = await call(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            moved += size
+    
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return summarize(latencies, time.perf_counter() - started, moved)
+
+
+async def run_operations(client, dataset, args) -> dict:
+    """Measures every API operation with one HTTP client"""
+    user_ids, documents, tokens, distribution = dataset
+    rng = random.Random(args.seed)
+    
+    def auth(user_id):
+        return {"Cookie": f"access_token={tokens[user_id]}"}
+    
+    async def login(i):
+        response = await client.post("/api/login", json={"email": f"user{i % len(user_ids)}@bench", "password": PASSWORD})
+        assert response.status_code == 200, response.text
+        return 0
+    
+    async def list_received(i):
+        response = await client.get("/api/documents/received", params={"limit": 50},
+                                    headers=auth(user_ids[i % len(user_ids)]))
+        assert response.status_code == 200, response.text
+        return 0
+    
+    payloads = {size: rng.randbytes(size) for size, _ in distribution}
+    upload_plan = [(pick_size(distribution, rng), *rng.sample(user_ids, 2)) for _ in range(args.requests)]
+    
+    async def upload(i):
+        size, sender_id, recipient_id = upload_plan[i]
+        response = await client.post(
+            "/api/documents/upload", headers=auth(sender_id),
+            files={"file": ("bench.bin", payloads[size])}, data={"recipient_id": str(recipient_id)}
+        )
+        assert response.status_code == 200, response.text
+        return size
+    
+    download_plan = [rng.choice(documents) for _ in range(args.requests)]
+    
+    async def download(i):
+        document_id, recipient_id, size = download_plan[i]
+        response = await client.get(f"/api/documents/{document_id}/download", headers=auth(recipient_id))
+        assert response.status_code == 200 and len(response.content) == size, response.status_code
+        return size
+    
+    return {
+        "login": await measure(args.logins, args.concurrency, login),
+        "list": await measure(args.requests, args.concurrency, list_received),
+        "upload": await measure(args.requests, args.concurrency, upload),
+        "download": await measure(args.requests, args.concurrency, download),
+    }
+
+
+async def run_inprocess(app, dataset, args) -> dict:
+    import httpx
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        return await run_operations(client, dataset, args)
+
+
+async def run_uvicorn(base_url, dataset, args) -> dict:
+    import httpx
+    
+    limits = httpx.Limits(max_connections=args.concurrency + 5)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        return await run_operations(client, dataset, args)
+
+
+def measure_crypto(size: int, rounds: int) -> dict:
+    """Best-of-`rounds` DocumentEncryption MB/s (AES-GCM frames, no compression)"""
+    from encryption import DocumentEncryption, iter_chunks
+    
+    encryption = DocumentEncryption(os.urandom(32))
+    data = os.urandom(size)
+    encrypt_times, decrypt_times = [], []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        encrypted = b"".join(encryption.encrypt_stream(iter_chunks(data, MB)))
+        encrypt_times.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        decrypted = b"".join(encryption.decrypt_stream(iter_chunks(encrypted, MB)))
+        decrypt_times.append(time.perf_counter() - started)
+        assert decrypted == data
+    
+    return {
+        "size": size,
+        "encrypt_mb_per_second": round(size / min(encrypt_times) / MB, 1),
+        "decrypt_mb_per_second": round(size / min(decrypt_times) / MB, 1),
+    }
+
+
+def environment() -> dict:
+    """What the figures depend on besides the code: commit, interpreter and machine"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Numeric figures of a result, keyed by their path (inprocess.upload.p99_ms)"""
+    figures = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            figures.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            figures[path] = value
+    return figures
+
+
+def print_comparison(baseline: dict, results: dict) -> None:
+    before = flatten({k: v for k, v in baseline.items() if k not in ("config", "environment")})
+    after = flatten({k: v for k, v in results.items() if k not in ("config", "environment")})
+    print(f"\n[*] Compared with {baseline['environment'].get('commit')}\n")
+    print(f"{'figure':<44} {'before':>12} {'after':>12} {'change':>9}")
+    print("-" * 80)
+    for path in sorted(before.keys() & after.keys()):
+        change = f"{(after[path] / before[path] - 1) * 100:+.1f}%" if before[path] else "-"
+        print(f"{path:<44} {before[path]:>12} {after[path]:>12} {change:>9}")
+
+
+def print_results(results: dict) -> None:
+    for mode in ("inprocess", "uvicorn"):
+        if mode not in results:
+            continue
+        print(f"\n[*] {mode}\n")
+        print(f"{'operation':<10} {'req/s':>10} {'MB/s':>10} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10}")
+        print("-" * 65)
+        for operation, figures in results[mode].items():
+            print(f"{operation:<10} {figures['requests_per_second']:>10} {figures['mb_per_second']:>10} "
+                  f"{figures['p50_ms']:>10} {figures['p90_ms']:>10} {figures['p99_ms']:>10}")
+    crypto = results["crypto"]
+    print(f"\n[*] DocumentEncryption on {crypto['size'] // MB} MB: "
+          f"encrypt {crypto['encrypt_mb_per_second']} MB/s, decrypt {crypto['decrypt_mb_per_second']} MB/s")
+
+
+def run_child(mode: str, args):
+    """Seeds a fresh database, measures one mode in this process and prints the result as JSON"""
+    # Room for every concurrent login in the password queue: this measures latency, not rejection
+    setup_environment(PASSWORD_HASH_MAX_QUEUE=max(100, args.concurrency))
+    
+    from database import SessionLocal, init_db
+    from auth import create_access_token, get_password_hash
+    import main as app_module
+    
+    init_db()
+    rng = random.Random(args.seed)
+    distribution = parse_distribution(args.sizes)
+    db = SessionLocal()
+    started = time.perf_counter()
+    user_ids = seed_users(args.users, get_password_hash(PASSWORD))
+    documents = seed_documents(db, user_ids, args.documents, distribution, rng)
+    seed_seconds = time.perf_counter() - started
+    db.close()
+    tokens = {user_id: create_access_token(data={"sub": str(user_id)}) for user_id in user_ids}
+    dataset = (user_ids, documents, tokens, distribution)
+    
+    if mode == "inprocess":
+        operations = asyncio.run(run_inprocess(app_module.app, dataset, args))
+    else:
+        port = free_port()
+        server, thread = start_server(app_module.app, port)
+        try:
+            operations = asyncio.run(run_uvicorn(f"http://127.0.0.1:{port}", dataset, args))
+        finally:
+            stop_server(server, thread)
+    
+    print(json.dumps({
+        "seed": {"users": len(user_ids), "documents": len(documents), "seconds": round(seed_seconds, 2)},
+        mode: operations,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="Users to seed")
+    parser.add_argument("--documents", type=int, default=1000, help="Documents to seed")
+    parser.add_argument("--sizes", default="4KB:60,256KB:30,4MB:10",
+                        help="Document size distribution (size:weight, comma separated)")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per operation")
+    parser.add_argument("--logins", type=int, default=32, help="Timed logins (bcrypt makes them slow)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--modes", nargs="+", choices=["inprocess", "uvicorn"], default=["inprocess", "uvicorn"],
+                        help="How to drive the app")
+    parser.add_argument("--crypto-size", default="64MB", help="Plaintext size of the AES benchmark")
+    parser.add_argument("--crypto-rounds", type=int, default=3, help="AES benchmark rounds (best is kept)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the dataset and the requests")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier JSON result to compare with")
+    parser.add_argument("--child", choices=["inprocess", "uvicorn"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        run_child(args.child, args)
+        return
+    # The environment setup changes directory
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+    
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "compare", "child")}
+    results = {"environment": environment(), "config": config}
+    
+    # Each mode seeds its own database in its own process (the async engine
+    # can't be shared between event loops); the seed makes the datasets identical
+    for mode in args.modes:
+        command = [sys.executable, os.path.abspath(__file__), "--child", mode] + [
+            f"--{name.replace('_', '-')}={value}" for name, value in config.items() if name != "modes"
+        ]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.update(json.loads(output.strip().splitlines()[-1]))
+    
+    setup_environment()
+    results["crypto"] = measure_crypto(parse_size(args.crypto_size), args.crypto_rounds)
+    
+    seed = results.get("seed")
+    if seed:
+        print(f"\n[*] Seeded {seed['users']} users and {seed['documents']} documents in {seed['seconds']} s")
+    print_results(results)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[OK] Results written to {args.output}")
+    else:
+        print("\n" + json.dumps(results, indent=2))
+    
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
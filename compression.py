@@ -0,0 +1,177 @@
+"""
+Compression applied to document frames before they are encrypted
+"""
+import struct
+import zlib
+from typing import Optional
+
+from config import settings
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for COMPRESSION_CODEC=zstd
+    zstandard = None
+
+
+class Codec:
+    """A compression codec; `id` is stored in the header of compressed streams"""
+    id = 0
+    name = ""
+    
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+    
+    def decompress(self, data: bytes, max_size: int) -> bytes:
+        """Decompresses a payload; fails if it expands beyond max_size (one frame)"""
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    """
+    Raw deflate, each payload ending with a sync flush instead of a final block:
+    payloads concatenate into one deflate stream (see GzipEncoder)
+    """
+    id = 1
+    name = "zlib"
+    
+    def __init__(self, level: int = 6):
+        self.level = level
+    
+    def compress(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    
+    def decompress(self, data: bytes, max_size: int) -> bytes:
+        decompressor = zlib.decompressobj(-15)
+        out = decompressor.decompress(data, max_size)
+        if decompressor.unconsumed_tail:
+            raise ValueError("Compressed frame expands beyond the frame size")
+        return out
+
+
+class ZstdCodec(Codec):
+    id = 2
+    name = "zstd"
+    
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the zstandard package")
+        self.level = level
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+    
+    def decompress(self, data: bytes, max_size: int) -> bytes:
+        if zstandard.frame_content_size(data) > max_size:
+            raise ValueError("Compressed frame expands beyond the frame size")
+        return self._decompressor.decompress(data, max_output_size=max_size)
+
+
+CODECS = {codec.name: codec for codec in (ZlibCodec, ZstdCodec)}
+CODEC_IDS = {codec.id: codec for codec in (ZlibCodec, ZstdCodec)}
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    """Creates a codec at the level configured in settings (None for no compression)"""
+    if name is None:
+        return None
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression codec: {name}")
+    levels = {"zlib": settings.COMPRESSION_ZLIB_LEVEL, "zstd": settings.COMPRESSION_ZSTD_LEVEL}
+    return CODECS[name](levels[name])
+
+
+def codec_by_id(codec_id: int) -> Codec:
+    """Codec of a compressed stream header (the level only matters when compressing)"""
+    if codec_id not in CODEC_IDS:
+        raise ValueError(f"Unknown compression codec id: {codec_id}")
+    return CODEC_IDS[codec_id]()
+
+
+def default_codec() -> Optional[Codec]:
+    """Codec for new documents, None when compression is disabled"""
+    if not settings.COMPRESSION_ENABLED:
+        return None
+    return get_codec(settings.COMPRESSION_CODEC)
+
+
+# A frame is stored compressed only if this saves at least 1/16 of its size
+def worth_compressing(compressed_size: int, size: int) -> bool:
+    return compressed_size < size - size // 16
+
+
+# Magic bytes of formats that are already compressed: compressing them again
+# only costs CPU
+COMPRESSED_SIGNATURES = (
+    b"\x1f\x8b",  # gzip
+    b"PK\x03\x04",  # zip, docx/xlsx/pptx, odt, jar, epub
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"\xfd7zXZ\x00",  # xz
+    b"BZh",  # bzip2
+    b"7z\xbc\xaf\x27\x1c",  # 7-zip
+    b"Rar!\x1a\x07",  # rar
+    b"\x89PNG\r\n\x1a\n",  # png
+    b"\xff\xd8\xff",  # jpeg
+    b"GIF8",  # gif
+    b"OggS",  # ogg
+    b"fLaC",  # flac
+    b"ID3",  # mp3
+    b"\x1a\x45\xdf\xa3",  # webm, mkv
+)
+
+# Bytes to read from the start of a file before choosing its codec
+SNIFF_SIZE = 16
+
+
+def is_compressed_format(head: bytes) -> bool:
+    """Sniffs the first bytes of a file for an already-compressed format"""
+    head = bytes(head[:SNIFF_SIZE])
+    if head[4:8] == b"ftyp":  # mp4, mov, heic
+        return True
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+    return head.startswith(COMPRESSED_SIGNATURES)
+
+
+def choose_codec(head: bytes, codec: Optional[Codec]) -> Optional[Codec]:
+    """Codec for a file starting with `head`: none for already-compressed formats"""
+    if codec is None or is_compressed_format(head):
+        return None
+    return codec
+
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"  # deflate, no mtime, unknown OS
+DEFLATE_END = b"\x03\x00"  # Empty final block
+
+
+class GzipEncoder:
+    """
+    Turns the frames of a zlib-compressed stream into one gzip stream without
+    recompressing: compressed payloads are sync-flushed deflate segments that
+    concatenate as they are, frames stored raw become stored deflate blocks
+    """
+    
+    def __init__(self):
+        self._crc = 0
+        self._size = 0
+        self._started = False
+    
+    def _start(self) -> bytes:
+        if self._started:
+            return b""
+        self._started = True
+        return GZIP_HEADER
+    
+    def segment(self, compressed: bool, payload: bytes, plaintext: bytes) -> bytes:
+        """Deflate data of one frame (`plaintext` only feeds the gzip checksum)"""
+        self._crc = zlib.crc32(plaintext, self._crc)
+        self._size += len(plaintext)
+        if not compressed:
+            stored = zlib.compressobj(0, zlib.DEFLATED, -15)
+            payload = stored.compress(plaintext) + stored.flush(zlib.Z_SYNC_FLUSH)
+        return self._start() + payload
+    
+    def finish(self) -> bytes:
+        return self._start() + DEFLATE_END + struct.pack("<II", self._crc, self._size & 0xFFFFFFFF)
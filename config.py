@@ -1,14 +1,116 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
+import os
 
 
 class Settings(BaseSettings):
     SECRET_KEY: str = "dev-secret-key-change-in-production"
     ENCRYPTION_KEY: str = "dev-encryption-key-change-this-32b"
+    # Envelope encryption: each document has a random data key, wrapped by a
+    # versioned master key. ENCRYPTION_KEY is version 0; later versions go in
+    # ENCRYPTION_KEYS (JSON: {"1": "..."}). New data keys are wrapped with
+    # ENCRYPTION_KEY_VERSION; keep older versions until rotate_keys.py has
+    # re-wrapped their data keys.
+    ENCRYPTION_KEYS: Dict[int, str] = {}
+    ENCRYPTION_KEY_VERSION: int = 0
     DATABASE_URL: str = "sqlite:///./briefcase.db"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     ALGORITHM: str = "HS256"
     
+    # Database connection pool (per engine and per process)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    
+    # SQLite tuning profile, applied to every connection (single-node deployments).
+    # WAL lets readers run alongside the writer; NORMAL sync is durable in WAL
+    # mode except for the last transactions on power loss.
+    SQLITE_TUNING: bool = True
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64000  # negative: KiB, so ~64 MB per connection
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    
+    # Authenticated-user cache
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 60
+    # Carry username/email in access tokens so requests need no user lookup.
+    # Identity changes then only show up in tokens issued after the change.
+    TOKEN_IDENTITY_CLAIMS: bool = False
+    
+    # Password hashing pool (bcrypt runs off the event loop).
+    # Logins beyond workers + max queue are rejected with 503.
+    PASSWORD_HASH_WORKERS: int = min(4, os.cpu_count() or 1)
+    PASSWORD_HASH_MAX_QUEUE: int = 100
+    
+    # Crypto pool: AES work on request paths runs here, off the event loop.
+    # Batch size is the plaintext handed to the pool per hop.
+    CRYPTO_WORKERS: int = os.cpu_count() or 1
+    CRYPTO_MAX_QUEUE: int = 256
+    CRYPTO_BATCH_SIZE: int = 1024 * 1024
+    
+    # Compress-then-encrypt (opt-in): frames are compressed before AES, except files
+    # in an already-compressed format (sniffed from their magic bytes). zstd needs
+    # the zstandard package; zlib documents can be downloaded gzip-encoded as stored.
+    # Off by default: the ciphertext length then reveals how compressible the
+    # plaintext is.
+    COMPRESSION_ENABLED: bool = False
+    COMPRESSION_CODEC: str = "zlib"
+    COMPRESSION_ZLIB_LEVEL: int = 1  # Level 6 saves ~3% more at 2.5x the CPU
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_GZIP_DOWNLOADS: bool = True
+    
+    # Encrypted blob storage
+    BLOB_STORAGE_BACKEND: str = "local"
+    BLOB_STORAGE_PATH: str = "./blobs"
+    
+    # Deduplication: an upload identical to a live document of the same sender
+    # reuses its blob instead of storing a new one. Content is matched by HMACs
+    # of the plaintext under DEDUP_KEY, so stored digests reveal nothing.
+    DEDUP_ENABLED: bool = False
+    DEDUP_KEY: str = "dev-dedup-key-change-in-production"
+    
+    # Recipients of one upload. Each gets their own document (view count, limit,
+    # expiry); the encrypted content is stored once and shared.
+    MAX_RECIPIENTS: int = 100
+    # Files of one batch upload, and documents of one zip download
+    MAX_BATCH_FILES: int = 100
+    
+    # Chunked uploads: plaintext bytes per chunk (rounded down to whole frames).
+    # Sessions idle for longer than the TTL are discarded by the reaper.
+    UPLOAD_CHUNK_SIZE: int = 4 * 1024 * 1024
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 3600
+    
+    # Resumable downloads: a resume token lets the same user continue a transfer
+    # for this long without counting another view. Content of deleted documents
+    # is kept at least as long, so a transfer can resume after the last view.
+    DOWNLOAD_RESUME_WINDOW_SECONDS: int = 900
+    
+    # Background reaper for expired / view-limit-reached documents
+    REAPER_ENABLED: bool = True
+    REAPER_INTERVAL_SECONDS: float = 60
+    REAPER_BATCH_SIZE: int = 500
+    # Only the process holding the reaper lease runs passes; it is renewed every
+    # interval, and taken over by another worker this long after its holder died
+    REAPER_LEASE_SECONDS: float = 180
+    
+    # Worker processes of the deployment (serve.py sets it). With more than one,
+    # each process polls the user changes made by the others to invalidate its
+    # principal cache.
+    WORKERS: int = 1
+    USER_INVALIDATION_POLL_SECONDS: float = 1
+    
+    # Prometheus metrics on /metrics: per-route latency, stage spans (auth, DB,
+    # crypto, streaming) and transfer counters. When off, instruments do nothing
+    # and no middleware or database hooks are installed. With a token, scrapes
+    # must send it as a bearer token.
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: Optional[str] = None
+    
     class Config:
         env_file = ".env"
 
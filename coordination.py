@@ -0,0 +1,100 @@
+"""
+State shared by the worker processes of a deployment, kept in the database
+Leases elect one process for singleton jobs (the reaper), and user changes are
+published as rows that every process polls to invalidate its principal cache.
+Upload sessions need nothing more: they already live in the database, and
+their chunks are claimed with conditional updates.
+"""
+import asyncio
+import os
+import secrets
+import socket
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from models import Lease, UserInvalidation
+
+# Rows older than this are never read again (listeners look a few seconds back)
+INVALIDATION_RETENTION_SECONDS = 600
+# Listeners re-read this far back, for changes committed after rows with later timestamps
+INVALIDATION_OVERLAP_SECONDS = 5
+
+_process_ids = {}
+
+
+def process_id() -> str:
+    """Identifies this process as a lease holder (computed after fork, so workers differ)"""
+    pid = os.getpid()
+    if pid not in _process_ids:
+        _process_ids[pid] = f"{socket.gethostname()}:{pid}:{secrets.token_hex(4)}"
+    return _process_ids[pid]
+
+
+def hold_lease(db: Session, name: str, holder: str, seconds: float) -> bool:
+    """
+    Takes or renews the lease `name` for `seconds`; False while another holder's
+    lease is unexpired. Holders must renew well before it expires.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=seconds)
+    renewed = db.execute(
+        update(Lease)
+        .where(Lease.name == name, or_(Lease.holder == holder, Lease.expires_at <= now))
+        .values(holder=holder, expires_at=expires_at)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        if renewed.rowcount == 0:
+            db.execute(insert(Lease).values(name=name, holder=holder, expires_at=expires_at))
+        db.commit()
+    except IntegrityError:
+        # Held by another process (or it inserted the lease first)
+        db.rollback()
+        return False
+    return True
+
+
+def release_lease(db: Session, name: str, holder: str) -> None:
+    """Gives up a lease, so another process takes it over without waiting for it to expire"""
+    db.execute(delete(Lease).where(Lease.name == name, Lease.holder == holder))
+    db.commit()
+
+
+def publish_user_change(connection, user_id: int) -> None:
+    """Records a user change on the connection of its transaction, so it is published on commit"""
+    connection.execute(insert(UserInvalidation).values(user_id=user_id, created_at=datetime.utcnow()))
+
+
+def purge_user_invalidations(db: Session, retention_seconds: float = INVALIDATION_RETENTION_SECONDS) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    result = db.execute(delete(UserInvalidation).where(UserInvalidation.created_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+
+async def run_invalidation_listener(invalidate: Callable[[int], None], interval: float):
+    """
+    Invalidates the users changed by any process, polling every `interval`
+    seconds until cancelled. Reads overlap, so a user may be invalidated twice.
+    """
+    since = datetime.utcnow()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            polled_at = datetime.utcnow()
+            async with AsyncSessionLocal() as db:
+                user_ids = set(await db.scalars(
+                    select(UserInvalidation.user_id).where(
+                        UserInvalidation.created_at >= since - timedelta(seconds=INVALIDATION_OVERLAP_SECONDS)
+                    )
+                ))
+            for user_id in user_ids:
+                invalidate(user_id)
+            since = polled_at
+        except Exception as e:
+            print(f"[!] User invalidation listener error: {e}")
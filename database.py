@@ -1,19 +1,163 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateColumn
 from config import settings
 from models import Base
+from metrics import instrument_engine
 
+# Drivers per backend: (sync, async). psycopg 3 serves both for Postgres.
+DRIVERS = {
+    "sqlite": ("sqlite", "sqlite+aiosqlite"),
+    "postgresql": ("postgresql+psycopg", "postgresql+psycopg"),
+}
+
+
+def database_url(url: str, use_async: bool) -> URL:
+    """DATABASE_URL with the sync or async driver of its backend"""
+    url = make_url(url.replace("postgres://", "postgresql://", 1))
+    drivers = DRIVERS.get(url.get_backend_name())
+    if drivers is None:
+        return url
+    return url.set(drivername=drivers[1] if use_async else drivers[0])
+
+
+def engine_options(url: URL) -> dict:
+    """Connection pool settings; SQLite in-memory databases use a single connection"""
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+# Sync engine: schema management, reaper and command-line scripts
+sync_url = database_url(settings.DATABASE_URL, use_async=False)
 engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Only for SQLite
+    sync_url,
+    connect_args={"check_same_thread": False} if sync_url.get_backend_name() == "sqlite" else {},
+    **engine_options(sync_url)
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: request handlers
+async_url = database_url(settings.DATABASE_URL, use_async=True)
+async_options = engine_options(async_url)
+if async_options:
+    # aiosqlite would default to opening a connection per checkout (NullPool)
+    async_options["poolclass"] = AsyncAdaptedQueuePool
+async_engine = create_async_engine(async_url, **async_options)
+
+# Objects stay loaded after commit: lazy loads are not possible in async code
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+def sqlite_pragmas() -> dict:
+    """PRAGMAs of the SQLite tuning profile (empty when the profile is off)"""
+    if not settings.SQLITE_TUNING:
+        return {}
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applies the tuning profile to every new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+if sync_url.get_backend_name() == "sqlite":
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "connect", _apply_sqlite_pragmas)
+
+# Statement timings for /metrics
+if settings.METRICS_ENABLED:
+    for target in (engine, async_engine.sync_engine):
+        instrument_engine(target)
+
 
 def init_db():
     """Initializes database by creating all tables"""
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+
+def upgrade_schema():
+    """
+    Brings tables created by older versions up to date with the models
+    Only additive changes: missing nullable columns, relaxed NOT NULL constraints
+    and missing indexes.
+    On SQLite, tables whose column order differs from the model are rebuilt so
+    large columns stay at the end of each row.
+    """
+    for table in Base.metadata.sorted_tables:
+        inspector = inspect(engine)
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+        
+        relaxed = [
+            column for column in table.columns
+            if column.nullable and column.name in existing and not existing[column.name]["nullable"]
+        ]
+        
+        if engine.dialect.name == "sqlite":
+            current_order = [column["name"] for column in inspect(engine).get_columns(table.name)]
+            if relaxed or current_order != [column.name for column in table.columns]:
+                _rebuild_sqlite_table(table)
+        elif relaxed:
+            with engine.begin() as conn:
+                for column in relaxed:
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL")
+        
+        # Indexes added by newer versions
+        with engine.begin() as conn:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _rebuild_sqlite_table(table):
+    """Recreates a table from its model (SQLite cannot alter or reorder columns)"""
+    old_name = f"_{table.name}_old"
+    column_names = ", ".join(column.name for column in table.columns)
+    
+    with engine.begin() as conn:
+        for index in inspect(conn).get_indexes(table.name):
+            conn.exec_driver_sql(f"DROP INDEX {index['name']}")
+        conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old_name}")
+        table.create(conn)
+        conn.exec_driver_sql(
+            f"INSERT INTO {table.name} ({column_names}) SELECT {column_names} FROM {old_name}"
+        )
+        conn.exec_driver_sql(f"DROP TABLE {old_name}")
 
 
 def get_db():
@@ -24,3 +168,8 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """Dependency to get an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,90 @@
+"""
+Deduplication of uploads: keyed digests of the plaintext, scoped to a sender
+"""
+import hashlib
+import hmac
+import struct
+import threading
+from typing import Iterable
+
+from config import settings
+
+
+def piece_hasher() -> "hmac.HMAC":
+    """Keyed hash of one piece of plaintext (an upload chunk), fed incrementally"""
+    return hmac.new(settings.DEDUP_KEY.encode(), digestmod=hashlib.sha256)
+
+
+def content_digest(sender_id: int, piece_size: int, pieces: Iterable[bytes]) -> str:
+    """
+    Digest of a sender's upload from the digests of its pieces, in order
+    The sender is part of the message, so equal files of different senders
+    get unrelated digests.
+    """
+    mac = hmac.new(settings.DEDUP_KEY.encode(), struct.pack(">QQ", sender_id, piece_size), hashlib.sha256)
+    for digest in pieces:
+        mac.update(digest)
+    return mac.hexdigest()
+
+
+class ContentHasher:
+    """
+    Computes content_digest() as the plaintext streams in
+    The content is hashed in pieces of `piece_size` bytes (the upload chunk
+    size), so a file gets the same digest whether it was sent in one request
+    or in chunks.
+    """
+    
+    def __init__(self, sender_id: int, piece_size: int):
+        self._sender_id = sender_id
+        self._piece_size = piece_size
+        self._pieces = []
+        self._piece = piece_hasher()
+        self._filled = 0
+    
+    def update(self, data: bytes) -> None:
+        view = memoryview(data)
+        while len(view):
+            # A full piece is closed once more data arrives, so the last one stays open
+            if self._filled == self._piece_size:
+                self._pieces.append(self._piece.digest())
+                self._piece = piece_hasher()
+                self._filled = 0
+            take = min(len(view), self._piece_size - self._filled)
+            self._piece.update(view[:take])
+            self._filled += take
+            view = view[take:]
+        view.release()
+    
+    def hexdigest(self) -> str:
+        # The last piece may be short; an empty file is one empty piece
+        return content_digest(self._sender_id, self._piece_size, self._pieces + [self._piece.digest()])
+
+
+class DedupStats:
+    """Thread-safe counters of deduplicated uploads (per process)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.deduplicated = 0
+        self.bytes_uploaded = 0  # Encrypted bytes of every upload
+        self.bytes_saved = 0  # Encrypted bytes not stored thanks to an existing blob
+    
+    def record(self, size: int, deduplicated: bool) -> None:
+        with self._lock:
+            self.uploads += 1
+            self.bytes_uploaded += size
+            if deduplicated:
+                self.deduplicated += 1
+                self.bytes_saved += size
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "deduplicated": self.deduplicated,
+                "dedup_ratio": self.deduplicated / self.uploads if self.uploads else 0.0,
+                "bytes_uploaded": self.bytes_uploaded,
+                "bytes_saved": self.bytes_saved,
+            }
@@ -0,0 +1,47 @@
+"""
+Helpers shared by the verification scripts: environment, authenticated clients
+and Prometheus samples
+"""
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def setup_environment(name: str, **overrides) -> str:
+    """
+    Points the application at a temporary database and blob store
+    Must run before the app modules are imported; extra settings go in overrides
+    """
+    workdir = tempfile.mkdtemp(prefix=f"briefcase-{name}-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, f'{name}.db')}"
+    os.environ["BLOB_STORAGE_PATH"] = os.path.join(workdir, "blobs")
+    os.environ["REAPER_ENABLED"] = "false"
+    for setting, value in overrides.items():
+        os.environ[setting] = str(value)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    return workdir
+
+
+def client(app, user_id: int, **options):
+    """A TestClient of app signed in as user_id (options go to TestClient)"""
+    from fastapi.testclient import TestClient
+    from auth import create_access_token
+    
+    test_client = TestClient(app, **options)
+    test_client.cookies.set("access_token", create_access_token(data={"sub": str(user_id)}))
+    return test_client
+
+
+def sample(text, name, **labels):
+    """Value of a sample of the exposition, or None"""
+    for line in text.splitlines():
+        if not line.startswith(name + "{") and not line.startswith(name + " "):
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', line.split(" ")[0]))
+        if line.split("{")[0].split(" ")[0] == name and all(found.get(k) == v for k, v in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    return None
@@ -0,0 +1,141 @@
+"""
+Bulk upload and zip download verification for Briefcase
+Uploads several files in one request and checks they are committed together
+(or not at all), then downloads received documents as a zip and checks the
+entries, the views counted for each of them (none when the server is too
+busy to serve the zip), and that the archive streams in bounded pieces.
+"""
+
+import io
+import os
+import sys
+import zipfile
+
+from harness import client, setup_environment
+
+
+def main():
+    setup_environment("bulk")
+
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from archive import stream_zip
+    import main as app_module
+
+    print("BULK UPLOAD AND DOWNLOAD VERIFICATION")
+    print("=" * 60)
+
+    init_db()
+    db = SessionLocal()
+    users = [User(email=f"{name}@bulk", username=name, hashed_password="-") for name in ("alice", "bob", "carol")]
+    db.add_all(users)
+    db.commit()
+    alice_id, bob_id, carol_id = [user.id for user in users]
+
+    alice, bob, carol = [client(app_module.app, user_id) for user_id in (alice_id, bob_id, carol_id)]
+
+    def document_count():
+        db.expire_all()
+        return db.query(Document).count()
+
+    def stored_blobs():
+        blob_store = app_module.blob_store
+        return sum(
+            len(files) for directory, _, files in os.walk(blob_store.root)
+            if not directory.startswith((blob_store.tmp_dir, blob_store.uploads_dir))
+        )
+
+    results = []
+
+    contents = {"a.txt": b"alpha " * 20000, "b.bin": os.urandom(300_000), "dir/a.txt": b"other file"}
+    response = alice.post(
+        "/api/documents/upload/batch",
+        files=[("files", (name, content)) for name, content in contents.items()],
+        data={"recipient_ids": [str(bob_id), str(carol_id)], "view_limit": "2"}
+    )
+    uploads = response.json()["uploads"]
+    results.append(("one request, every file and recipient", response.status_code == 200
+                    and len(uploads) == 3 and all(len(u["document_ids"]) == 2 for u in uploads)
+                    and document_count() == 6))
+
+    # A failure on any file delivers none of them
+    store_upload = app_module.store_upload
+    calls = []
+
+    async def failing_store_upload(file, sender_id):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError("storage failure")
+        return await store_upload(file, sender_id)
+
+    blobs = stored_blobs()
+    app_module.store_upload = failing_store_upload
+    try:
+        failed = client(app_module.app, alice_id, raise_server_exceptions=False)
+        response = failed.post(
+            "/api/documents/upload/batch",
+            files=[("files", (f"f{i}.bin", os.urandom(1000))) for i in range(4)],
+            data={"recipient_id": str(bob_id)}
+        )
+    finally:
+        app_module.store_upload = store_upload
+    results.append(("failed batch delivers nothing", response.status_code == 500
+                    and document_count() == 6 and stored_blobs() == blobs))
+
+    # Zip of bob's documents, plus one he didn't receive
+    bob_ids = [u["document_ids"][0] for u in uploads]
+    carol_only = uploads[0]["document_ids"][1]
+
+    # A saturated crypto pool refuses the zip before any view is counted
+    max_queue = app_module.crypto_executor.max_queue
+    app_module.crypto_executor.max_queue = 0
+    try:
+        busy = bob.get("/api/documents/archive", params={"ids": bob_ids})
+    finally:
+        app_module.crypto_executor.max_queue = max_queue
+    db.expire_all()
+    results.append(("busy server counts no view", busy.status_code == 503
+                    and all(db.get(Document, document_id).view_count == 0 for document_id in bob_ids)))
+
+    response = bob.get("/api/documents/archive", params={"ids": bob_ids + [carol_only]})
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    results.append(("zip entries", response.status_code == 200
+                    and archive.namelist() == ["a.txt", "b.bin", "a (2).txt"]
+                    and [archive.read(name) for name in archive.namelist()] == list(contents.values())))
+    results.append(("skipped documents reported", response.headers.get("x-skipped-documents") == str(carol_only)))
+
+    db.expire_all()
+    views = [db.get(Document, document_id).view_count for document_id in bob_ids + [carol_only]]
+    results.append(("one view counted per entry", views == [1, 1, 1, 0]))
+
+    # The second zip reaches the view limit of 2 and deletes the documents
+    bob.get("/api/documents/archive", params={"ids": bob_ids})
+    third = bob.get("/api/documents/archive", params={"ids": bob_ids})
+    db.expire_all()
+    results.append(("view limit applies to zip entries", third.status_code == 404
+                    and all(db.get(Document, document_id).is_deleted for document_id in bob_ids)))
+
+    # Carol's documents are unaffected by bob's views
+    response = carol.get("/api/documents/archive", params={"ids": [u["document_ids"][1] for u in uploads]})
+    results.append(("recipients counted separately", len(zipfile.ZipFile(io.BytesIO(response.content)).namelist()) == 3))
+
+    # Archives stream in pieces no larger than the chunks fed in
+    chunk = b"x" * (1024 * 1024)
+    pieces = stream_zip(("big.bin", (chunk for _ in range(64))) for _ in range(2))
+    largest = max(len(piece) for piece in pieces)
+    results.append(("constant memory streaming", largest <= len(chunk) + 1024))
+
+    db.close()
+
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Bulk upload and download behave as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
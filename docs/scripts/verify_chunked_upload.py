@@ -0,0 +1,177 @@
+# verify_chunked_upload.py
+"""
+Chunked upload verification for Briefcase
+Sends files through upload sessions with chunks in parallel, out of order and
+retried, then checks the assembled documents byte for byte, the errors for
+bad chunks, cancellation, and the reaper's cleanup of stale sessions.
+"""
+
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from harness import setup_environment
+
+CHUNK_SIZE = 128 * 1024  # Two 64 KiB frames, so small files span many chunks
+
+
+async def start(client, recipient_id, filename, size, **fields):
+    response = await client.post("/api/uploads", json={
+        "filename": filename, "recipient_id": recipient_id, "size": size, **fields
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def put_chunk(client, upload, content, index):
+    start = index * upload["chunk_size"]
+    return await client.put(
+        f"/api/uploads/{upload['upload_id']}/chunks/{index}",
+        content=content[start:start + upload["chunk_size"]]
+    )
+
+
+async def send_file(client, recipient_id, filename, content, **fields):
+    """Uploads all chunks concurrently, in random order, one of them twice"""
+    upload = await start(client, recipient_id, filename, len(content), **fields)
+    indexes = list(range(upload["chunk_count"])) + [upload["chunk_count"] // 2]
+    random.shuffle(indexes)
+    responses = await asyncio.gather(*[put_chunk(client, upload, content, i) for i in indexes])
+    assert all(r.status_code == 200 for r in responses), [r.text for r in responses]
+    response = await client.post(f"/api/uploads/{upload['upload_id']}/complete")
+    return upload, response
+
+
+async def exercise(sender_id, recipient_id):
+    """Runs the chunked upload flow; returns a list of (check, passed)"""
+    import httpx
+    import main
+    from auth import create_access_token
+    
+    results = []
+    staged = main.blob_store.uploads_dir
+    alice = httpx.AsyncClient(app=main.app, base_url="http://briefcase",
+                              cookies={"access_token": create_access_token(data={"sub": str(sender_id)})})
+    bob = httpx.AsyncClient(app=main.app, base_url="http://briefcase",
+                            cookies={"access_token": create_access_token(data={"sub": str(recipient_id)})})
+    
+    async with alice, bob:
+        for size in [0, 1, CHUNK_SIZE, 5 * CHUNK_SIZE + 12345]:
+            content = os.urandom(size)
+            upload, response = await send_file(alice, recipient_id, f"file-{size}.bin", content, view_limit=3)
+            document_id = response.json().get("document_id")
+            download = await bob.get(f"/api/documents/{document_id}/download")
+            results.append((f"{size} bytes in {upload['chunk_count']} chunks",
+                            response.status_code == 200 and download.content == content
+                            and download.headers.get("content-length") == str(size)))
+        results.append(("staged parts removed", os.listdir(staged) == []))
+        
+        tail = await bob.get(f"/api/documents/{document_id}/download", headers={
+            "Range": f"bytes={size - 100}-", "X-Resume-Token": download.headers["x-resume-token"]
+        })
+        results.append(("range of an assembled document", tail.content == content[-100:]))
+        
+        # Incomplete, invalid and foreign chunks
+        content = os.urandom(3 * CHUNK_SIZE)
+        upload = await start(alice, recipient_id, "partial.bin", len(content))
+        url = f"/api/uploads/{upload['upload_id']}"
+        await put_chunk(alice, upload, content, 0)
+        await put_chunk(alice, upload, content, 2)
+        early = await alice.post(f"{url}/complete")
+        status = (await alice.get(url)).json()
+        results.append(("complete waits for every chunk", early.status_code == 409 and status["received"] == [0, 2]))
+        
+        short = await alice.put(f"{url}/chunks/1", content=content[:10])
+        long = await alice.put(f"{url}/chunks/1", content=content[:CHUNK_SIZE + 1])
+        outside = await alice.put(f"{url}/chunks/3", content=b"x")
+        results.append(("chunk size and index checked",
+                        (short.status_code, long.status_code, outside.status_code) == (400, 413, 400)))
+        
+        foreign = await bob.put(f"{url}/chunks/1", content=content[CHUNK_SIZE:2 * CHUNK_SIZE])
+        results.append(("upload bound to its sender", foreign.status_code == 404))
+        
+        # Resume: fetch the state and send what is missing
+        for index in set(range(status["chunk_count"])) - set(status["received"]):
+            await put_chunk(alice, upload, content, index)
+        done = await alice.post(f"{url}/complete")
+        again = await alice.post(f"{url}/complete")
+        download = await bob.get(f"/api/documents/{done.json()['document_id']}/download")
+        results.append(("resumed upload", download.content == content and again.status_code == 404))
+        
+        # Cancellation
+        upload = await start(alice, recipient_id, "cancelled.bin", len(content))
+        await put_chunk(alice, upload, content, 0)
+        cancelled = await alice.delete(f"/api/uploads/{upload['upload_id']}")
+        gone = await alice.get(f"/api/uploads/{upload['upload_id']}")
+        results.append(("cancelled upload", cancelled.status_code == 200 and gone.status_code == 404
+                        and os.listdir(staged) == []))
+        
+        stale = await start(alice, recipient_id, "stale.bin", len(content))
+        await put_chunk(alice, stale, content, 0)
+    
+    return results, stale["upload_id"], main.blob_store
+
+
+def reap_stale(upload_id, blob_store):
+    """Backdates a session, leaves an orphan part and checks that the reaper removes both"""
+    from database import SessionLocal
+    from models import UploadSession, UploadChunk
+    from reaper import reap_once
+    
+    db = SessionLocal()
+    db.query(UploadSession).filter(UploadSession.id == upload_id).update(
+        {"updated_at": datetime.utcnow() - timedelta(hours=2)}
+    )
+    db.commit()
+    
+    orphan = "orphan-upload-0000000000"
+    with blob_store.part_writer(orphan, 0) as writer:
+        writer.write(b"left behind by a crash")
+        writer.commit()
+    
+    _, _, discarded = reap_once(blob_store, batch_size=100, upload_ttl=3600)
+    passed = (
+        discarded == 1
+        and db.query(UploadSession).count() == 0
+        and db.query(UploadChunk).count() == 0
+        and blob_store.staged_uploads() == []
+    )
+    db.close()
+    return passed
+
+
+def main():
+    setup_environment("chunks", UPLOAD_CHUNK_SIZE=CHUNK_SIZE, CRYPTO_BATCH_SIZE=64 * 1024)
+    
+    from database import SessionLocal, init_db
+    from models import User
+    
+    print("CHUNKED UPLOAD VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@chunks", username="sender", hashed_password="-")
+    recipient = User(email="recipient@chunks", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.commit()
+    sender_id, recipient_id = sender.id, recipient.id
+    db.close()
+    
+    results, stale, blob_store = asyncio.run(exercise(sender_id, recipient_id))
+    results.append(("reaper discards stale uploads", reap_stale(stale, blob_store)))
+    
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+    
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Chunked uploads behave as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# verify_compression.py
+"""
+Compression verification for Briefcase
+Uploads compressible and already-compressed files (in one request and in
+chunks) and checks what is stored, gzip-encoded and identity downloads, and
+byte ranges of compressed documents.
+"""
+
+import gzip
+import os
+import sys
+
+from harness import client, setup_environment
+
+
+def sample_csv(size: int) -> bytes:
+    rows = [f"{i},2024-01-{i % 28 + 1:02d},customer-{i % 97},{i * 7 % 1000}.00,paid" for i in range(size // 20)]
+    return "\n".join(rows).encode()[:size]
+
+
+def main():
+    setup_environment("compression", COMPRESSION_ENABLED="true", COMPRESSION_CODEC="zlib", UPLOAD_CHUNK_SIZE=128 * 1024)
+    
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from encryption import DocumentEncryption
+    import main as app_module
+    
+    print("COMPRESSION VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@compression", username="sender", hashed_password="-")
+    recipient = User(email="recipient@compression", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.commit()
+    recipient_id = recipient.id
+    
+    alice, bob = client(app_module.app, sender.id), client(app_module.app, recipient_id)
+    
+    def upload(filename, content):
+        response = alice.post(
+            "/api/documents/upload",
+            files={"file": (filename, content)},
+            data={"recipient_id": str(recipient_id)}
+        )
+        return db.get(Document, response.json()["document_id"])
+    
+    results = []
+    
+    content = sample_csv(1_000_000)
+    document = upload("orders.csv", content)
+    results.append(("compressible file stored compressed",
+                    document.compression == "zlib" and document.blob_size < len(content) // 2))
+    url = f"/api/documents/{document.id}/download"
+    
+    encoded = bob.get(url, headers={"Accept-Encoding": "gzip"})
+    results.append(("gzip download", encoded.headers.get("content-encoding") == "gzip"
+                    and encoded.content == content
+                    and encoded.num_bytes_downloaded < len(content) // 2
+                    and encoded.headers["etag"].endswith('-gzip"')
+                    and encoded.headers["vary"] == "Accept-Encoding"))
+    
+    # The gzip stream is valid on its own, not just for httpx
+    with bob.stream("GET", url, headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    results.append(("gzip stream decodes with the gzip module", gzip.decompress(raw) == content))
+    
+    identity = bob.get(url, headers={"Accept-Encoding": "identity"})
+    results.append(("identity download", "content-encoding" not in identity.headers
+                     and identity.content == content
+                     and identity.headers["content-length"] == str(len(content))))
+    
+    refused = bob.get(url, headers={"Accept-Encoding": "gzip;q=0"})
+    results.append(("gzip refused with q=0", "content-encoding" not in refused.headers))
+    
+    # Ranges read compressed frames, skipping the ones before by their length
+    opened = []
+    open_frame = DocumentEncryption.open_frame
+    DocumentEncryption.open_frame = lambda *args, **kwargs: opened.append(1) or open_frame(*args, **kwargs)
+    ranged = bob.get(url, headers={"Range": "bytes=500000-500099", "Accept-Encoding": "gzip"})
+    DocumentEncryption.open_frame = open_frame
+    results.append(("range of a compressed document", ranged.status_code == 206
+                    and ranged.content == content[500000:500100]
+                    and "content-encoding" not in ranged.headers and len(opened) == 1))
+    
+    png = b"\x89PNG\r\n\x1a\n" + bytes(300_000)
+    document = upload("image.png", png)
+    download = bob.get(f"/api/documents/{document.id}/download")
+    results.append(("already-compressed format stored as is",
+                    document.compression is None and download.content == png))
+    
+    random_bytes = os.urandom(300_000)
+    document = upload("random.bin", random_bytes)
+    download = bob.get(f"/api/documents/{document.id}/download", headers={"Accept-Encoding": "gzip"})
+    results.append(("incompressible frames stored raw",
+                    document.blob_size < len(random_bytes) + 1000
+                    and "content-encoding" not in download.headers and download.content == random_bytes))
+    
+    # Chunked uploads compress each chunk where it is sealed
+    content = sample_csv(700_000)
+    upload_session = alice.post("/api/uploads", json={
+        "filename": "chunked.csv", "recipient_id": recipient_id, "size": len(content)
+    }).json()
+    chunk_size = upload_session["chunk_size"]
+    for index in reversed(range(upload_session["chunk_count"])):
+        alice.put(f"/api/uploads/{upload_session['upload_id']}/chunks/{index}",
+                  content=content[index * chunk_size:(index + 1) * chunk_size])
+    completed = alice.post(f"/api/uploads/{upload_session['upload_id']}/complete").json()
+    document = db.get(Document, completed["document_id"])
+    download = bob.get(f"/api/documents/{document.id}/download", headers={"Accept-Encoding": "gzip"})
+    results.append(("chunked upload stored compressed",
+                    document.compression == "zlib" and document.blob_size < len(content) // 2
+                    and download.content == content))
+    
+    db.close()
+    
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+    
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Compression behaves as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
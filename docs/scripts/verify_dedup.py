@@ -0,0 +1,125 @@
+"""
+Deduplication verification for Briefcase
+Uploads identical files (in one request and in chunks) and checks that a
+sender's duplicates reuse one blob, that other senders' files are never
+matched, that the blob is collected with its last document, and that the
+dedup counters add up.
+"""
+
+import hashlib
+import os
+import sys
+from datetime import datetime, timedelta
+
+from harness import client, sample, setup_environment
+
+
+def main():
+    setup_environment("dedup", DEDUP_ENABLED="true", UPLOAD_CHUNK_SIZE=128 * 1024, METRICS_ENABLED="true")
+
+    from sqlalchemy import update
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from reaper import reap_once
+    import main as app_module
+
+    print("DEDUPLICATION VERIFICATION")
+    print("=" * 60)
+
+    init_db()
+    db = SessionLocal()
+    users = [User(email=f"{name}@dedup", username=name, hashed_password="-") for name in ("alice", "bob", "carol")]
+    db.add_all(users)
+    db.commit()
+    alice_id, bob_id, carol_id = [user.id for user in users]
+
+    alice, bob, carol = [client(app_module.app, user_id) for user_id in (alice_id, bob_id, carol_id)]
+    blob_store = app_module.blob_store
+
+    def upload(sender, content, recipient_id):
+        response = sender.post("/api/documents/upload", files={"file": ("report.bin", content)},
+                               data={"recipient_id": str(recipient_id)})
+        return db.get(Document, response.json()["document_id"])
+
+    def chunked_upload(sender, content, recipient_id):
+        session = sender.post("/api/uploads", json={
+            "filename": "report.bin", "recipient_id": recipient_id, "size": len(content)
+        }).json()
+        chunk_size = session["chunk_size"]
+        for index in reversed(range(session["chunk_count"])):
+            sender.put(f"/api/uploads/{session['upload_id']}/chunks/{index}",
+                       content=content[index * chunk_size:(index + 1) * chunk_size])
+        completed = sender.post(f"/api/uploads/{session['upload_id']}/complete").json()
+        return db.get(Document, completed["document_id"])
+
+    def stored_blobs():
+        return sum(
+            len(files) for directory, _, files in os.walk(blob_store.root)
+            if not directory.startswith((blob_store.tmp_dir, blob_store.uploads_dir))
+        )
+
+    results = []
+
+    content = os.urandom(400_000)
+    first = upload(alice, content, bob_id)
+    second = upload(alice, content, carol_id)
+    chunked = chunked_upload(alice, content, bob_id)
+    results.append(("duplicates reuse one blob", first.blob_key == second.blob_key == chunked.blob_key
+                    and first.content_digest == chunked.content_digest and stored_blobs() == 1))
+    results.append(("digest is keyed", first.content_digest != hashlib.sha256(content).hexdigest()))
+
+    other_sender = upload(bob, content, alice_id)
+    other_content = upload(alice, content + b"!", bob_id)
+    results.append(("other senders and contents not matched", other_sender.blob_key != first.blob_key
+                    and other_sender.content_digest != first.content_digest
+                    and other_content.blob_key != first.blob_key))
+
+    downloads = [
+        bob.get(f"/api/documents/{first.id}/download").content,
+        carol.get(f"/api/documents/{second.id}/download").content,
+        bob.get(f"/api/documents/{chunked.id}/download").content,
+    ]
+    results.append(("deduplicated documents download", downloads == [content] * 3))
+
+    text = alice.get("/metrics").text
+    results.append(("dedup metrics", sample(text, "briefcase_dedup_uploads_total", result="deduplicated") == 2
+                    and sample(text, "briefcase_dedup_uploads_total", result="stored") == 3
+                    and sample(text, "briefcase_dedup_bytes_total", kind="saved") == 2 * first.blob_size))
+    results.append(("no dedup counters for users", alice.get("/api/dedup/stats").status_code == 404))
+
+    # The blob is collected with its last document
+    key = first.blob_key
+
+    def delete(documents):
+        db.execute(update(Document).where(Document.id.in_([d.id for d in documents])).values(
+            is_deleted=True, deleted_at=datetime.utcnow() - timedelta(hours=2)
+        ))
+        db.commit()
+
+    delete([first, second])
+    reap_once(blob_store, batch_size=100, purge_grace=900)
+    results.append(("blob kept while a duplicate is live", blob_store.exists(key)))
+
+    delete([chunked])
+    reap_once(blob_store, batch_size=100, purge_grace=900)
+    results.append(("blob collected with the last duplicate", not blob_store.exists(key)))
+
+    # A deleted document is not matched anymore
+    again = upload(alice, content, bob_id)
+    results.append(("purged content stored again", again.blob_key and blob_store.exists(again.blob_key)
+                    and bob.get(f"/api/documents/{again.id}/download").content == content))
+
+    db.close()
+
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Deduplication behaves as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Key rotation verification for Briefcase
+Checks that every document gets its own data key, that rotating the master key
+re-wraps only the data keys (blobs untouched), that an interrupted rotation
+resumes where it stopped, and that documents stay readable afterwards.
+"""
+
+import os
+import sys
+import time
+
+from harness import client, setup_environment
+
+
+def main():
+    setup_environment("keys", UPLOAD_CHUNK_SIZE=128 * 1024)
+
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from config import settings
+    from encryption import KeyRing, get_key_ring
+    from rotate_keys import rotate_keys
+    import main as app_module
+
+    print("KEY ROTATION VERIFICATION")
+    print("=" * 60)
+
+    init_db()
+    db = SessionLocal()
+    users = [User(email=f"{name}@keys", username=name, hashed_password="-") for name in ("alice", "bob")]
+    db.add_all(users)
+    db.commit()
+    alice_id, bob_id = [user.id for user in users]
+
+    alice, bob = [client(app_module.app, user_id) for user_id in (alice_id, bob_id)]
+    blob_store = app_module.blob_store
+
+    def documents():
+        db.expire_all()
+        return db.query(Document).order_by(Document.id).all()
+
+    def download_all():
+        return [bob.get(f"/api/documents/{document.id}/download").content for document in documents()]
+
+    results = []
+
+    # The same file uploaded twice is encrypted with two different data keys
+    contents = [os.urandom(200_000), os.urandom(200_000), b"same content" * 1000, b"same content" * 1000]
+    for index, content in enumerate(contents):
+        alice.post("/api/documents/upload", files={"file": (f"doc{index}.bin", content)},
+                   data={"recipient_id": str(bob_id)})
+
+    # A chunked upload in progress when the key rotates
+    chunked = os.urandom(300_000)
+    upload = alice.post("/api/uploads", json={
+        "filename": "chunked.bin", "recipient_id": bob_id, "size": len(chunked)
+    }).json()
+    chunk_size = upload["chunk_size"]
+    alice.put(f"/api/uploads/{upload['upload_id']}/chunks/0", content=chunked[:chunk_size])
+
+    stored = documents()
+    results.append(("one data key per document", len({d.wrapped_key for d in stored}) == len(stored)
+                    and all(d.key_version == 0 for d in stored)
+                    and stored[2].blob_key != stored[3].blob_key))
+    blobs_before = [(d.blob_key, d.blob_digest) for d in stored]
+
+    # Add master key version 1 and make it active
+    settings.ENCRYPTION_KEYS = {1: "rotated-master-key-for-verification"}
+    settings.ENCRYPTION_KEY_VERSION = 1
+    app_module.key_ring = get_key_ring()
+
+    # Interrupt the rotation after the first batch
+    rewrap = KeyRing.rewrap
+    calls = []
+
+    def failing_rewrap(self, wrapped, version):
+        calls.append(1)
+        if len(calls) > 2:
+            raise RuntimeError("interrupted")
+        return rewrap(self, wrapped, version)
+
+    KeyRing.rewrap = failing_rewrap
+    try:
+        rotate_keys(batch_size=2)
+    except RuntimeError:
+        pass
+    KeyRing.rewrap = rewrap
+    versions = [d.key_version for d in documents()]
+    results.append(("interrupted rotation keeps committed batches", versions == [1, 1, 0, 0]))
+
+    started = time.monotonic()
+    rotate_keys(batch_size=1, max_rate=20)
+    elapsed = time.monotonic() - started
+    stored = documents()
+    results.append(("resumed rotation finishes", all(d.key_version == 1 for d in stored)))
+    results.append(("rotation is throttled", elapsed >= 3 / 20 * 0.9))
+    results.append(("blobs untouched", [(d.blob_key, d.blob_digest) for d in stored] == blobs_before
+                    and all(blob_store.exists(d.blob_key) for d in stored)))
+
+    # Retire the old master key: version 0 no longer unwraps anything
+    app_module.key_ring = KeyRing({0: "retired-master-key", 1: settings.ENCRYPTION_KEYS[1]}, 1)
+    results.append(("documents readable with the new key only", download_all() == contents))
+
+    # The chunked upload continues with its re-wrapped data key
+    for index in range(1, upload["chunk_count"]):
+        alice.put(f"/api/uploads/{upload['upload_id']}/chunks/{index}",
+                  content=chunked[index * chunk_size:(index + 1) * chunk_size])
+    completed = alice.post(f"/api/uploads/{upload['upload_id']}/complete").json()
+    downloaded = bob.get(f"/api/documents/{completed['document_id']}/download").content
+    results.append(("chunked upload survives rotation", downloaded == chunked
+                    and db.get(Document, completed["document_id"]).key_version == 1))
+
+    db.close()
+
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Key rotation behaves as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Metrics verification for Briefcase
+Logs in, uploads and downloads through the API with metrics enabled, then
+checks that /metrics is protected by its token and reports per-route
+latency, the auth, database, crypto and streaming spans, transfer counters,
+user cache hits and reaper deletions, and that disabled instruments record nothing.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from harness import sample, setup_environment
+
+TOKEN = "scrape-token"
+
+
+def main():
+    setup_environment("metrics", METRICS_ENABLED="true", METRICS_TOKEN=TOKEN)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import update
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from auth import get_password_hash
+    from reaper import reap_once
+    import metrics
+    import main as app_module
+
+    print("METRICS VERIFICATION")
+    print("=" * 60)
+
+    init_db()
+    db = SessionLocal()
+    users = [
+        User(email=f"{name}@metrics", username=name, hashed_password=get_password_hash("secret"))
+        for name in ("alice", "bob")
+    ]
+    db.add_all(users)
+    db.commit()
+    bob_id = users[1].id
+
+    results = []
+
+    with TestClient(app_module.app) as alice, TestClient(app_module.app) as bob:
+        alice.post("/api/login", json={"email": "alice@metrics", "password": "secret"})
+        bob.post("/api/login", json={"email": "bob@metrics", "password": "secret"})
+
+        content = os.urandom(300_000)
+        uploaded = alice.post("/api/documents/upload", files={"file": ("a.bin", content)},
+                              data={"recipient_id": str(bob_id), "view_limit": "1"}).json()
+        downloaded = bob.get(f"/api/documents/{uploaded['document_id']}/download").content
+        alice.get("/api/me")  # Principal cached by the upload
+
+        results.append(("scrape requires the token", alice.get("/metrics").status_code == 401))
+        response = alice.get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"})
+        text = response.text
+        results.append(("exposition format", response.status_code == 200
+                        and response.headers["content-type"].startswith("text/plain")
+                        and "# TYPE briefcase_http_request_duration_seconds histogram" in text))
+
+        route = "/api/documents/{document_id}/download"
+        results.append(("latency per route template", sample(
+            text, "briefcase_http_request_duration_seconds_count", method="GET", route=route, status="200"
+        ) == 1))
+        results.append(("auth spans", all(
+            sample(text, "briefcase_stage_duration_seconds_count", stage=stage)
+            for stage in ("jwt_decode", "user_lookup", "bcrypt")
+        )))
+        results.append(("database statements", all(
+            sample(text, "briefcase_db_query_duration_seconds_count", statement=statement)
+            for statement in ("SELECT", "INSERT", "UPDATE")
+        )))
+        results.append(("crypto bytes and throughput", downloaded == content
+                        and sample(text, "briefcase_crypto_bytes_total", operation="encrypt") == len(content)
+                        and sample(text, "briefcase_crypto_bytes_total", operation="decrypt") == len(content)
+                        and sample(text, "briefcase_crypto_throughput_bytes_per_second_count", operation="decrypt")))
+        results.append(("response streaming", sample(text, "briefcase_stage_duration_seconds_count",
+                                                     stage="response_stream") == 1))
+        results.append(("bytes in and out", sample(text, "briefcase_bytes_received_total") == len(content)
+                        and sample(text, "briefcase_bytes_sent_total") == len(content)))
+        results.append(("no transfer left active", sample(text, "briefcase_active_transfers", direction="upload") == 0
+                        and sample(text, "briefcase_active_transfers", direction="download") == 0))
+        results.append(("pool occupancy", sample(text, "briefcase_pool_tasks", pool="crypto", state="active") == 0))
+        stats = app_module.principal_cache.stats()
+        results.append(("user cache hits and misses", stats["hits"] == 1 and stats["misses"] == 2
+                        and sample(text, "briefcase_user_cache_lookups_total", result="hit") == 1
+                        and sample(text, "briefcase_user_cache_lookups_total", result="miss") == 2
+                        and sample(text, "briefcase_user_cache_entries") == 2))
+
+        # Reaper: the view limit deleted the document; purge it
+        db.execute(update(Document).values(deleted_at=datetime.utcnow() - timedelta(hours=1)))
+        db.commit()
+        reap_once(app_module.blob_store, batch_size=100)
+        text = alice.get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"}).text
+        results.append(("reaper deletions", sample(text, "briefcase_reaper_documents_total", action="purged") == 1))
+
+    # Disabled instruments record nothing
+    metrics.REGISTRY.enabled = False
+    before = metrics.bytes_sent.samples()
+    metrics.bytes_sent.inc(100)
+    with metrics.span("jwt_decode"):
+        pass
+    results.append(("disabled instruments are no-ops", metrics.bytes_sent.samples() == before
+                    and metrics.span("x") is metrics.span("y")))
+    metrics.REGISTRY.enabled = True
+
+    db.close()
+
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Metrics behave as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
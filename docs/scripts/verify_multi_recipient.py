@@ -0,0 +1,128 @@
+# verify_multi_recipient.py
+"""
+Multi-recipient delivery verification for Briefcase
+Sends one file to several recipients (in one request and in chunks) and checks
+that it is stored once, that each recipient has their own view count and limit,
+and that the reaper deletes the shared blob only after the last recipient's
+document is gone (resume window included).
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from harness import client, setup_environment
+
+
+def main():
+    setup_environment("recipients", UPLOAD_CHUNK_SIZE=128 * 1024)
+
+    from sqlalchemy import update
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from reaper import reap_once
+    import main as app_module
+
+    print("MULTI-RECIPIENT VERIFICATION")
+    print("=" * 60)
+
+    init_db()
+    db = SessionLocal()
+    users = [User(email=f"{name}@recipients", username=name, hashed_password="-")
+             for name in ("alice", "bob", "carol", "dave")]
+    db.add_all(users)
+    db.commit()
+    alice_id, bob_id, carol_id, dave_id = [user.id for user in users]
+
+    alice, bob, carol, dave = [client(app_module.app, user_id) for user_id in (alice_id, bob_id, carol_id, dave_id)]
+    blob_store = app_module.blob_store
+
+    def set_deleted_at(document_ids, when):
+        db.execute(update(Document).where(Document.id.in_(document_ids)).values(deleted_at=when))
+        db.commit()
+
+    results = []
+
+    # recipient_id and repeated recipient_ids combine; repeats are ignored
+    content = os.urandom(300_000)
+    response = alice.post(
+        "/api/documents/upload",
+        files={"file": ("report.bin", content)},
+        data={"recipient_id": str(bob_id), "recipient_ids": [str(carol_id), str(dave_id), str(bob_id)],
+              "view_limit": "1"}
+    )
+    document_ids = response.json()["document_ids"]
+    documents = [db.get(Document, document_id) for document_id in document_ids]
+    results.append(("one document per recipient", response.status_code == 200
+                    and [d.recipient_id for d in documents] == [bob_id, carol_id, dave_id]))
+    results.append(("content stored once", len({d.blob_key for d in documents}) == 1
+                    and blob_store.exists(documents[0].blob_key)))
+    key = documents[0].blob_key
+
+    sent = alice.get("/api/documents/sent").json()["items"]
+    received = carol.get("/api/documents/received").json()["items"]
+    results.append(("listings resolve each recipient", len(sent) == 3
+                    and [item["id"] for item in received] == [document_ids[1]]))
+
+    # View limit 1 for each recipient, counted separately
+    first = bob.get(f"/api/documents/{document_ids[0]}/download")
+    again = bob.get(f"/api/documents/{document_ids[0]}/download")
+    other = carol.get(f"/api/documents/{document_ids[1]}/download")
+    foreign = carol.get(f"/api/documents/{document_ids[2]}/download")
+    results.append(("per-recipient view count", first.content == content and again.status_code in (404, 410)
+                    and other.content == content and foreign.status_code == 403))
+
+    # bob's and carol's documents are deleted, dave's is live
+    set_deleted_at(document_ids[:2], datetime.utcnow() - timedelta(hours=2))
+    reap_once(blob_store, batch_size=100, purge_grace=900)
+    results.append(("blob kept for a live recipient", blob_store.exists(key)))
+
+    # dave's last view: his resume window still needs the blob
+    dave.get(f"/api/documents/{document_ids[2]}/download")
+    reap_once(blob_store, batch_size=1, purge_grace=900)
+    results.append(("blob kept during a recipient's resume window", blob_store.exists(key)))
+
+    set_deleted_at(document_ids[2:], datetime.utcnow() - timedelta(hours=2))
+    reap_once(blob_store, batch_size=100, purge_grace=900)
+    results.append(("blob deleted with the last recipient", not blob_store.exists(key)))
+
+    # Invalid recipients are rejected before anything is stored
+    unknown = alice.post("/api/documents/upload", files={"file": ("x.bin", b"x")},
+                         data={"recipient_ids": [str(bob_id), "99999"]})
+    missing = alice.post("/api/documents/upload", files={"file": ("x.bin", b"x")})
+    results.append(("invalid recipients rejected", unknown.status_code == 404 and missing.status_code == 400))
+
+    # Chunked uploads deliver to every recipient of the session
+    content = os.urandom(400_000)
+    upload = alice.post("/api/uploads", json={
+        "filename": "chunked.bin", "recipient_ids": [bob_id, dave_id], "size": len(content)
+    }).json()
+    chunk_size = upload["chunk_size"]
+    for index in range(upload["chunk_count"]):
+        alice.put(f"/api/uploads/{upload['upload_id']}/chunks/{index}",
+                  content=content[index * chunk_size:(index + 1) * chunk_size])
+    completed = alice.post(f"/api/uploads/{upload['upload_id']}/complete").json()
+    documents = [db.get(Document, document_id) for document_id in completed["document_ids"]]
+    downloads = [
+        recipient.get(f"/api/documents/{document.id}/download").content
+        for recipient, document in zip((bob, dave), documents)
+    ]
+    results.append(("chunked upload to several recipients",
+                    [d.recipient_id for d in documents] == [bob_id, dave_id]
+                    and len({d.blob_key for d in documents}) == 1
+                    and downloads == [content, content]))
+
+    db.close()
+
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Multi-recipient delivery behaves as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# verify_query_plans.py
+"""
+Query plan verification for Briefcase
+Runs every API endpoint (uploads, chunked uploads, batches, deduplication,
+downloads, resumes and archives), a reaper pass with its lease and the user
+invalidation listener against a temporary SQLite database, captures each SQL
+statement executed, and checks its EXPLAIN QUERY PLAN.
+Fails if any statement falls back to a full table scan.
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+from harness import setup_environment
+
+
+# Statements where a full scan is the intended plan: (table, statement fragment, reason)
+ALLOWED_SCANS = [
+    ("users", "WHERE users.id != ?", "GET /api/users lists every other user"),
+]
+# Fragments some checked statement must contain, so no feature goes unexercised
+EXPECTED_STATEMENTS = [
+    "FROM upload_sessions", "FROM upload_chunks", "UPDATE upload_sessions", "DELETE FROM upload_sessions",
+    "documents.content_digest =", "documents.id IN", "documents.blob_digest =",
+    "UPDATE leases", "DELETE FROM leases", "FROM user_invalidations", "DELETE FROM user_invalidations",
+]
+
+
+def seed(db):
+    """Creates users and documents in every state the queries filter on"""
+    from models import User, Document
+    from auth import get_password_hash
+    
+    password = get_password_hash("password123")
+    alice = User(email="alice@plans", username="alice", hashed_password=password)
+    bob = User(email="bob@plans", username="bob", hashed_password=password)
+    db.add_all([alice, bob])
+    db.commit()
+    
+    now = datetime.utcnow()
+    db.add_all([
+        Document(filename="expired.txt", sender_id=alice.id, recipient_id=bob.id,
+                 encrypted_content=b"-", expires_at=now - timedelta(days=1)),
+        Document(filename="limit.txt", sender_id=alice.id, recipient_id=bob.id,
+                 encrypted_content=b"-", view_limit=1, view_count=1),
+    ])
+    db.commit()
+    return alice.id, bob.id
+
+
+def exercise_endpoints(bob_id):
+    """Calls every endpoint as two different users"""
+    from fastapi.testclient import TestClient
+    import main
+    
+    def login(email):
+        client = TestClient(main.app)
+        response = client.post("/api/login", json={"email": email, "password": "password123"})
+        assert response.status_code == 200, response.text
+        client.cookies.set("access_token", response.json()["access_token"])
+        return client
+    
+    alice = login("alice@plans")
+    bob = login("bob@plans")
+    
+    alice.get("/api/me")
+    alice.get("/api/users")
+    response = alice.post(
+        "/api/documents/upload",
+        files={"file": ("report.txt", b"quarterly numbers")},
+        data={"recipient_id": str(bob_id), "view_limit": "2", "expires_in_days": "1"}
+    )
+    assert response.status_code == 200, response.text
+    document_id = response.json()["document_id"]
+    
+    alice.get("/api/documents")
+    bob.get("/api/documents")
+    for path in ("/api/documents/sent", "/api/documents/received"):
+        page = alice.get(path, params={"limit": 1}).json()
+        if page["next_cursor"]:
+            alice.get(path, params={"limit": 1, "cursor": page["next_cursor"]})
+        bob.get(path, params={"counterpart": 1, "filename_prefix": "rep", "expiring_before": "2100-01-01T00:00:00"})
+    alice.get(f"/api/documents/{document_id}/download")
+    download = bob.get(f"/api/documents/{document_id}/download")
+    bob.get(f"/api/documents/{document_id}/download")
+    # Resumed after the last view deleted the document
+    bob.get(f"/api/documents/{document_id}/download",
+            headers={"Range": "bytes=5-", "X-Resume-Token": download.headers["x-resume-token"]})
+    
+    # Deduplicated uploads (the second one reuses the blob)
+    for _ in range(2):
+        response = alice.post("/api/documents/upload", files={"file": ("same.txt", b"same content")},
+                              data={"recipient_id": str(bob_id)})
+        assert response.status_code == 200, response.text
+    
+    # Batch upload, then an archive of the received documents
+    response = alice.post(
+        "/api/documents/upload/batch",
+        files=[("files", (name, name.encode() * 100)) for name in ("a.txt", "b.txt")],
+        data={"recipient_ids": [str(bob_id)], "view_limit": "2"}
+    )
+    assert response.status_code == 200, response.text
+    ids = [upload["document_ids"][0] for upload in response.json()["uploads"]]
+    bob.get("/api/documents/archive", params={"ids": ids})
+    
+    # Chunked uploads: one completed (twice, deduplicated), one aborted, one left stale
+    for _ in range(2):
+        upload = alice.post("/api/uploads", json={"filename": "chunked.bin", "recipient_id": bob_id, "size": 10}).json()
+        alice.put(f"/api/uploads/{upload['upload_id']}/chunks/0", content=b"0123456789")
+        alice.get(f"/api/uploads/{upload['upload_id']}")
+        response = alice.post(f"/api/uploads/{upload['upload_id']}/complete")
+        assert response.status_code == 200, response.text
+    for _ in range(2):
+        upload = alice.post("/api/uploads", json={"filename": "partial.bin", "recipient_id": bob_id, "size": 10}).json()
+        alice.put(f"/api/uploads/{upload['upload_id']}/chunks/0", content=b"0123456789")
+    alice.delete(f"/api/uploads/{upload['upload_id']}")
+    
+    return main.blob_store
+
+
+def exercise_coordination(bob_id):
+    """Takes, renews and releases the reaper lease, and polls user invalidations"""
+    import asyncio
+    from database import SessionLocal
+    from models import User
+    from reaper import lease_reaper, release_reaper_lease
+    from coordination import run_invalidation_listener
+    
+    db = SessionLocal()
+    db.get(User, bob_id).username = "bob2"
+    db.commit()
+    db.close()
+    
+    assert lease_reaper(60) and lease_reaper(60)
+    release_reaper_lease()
+    
+    async def poll():
+        listener = asyncio.create_task(run_invalidation_listener(lambda user_id: None, 0.01))
+        await asyncio.sleep(0.1)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+    
+    asyncio.run(poll())
+
+
+def find_full_scans(conn, statement, parameters):
+    """Returns the tables a statement reads with a full scan"""
+    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        # "SCAN documents USING INDEX ..." walks an index, not the table
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            scans.append(detail.split()[1])
+    return scans
+
+
+def main():
+    setup_environment("plans", DEDUP_ENABLED="true")
+    
+    from sqlalchemy import event
+    from database import engine, async_engine, SessionLocal, init_db
+    from reaper import reap_once
+    
+    print("QUERY PLAN VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    _, bob_id = seed(db)
+    db.close()
+    
+    statements = {}
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            if executemany:
+                parameters = parameters[0]
+            statements.setdefault(statement, parameters)
+    
+    # Endpoints run on the async engine, the reaper on the sync one
+    engines = [engine, async_engine.sync_engine]
+    for target in engines:
+        event.listen(target, "before_cursor_execute", capture)
+    
+    blob_store = exercise_endpoints(bob_id)
+    exercise_coordination(bob_id)
+    reap_once(blob_store, batch_size=100, upload_ttl=0, invalidation_retention=0)
+    
+    for target in engines:
+        event.remove(target, "before_cursor_execute", capture)
+    
+    failures = []
+    with engine.connect() as conn:
+        for statement, parameters in statements.items():
+            summary = " ".join(statement.split())
+            for table in find_full_scans(conn, statement, parameters):
+                allowed = [
+                    reason for allowed_table, fragment, reason in ALLOWED_SCANS
+                    if allowed_table == table and fragment in summary
+                ]
+                if allowed:
+                    print(f"[OK] Allowed scan of {table}: {allowed[0]}")
+                else:
+                    failures.append((table, summary))
+    
+    summaries = [" ".join(statement.split()) for statement in statements]
+    missing = [
+        fragment for fragment in EXPECTED_STATEMENTS
+        if not any(fragment in summary for summary in summaries)
+    ]
+    
+    print(f"\n[*] Statements checked: {len(statements)}")
+    print("=" * 60)
+    
+    if failures or missing:
+        for table, summary in failures:
+            print(f"[ERROR] Full scan of {table}: {summary}")
+        for fragment in missing:
+            print(f"[ERROR] No statement with {fragment!r} was run")
+        print("=" * 60)
+        sys.exit(1)
+    
+    print("[OK] No endpoint query falls back to a full table scan")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
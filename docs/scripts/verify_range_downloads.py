@@ -0,0 +1,161 @@
+# verify_range_downloads.py
+"""
+Range and resumable download verification for Briefcase
+Checks single, suffix and multi-range responses against the original bytes,
+that a range only decrypts the frames covering it, and that a resume token
+continues a transfer without counting a view, even after the last view, but
+never serves the whole document again nor replays it from its start.
+"""
+
+import os
+import sys
+
+from harness import client, setup_environment
+
+FILE_SIZE = 300_000  # Five 64 KiB frames
+
+
+def parse_multipart(body: bytes, content_type: str) -> list:
+    """Returns (Content-Range, data) for each part of a multipart/byteranges body"""
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = []
+    for chunk in body.split(b"\r\n--" + boundary)[1:]:
+        if chunk.startswith(b"--"):
+            break
+        head, data = chunk.split(b"\r\n\r\n", 1)
+        content_range = [line for line in head.split(b"\r\n") if line.startswith(b"Content-Range")][0]
+        parts.append((content_range.split(b": ")[1].decode(), data))
+    return parts
+
+
+def main():
+    setup_environment("ranges")
+    
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from reaper import reap_once
+    from encryption import DocumentEncryption
+    import main as app_module
+    
+    print("RANGE DOWNLOAD VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@ranges", username="sender", hashed_password="-")
+    recipient = User(email="recipient@ranges", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.commit()
+    sender_id, recipient_id = sender.id, recipient.id
+    
+    alice, bob = client(app_module.app, sender_id), client(app_module.app, recipient_id)
+    
+    content = os.urandom(FILE_SIZE)
+    response = alice.post(
+        "/api/documents/upload",
+        files={"file": ("large.bin", content)},
+        data={"recipient_id": str(recipient_id), "view_limit": "4"}
+    )
+    document_id = response.json()["document_id"]
+    url = f"/api/documents/{document_id}/download"
+    
+    def view_count():
+        db.expire_all()
+        return db.get(Document, document_id).view_count
+    
+    # Count the frames each request authenticates
+    opened = []
+    open_frame = DocumentEncryption.open_frame
+    DocumentEncryption.open_frame = lambda *args, **kwargs: opened.append(1) or open_frame(*args, **kwargs)
+    
+    results = []
+    
+    full = bob.get(url)
+    token = full.headers["x-resume-token"]
+    results.append(("full download", full.status_code == 200 and full.content == content
+                    and full.headers["content-length"] == str(FILE_SIZE)
+                    and full.headers["accept-ranges"] == "bytes"))
+    results.append(("validator", full.headers["etag"] == f'"{db.get(Document, document_id).blob_digest}"'))
+    results.append(("full download counts a view", view_count() == 1))
+    
+    # Non-ASCII digits make the header malformed, not a server error (the sender counts no view)
+    superscript = alice.get(url, headers={"Range": b"bytes=\xb2-5"})
+    results.append(("non-ASCII digits ignored", superscript.status_code == 200 and superscript.content == content
+                    and app_module.parse_range_header("bytes=\xb2-5", 100) is None
+                    and app_module.parse_range_header("bytes=0-\u0665", 100) is None))
+    
+    resume = {"X-Resume-Token": token}
+    opened.clear()
+    single = bob.get(url, headers={"Range": "bytes=70000-70099", **resume})
+    results.append(("single range", single.status_code == 206 and single.content == content[70000:70100]
+                    and single.headers["content-range"] == f"bytes 70000-70099/{FILE_SIZE}"
+                    and single.headers["content-length"] == "100"))
+    results.append(("resumed response keeps the token", single.headers["x-resume-token"] == token))
+    results.append(("single range decrypts one frame", len(opened) == 1))
+    
+    suffix = bob.get(url, headers={"Range": "bytes=-500", **resume})
+    results.append(("suffix range", suffix.status_code == 206 and suffix.content == content[-500:]))
+    
+    tail = bob.get(url, headers={"Range": "bytes=299000-", **resume})
+    results.append(("open-ended range", tail.status_code == 206 and tail.content == content[299000:]))
+    
+    multi = bob.get(url, headers={"Range": "bytes=10-19, 131072-131081, 299990-", **resume})
+    parts = parse_multipart(multi.content, multi.headers["content-type"])
+    expected = [
+        (f"bytes 10-19/{FILE_SIZE}", content[10:20]),
+        (f"bytes 131072-131081/{FILE_SIZE}", content[131072:131082]),
+        (f"bytes 299990-{FILE_SIZE - 1}/{FILE_SIZE}", content[299990:]),
+    ]
+    results.append(("multi-range", multi.status_code == 206 and parts == expected
+                    and multi.headers["content-length"] == str(len(multi.content))))
+    
+    unsatisfiable = bob.get(url, headers={"Range": f"bytes={FILE_SIZE}-", **resume})
+    results.append(("unsatisfiable range", unsatisfiable.status_code == 416
+                    and unsatisfiable.headers["content-range"] == f"bytes */{FILE_SIZE}"))
+    
+    results.append(("resumed requests count no view", view_count() == 1))
+    
+    # A token never serves the whole document, nor replays it from the start:
+    # those are counted views
+    replay = bob.get(url, headers={"Range": "bytes=0-", **resume})
+    results.append(("replay from the first byte counts a view", replay.status_code == 206
+                    and replay.content == content and view_count() == 2))
+    stale = bob.get(url, headers={"Range": "bytes=10-19", "If-Range": '"stale"', **resume})
+    results.append(("If-Range mismatch sends the whole file, as a view", stale.status_code == 200
+                    and stale.content == content and view_count() == 3))
+    repeated = [bob.get(url, headers={"Range": "bytes=0-", **resume}) for _ in range(3)]
+    repeated += [bob.get(url, headers=resume) for _ in range(3)]
+    served = [response for response in repeated if response.status_code in (200, 206)]
+    results.append(("full replays with a token use up views", len(served) == 1 and view_count() == 4))
+    
+    # The last view deletes the document; the token still resumes the transfer
+    last = {"X-Resume-Token": served[0].headers["x-resume-token"]}
+    after = bob.get(url, headers={"Range": "bytes=100-199", **last})
+    results.append(("resume after the last view", after.status_code == 206 and after.content == content[100:200]))
+    results.append(("no download without a token", bob.get(url).status_code == 404))
+    results.append(("no replay from the start", bob.get(url, headers={"Range": "bytes=0-", **last}).status_code == 404))
+    
+    foreign = alice.get(url, headers={"Range": "bytes=10-19", **resume})
+    results.append(("token bound to its user", foreign.status_code == 404))
+    
+    # The reaper keeps the content during the resume window, then purges it
+    reap_once(app_module.blob_store, batch_size=100, purge_grace=3600)
+    kept = bob.get(url, headers={"Range": "bytes=10-19", **resume})
+    reap_once(app_module.blob_store, batch_size=100, purge_grace=0)
+    purged = bob.get(url, headers={"Range": "bytes=10-19", **resume})
+    results.append(("purge waits for the resume window", kept.status_code == 206 and purged.status_code == 404))
+    
+    db.close()
+    
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+    
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Range and resumable downloads behave as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# verify_statement_counts.py
+"""
+SQL statement count verification for Briefcase listings
+Counts the statements each listing request executes with 1, 10, 100 and 500
+documents. The count must not grow with the number of documents (no N+1 queries).
+"""
+
+import sys
+
+from harness import client, setup_environment
+
+DOCUMENT_COUNTS = [1, 10, 100, 500]
+LISTING_REQUESTS = [
+    ("/api/documents", {}),
+    ("/api/documents/sent", {"limit": 200}),
+    ("/api/documents/received", {"limit": 200}),
+]
+
+
+def main():
+    setup_environment("statements")
+    
+    from sqlalchemy import event
+    from database import async_engine, SessionLocal, init_db
+    from models import User, Document
+    import main as app_module
+    
+    print("SQL STATEMENT COUNT VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    
+    # Every document has a distinct counterpart, the worst case for lazy loads
+    owner = User(email="owner@statements", username="owner", hashed_password="-")
+    db.add(owner)
+    db.commit()
+    owner_id = owner.id
+    
+    api = client(app_module.app, owner_id)
+    # Warm up the user cache so every counted request does the same auth work
+    api.get("/api/me")
+    
+    statement_count = 0
+    
+    # Endpoints run on the async engine; events are registered on its sync core
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        nonlocal statement_count
+        statement_count += 1
+    
+    counts = {path: [] for path, _ in LISTING_REQUESTS}
+    created = 0
+    for target in DOCUMENT_COUNTS:
+        while created < target:
+            other = User(email=f"user{created}@statements", username=f"user{created}", hashed_password="-")
+            db.add(other)
+            db.flush()
+            db.add_all([
+                Document(filename=f"sent-{created}.txt", sender_id=owner_id, recipient_id=other.id),
+                Document(filename=f"received-{created}.txt", sender_id=other.id, recipient_id=owner_id),
+            ])
+            created += 1
+        db.commit()
+        
+        for path, params in LISTING_REQUESTS:
+            statement_count = 0
+            response = api.get(path, params=params)
+            assert response.status_code == 200, response.text
+            assert statement_count > 0, "no statements captured"
+            counts[path].append(statement_count)
+    
+    db.close()
+    
+    failures = []
+    print(f"\n{'endpoint':<28}" + "".join(f"{n:>8}" for n in DOCUMENT_COUNTS))
+    print("-" * 60)
+    for path, values in counts.items():
+        print(f"{path:<28}" + "".join(f"{v:>8}" for v in values))
+        if len(set(values)) != 1:
+            failures.append(path)
+    
+    print("=" * 60)
+    if failures:
+        for path in failures:
+            print(f"[ERROR] Statement count grows with documents: {path}")
+        print("=" * 60)
+        sys.exit(1)
+    
+    print("[OK] Statement count per request is constant")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
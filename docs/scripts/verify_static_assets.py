@@ -0,0 +1,94 @@
+"""
+Static assets verification for Briefcase
+Checks that pages link assets by content-hashed URL, that hashed assets are
+immutable and plain ones revalidated, that gzip (and brotli when installed)
+variants are picked by Accept-Encoding, and that strong ETags give 304s
+to GET and HEAD.
+"""
+
+import gzip
+import os
+import re
+import sys
+
+from harness import ROOT, setup_environment
+
+
+def main():
+    setup_environment("assets")
+    
+    from fastapi.testclient import TestClient
+    import assets
+    import main as app_module
+    
+    print("STATIC ASSETS VERIFICATION")
+    print("=" * 60)
+    
+    with open(os.path.join(ROOT, "static", "dashboard.js"), "rb") as f:
+        script = f.read()
+    
+    results = []
+    
+    with TestClient(app_module.app) as client:
+        page = client.get("/dashboard", headers={"Accept-Encoding": "identity"})
+        urls = re.findall(r'(?:href|src)="(/static/[^"]+)"', page.text)
+        results.append(("pages link hashed assets", page.status_code == 200 and len(urls) == 2
+                        and all(re.search(r"\.[0-9a-f]{12}\.(css|js)$", url) for url in urls)))
+        script_url = next(url for url in urls if url.endswith(".js"))
+        
+        hashed = client.get(script_url, headers={"Accept-Encoding": "identity"})
+        results.append(("hashed asset is immutable", hashed.content == script
+                        and "immutable" in hashed.headers["cache-control"]
+                        and "javascript" in hashed.headers["content-type"]))
+        plain = client.get("/static/dashboard.js", headers={"Accept-Encoding": "identity"})
+        results.append(("plain asset is revalidated", plain.content == script
+                        and plain.headers["cache-control"] == "no-cache"))
+        
+        zipped = client.get(script_url, headers={"Accept-Encoding": "gzip"})
+        results.append(("gzip variant", zipped.headers.get("content-encoding") == "gzip"
+                        and zipped.content == script and zipped.headers["vary"] == "Accept-Encoding"
+                        and zipped.headers["etag"] != hashed.headers["etag"]))
+        refused = client.get(script_url, headers={"Accept-Encoding": "gzip;q=0"})
+        results.append(("q=0 refuses an encoding", "content-encoding" not in refused.headers))
+        
+        if assets.brotli is not None:
+            both = client.get(script_url, headers={"Accept-Encoding": "gzip, br"})
+            results.append(("brotli preferred", both.headers.get("content-encoding") == "br"))
+        else:
+            print("[INFO] brotli is not installed; brotli variants are skipped")
+        
+        # Each variant revalidates against its own ETag
+        etag = zipped.headers["etag"]
+        not_modified = client.get(script_url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        other_variant = client.get(script_url, headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+        results.append(("304 on matching ETag", not_modified.status_code == 304 and not not_modified.content
+                        and other_variant.status_code == 200))
+        head = client.head(script_url, headers={"Accept-Encoding": "identity"})
+        head_revalidated = client.head(script_url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        results.append(("HEAD on assets", head.status_code == 200 and head.headers["etag"] == hashed.headers["etag"]
+                        and head.headers["content-length"] == str(len(script))
+                        and head_revalidated.status_code == 304))
+        page_etag = page.headers["etag"]
+        results.append(("pages revalidate", client.get(
+            "/dashboard", headers={"Accept-Encoding": "identity", "If-None-Match": page_etag}
+        ).status_code == 304))
+        
+        results.append(("unknown asset", client.get("/static/missing.js").status_code == 404))
+    
+    # Compressed once, deterministically
+    resource = assets.Resource(script, "application/javascript")
+    results.append(("precompressed once", gzip.decompress(resource.variants["gzip"]) == script
+                    and resource.variants["gzip"] == assets.Resource(script, "x").variants["gzip"]))
+    
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+    
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Static assets behave as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# verify_view_limit.py
+"""
+View limit stress verification for Briefcase
+Starts a real server and has many threads download the same documents at once
+as their recipient. Every document must be served exactly `view_limit` times
+and end with view_count == view_limit, however the requests interleave.
+A download refused because the crypto pool is saturated must not count a view.
+
+    python docs/scripts/verify_view_limit.py --threads 32 --documents 20
+"""
+
+import argparse
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import setup_environment
+
+VIEW_LIMITS = [1, 2, 5]
+
+
+def start_server(app):
+    """Runs uvicorn in a background thread; returns its base URL"""
+    import uvicorn
+    
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Briefcase view limit stress verification")
+    parser.add_argument("--threads", type=int, default=32, help="Concurrent downloading threads")
+    parser.add_argument("--documents", type=int, default=10, help="Documents per view limit")
+    parser.add_argument("--attempts", type=int, default=4, help="Download attempts per allowed view")
+    args = parser.parse_args()
+    
+    setup_environment("views")
+    
+    import httpx
+    from database import SessionLocal, init_db
+    from models import User, Document
+    from auth import create_access_token
+    import main as app_module
+    
+    print("VIEW LIMIT STRESS VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    sender = User(email="sender@views", username="sender", hashed_password="-")
+    recipient = User(email="recipient@views", username="recipient", hashed_password="-")
+    db.add_all([sender, recipient])
+    db.commit()
+    sender_id, recipient_id = sender.id, recipient.id
+    db.close()
+    
+    base_url = start_server(app_module.app)
+    token = create_access_token(data={"sub": str(recipient_id)})
+    uploader = httpx.Client(base_url=base_url, cookies={"access_token": create_access_token(data={"sub": str(sender_id)})})
+    
+    limits = {}
+    for view_limit in VIEW_LIMITS:
+        for i in range(args.documents):
+            response = uploader.post(
+                "/api/documents/upload",
+                files={"file": (f"limit-{view_limit}-{i}.txt", b"confidential")},
+                data={"recipient_id": str(recipient_id), "view_limit": str(view_limit)}
+            )
+            assert response.status_code == 200, response.text
+            limits[response.json()["document_id"]] = view_limit
+    uploader.close()
+    
+    # Every document gets `attempts` times more requests than it allows, all interleaved
+    attempts = [
+        document_id
+        for round_number in range(args.attempts * max(VIEW_LIMITS))
+        for document_id, view_limit in limits.items()
+        if round_number < view_limit * args.attempts
+    ]
+    
+    local = threading.local()
+    
+    def download(document_id):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = httpx.Client(base_url=base_url, cookies={"access_token": token}, timeout=60)
+        response = client.get(f"/api/documents/{document_id}/download")
+        return document_id, response.status_code, response.content
+    
+    print(f"[*] {len(attempts)} downloads of {len(limits)} documents from {args.threads} threads")
+    served = Counter()
+    statuses = Counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for document_id, status_code, content in pool.map(download, attempts):
+            statuses[status_code] += 1
+            if status_code == 200:
+                assert content == b"confidential"
+                served[document_id] += 1
+    print(f"[*] Responses: {dict(sorted(statuses.items()))}")
+    
+    # A saturated crypto pool refuses the download before the view is counted
+    uploader = httpx.Client(base_url=base_url, cookies={"access_token": create_access_token(data={"sub": str(sender_id)})})
+    last_view = uploader.post(
+        "/api/documents/upload",
+        files={"file": ("busy.txt", b"confidential")},
+        data={"recipient_id": str(recipient_id), "view_limit": "1"}
+    ).json()["document_id"]
+    uploader.close()
+    recipient_client = httpx.Client(base_url=base_url, cookies={"access_token": token}, timeout=60)
+    max_queue = app_module.crypto_executor.max_queue
+    app_module.crypto_executor.max_queue = 0
+    try:
+        busy = recipient_client.get(f"/api/documents/{last_view}/download")
+    finally:
+        app_module.crypto_executor.max_queue = max_queue
+    retry = recipient_client.get(f"/api/documents/{last_view}/download")
+    recipient_client.close()
+    
+    db = SessionLocal()
+    view_counts = dict(db.query(Document.id, Document.view_count).filter(Document.id.in_(limits)).all())
+    last_view_count = db.get(Document, last_view).view_count
+    db.close()
+    
+    failures = [
+        (document_id, view_limit, served[document_id], view_counts[document_id])
+        for document_id, view_limit in limits.items()
+        if served[document_id] != view_limit or view_counts[document_id] != view_limit
+    ]
+    unexpected = set(statuses) - {200, 404, 410}
+    refused_view_kept = (busy.status_code == 503 and retry.status_code == 200
+                         and retry.content == b"confidential" and last_view_count == 1)
+    
+    print("=" * 60)
+    if failures or unexpected or not refused_view_kept:
+        for document_id, view_limit, count, view_count in failures:
+            print(f"[ERROR] Document {document_id}: limit {view_limit}, served {count}, view_count {view_count}")
+        if unexpected:
+            print(f"[ERROR] Unexpected status codes: {sorted(unexpected)}")
+        if not refused_view_kept:
+            print(f"[ERROR] Saturated pool: {busy.status_code}, then retry {retry.status_code}")
+        print("=" * 60)
+        sys.exit(1)
+    
+    print("[OK] Every document was served exactly view_limit times")
+    print("[OK] A download refused by a saturated pool can be retried")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Multi-worker verification for Briefcase
+Starts serve.py with several workers on a temporary database and checks that
+requests are served by all of them, that a user change made by another process
+reaches every worker's cache, that a lease has one holder at a time, that
+one worker holds the reaper lease (the others skip passes without errors) and
+another takes it over when it dies, that SIGHUP replaces the workers without
+failed requests, and that SIGTERM stops everything.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from harness import setup_environment
+
+WORKERS = 3
+
+
+def children(pid):
+    """Live child processes of pid"""
+    found = set()
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            found.update(int(child) for child in f.read().split())
+    return found
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def lease_holder():
+    from database import SessionLocal
+    from models import Lease
+    
+    db = SessionLocal()
+    try:
+        lease = db.get(Lease, "reaper")
+        return int(lease.holder.split(":")[1]) if lease else None
+    finally:
+        db.close()
+
+
+def main():
+    setup_environment("workers", REAPER_ENABLED="true", REAPER_INTERVAL_SECONDS="0.5", REAPER_LEASE_SECONDS="2", USER_INVALIDATION_POLL_SECONDS="0.2")
+    
+    import httpx
+    from benchmarks.harness import free_port
+    from database import SessionLocal, init_db
+    from models import User
+    from auth import get_password_hash
+    
+    print("MULTI-WORKER VERIFICATION")
+    print("=" * 60)
+    
+    init_db()
+    db = SessionLocal()
+    user = User(email="alice@workers", username="alice", hashed_password=get_password_hash("secret"))
+    db.add(user)
+    db.commit()
+    
+    results = []
+    
+    # Two holders: the second is refused (not an error) until the lease expires
+    from coordination import hold_lease
+    results.append(("lease has one holder", hold_lease(db, "test", "a", 60)
+                    and not hold_lease(db, "test", "b", 60) and hold_lease(db, "test", "a", 60)))
+    results.append(("expired lease taken over", hold_lease(db, "expired", "a", 0)
+                    and hold_lease(db, "expired", "b", 60) and not hold_lease(db, "expired", "a", 60)))
+    
+    port = free_port()
+    log = tempfile.TemporaryFile(mode="w+")
+    master = subprocess.Popen(
+        [sys.executable, "-u", "serve.py", "--workers", str(WORKERS), "--port", str(port),
+         "--host", "127.0.0.1", "--log-level", "warning", "--graceful-timeout", "5"],
+        stdout=log
+    )
+    url = f"http://127.0.0.1:{port}"
+    # A new connection per request, so requests spread over the workers
+    client = httpx.Client(base_url=url, headers={"Connection": "close"}, timeout=10)
+    
+    def up():
+        try:
+            return client.get("/").status_code == 200
+        except httpx.TransportError:
+            return False
+    
+    try:
+        results.append(("workers started", wait_for(up, 60) and len(children(master.pid)) == WORKERS))
+        
+        token = client.post("/api/login", json={"email": "alice@workers", "password": "secret"}).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        names = {client.get("/api/me", headers=auth).json()["username"] for _ in range(60)}
+        results.append(("principal cached", names == {"alice"}))
+        
+        # Changed by this process: every worker must drop its cached principal
+        user.username = "alice2"
+        db.commit()
+        time.sleep(1)
+        names = {client.get("/api/me", headers=auth).json()["username"] for _ in range(60)}
+        results.append(("user change reaches every worker", names == {"alice2"}))
+        
+        results.append(("one worker holds the reaper lease", wait_for(
+            lambda: lease_holder() in children(master.pid), 5
+        )))
+        time.sleep(1)
+        log.seek(0)
+        results.append(("other workers skip reaper passes quietly", "Reaper error" not in log.read()))
+        
+        # A killed worker is replaced, and its lease taken over once it expires
+        leader = lease_holder()
+        os.kill(leader, signal.SIGKILL)
+        results.append(("dead worker replaced", wait_for(
+            lambda: len(children(master.pid)) == WORKERS and leader not in children(master.pid), 15
+        )))
+        results.append(("reaper lease taken over", wait_for(
+            lambda: lease_holder() not in (None, leader) and lease_holder() in children(master.pid), 10
+        )))
+        
+        # Graceful reload under load
+        failures = []
+        stop = threading.Event()
+        
+        def load():
+            while not stop.is_set():
+                try:
+                    if client.get("/api/me", headers=auth).status_code != 200:
+                        failures.append("status")
+                except httpx.TransportError as e:
+                    failures.append(e)
+        
+        thread = threading.Thread(target=load)
+        thread.start()
+        old = children(master.pid)
+        os.kill(master.pid, signal.SIGHUP)
+        replaced = wait_for(lambda: not children(master.pid) & old and len(children(master.pid)) == WORKERS, 60)
+        time.sleep(0.5)
+        stop.set()
+        thread.join()
+        results.append(("SIGHUP replaces the workers", replaced))
+        results.append(("no failed requests during reload", not failures))
+        
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+        results.append(("SIGTERM stops the server", master.returncode == 0 and not up()))
+    finally:
+        if master.poll() is None:
+            master.kill()
+        client.close()
+        db.close()
+    
+    for check, passed in results:
+        print(f"[{'OK' if passed else 'ERROR'}] {check}")
+    
+    print("=" * 60)
+    if not all(passed for _, passed in results):
+        sys.exit(1)
+    print("[OK] Workers behave as expected")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
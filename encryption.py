@@ -1,16 +1,249 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap, aes_key_wrap
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
 import os
 import base64
+import struct
+
+from compression import Codec, GzipEncoder, codec_by_id, worth_compressing
+from config import settings
+
+
+# Segmented format: header + fixed-size frames, each sealed with AES-256-GCM
+FRAME_MAGIC = b"BCF1"
+FRAME_SIZE = 64 * 1024  # Plaintext bytes per frame
+NONCE_SIZE = 12
+TAG_SIZE = 16
+HEADER_FORMAT = ">4sI"  # magic + frame size
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Compressed variant: each frame is compressed before it is sealed, so records
+# vary in size and carry a length prefix. The codec id is in the header.
+COMPRESSED_MAGIC = b"BCF2"
+COMPRESSED_HEADER_FORMAT = ">4sIB"  # magic + frame size + codec id
+COMPRESSED_HEADER_SIZE = struct.calcsize(COMPRESSED_HEADER_FORMAT)
+LENGTH_FORMAT = ">I"
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+# First byte of a compressed stream's frame plaintext (encrypted with it)
+FRAME_STORED = b"\x00"
+FRAME_COMPRESSED = b"\x01"
+
+# Envelope encryption: random per-document data keys, wrapped by a master key
+DATA_KEY_SIZE = 32
+# Master key version of documents stored before envelope encryption
+# (their content is encrypted with the master key itself)
+LEGACY_KEY_VERSION = 0
+
+
+class StreamHeader(NamedTuple):
+    frame_size: int
+    codec: Optional[Codec]  # None for the uncompressed format
+    size: int  # Header length in bytes
+
+
+class StreamEncryptor:
+    """
+    Incremental encryptor for the segmented format
+    Feed plaintext with update() and close the stream with finalize()
+    """
+    
+    def __init__(self, encryption: "DocumentEncryption", codec: Optional[Codec] = None):
+        self._encryption = encryption
+        self._codec = codec
+        self._frame_size = encryption.frame_size
+        self._buffer = bytearray()
+        self._index = 0
+        self._header_sent = False
+        self._finalized = False
+    
+    def _take_header(self) -> bytes:
+        if self._header_sent:
+            return b""
+        self._header_sent = True
+        return self._encryption.frame_header(self._codec)
+    
+    def update(self, data: bytes) -> bytes:
+        """Buffers plaintext and returns every complete frame that is not the last one"""
+        if self._finalized:
+            raise ValueError("Stream already finalized")
+        
+        self._buffer += data
+        out = bytearray(self._take_header())
+        
+        # The last frame is kept back until finalize() so it can be sealed as final
+        frames = (len(self._buffer) - 1) // self._frame_size
+        if frames > 0:
+            size = frames * self._frame_size
+            out += self._encryption.seal_frames(self._index, self._buffer[:size], final=False, codec=self._codec)
+            self._index += frames
+            del self._buffer[:size]
+        
+        return bytes(out)
+    
+    def finalize(self) -> bytes:
+        """Seals the remaining plaintext (possibly empty) as the final frame"""
+        if self._finalized:
+            raise ValueError("Stream already finalized")
+        self._finalized = True
+        
+        out = self._take_header() + self._encryption.seal_frames(
+            self._index, bytes(self._buffer), final=True, codec=self._codec
+        )
+        self._buffer.clear()
+        return out
+
+
+class StreamDecryptor:
+    """
+    Incremental decryptor for the segmented format (compressed or not)
+    Feed ciphertext with update() and verify the end of stream with finalize().
+    With a GzipEncoder, a compressed stream comes out gzip-encoded instead.
+    """
+    
+    def __init__(self, encryption: "DocumentEncryption", encoder: Optional[GzipEncoder] = None):
+        self._encryption = encryption
+        self._encoder = encoder
+        self._buffer = bytearray()
+        self._index = 0
+        self._header = None
+        self._stream = None
+        self._finalized = False
+    
+    def _parse_header(self) -> bool:
+        if self._header is not None:
+            return True
+        if len(self._buffer) < COMPRESSED_HEADER_SIZE:
+            return False
+        
+        self._stream = parse_stream_header(self._buffer)
+        self._header = bytes(self._buffer[:self._stream.size])
+        del self._buffer[:self._stream.size]
+        return True
+    
+    def _record_at(self, offset: int) -> Optional[Tuple[int, int]]:
+        """Bounds of the complete record at offset, None if it is not buffered yet"""
+        if self._stream.codec is None:
+            end = offset + NONCE_SIZE + self._stream.frame_size + TAG_SIZE
+            return (offset, end) if len(self._buffer) >= end else None
+        if len(self._buffer) < offset + LENGTH_SIZE:
+            return None
+        (length,) = struct.unpack_from(LENGTH_FORMAT, self._buffer, offset)
+        end = offset + LENGTH_SIZE + length
+        return (offset + LENGTH_SIZE, end) if len(self._buffer) >= end else None
+    
+    def _open(self, record: bytes, final: bool) -> bytes:
+        if self._encoder is None:
+            return self._encryption.open_frame(self._header, self._index, record, final)
+        compressed, payload = self._encryption.open_payload(self._header, self._index, record, final)
+        plaintext = self._encryption.decode_payload(self._stream, compressed, payload)
+        return self._encoder.segment(compressed, payload, plaintext)
+    
+    def update(self, data: bytes) -> bytes:
+        """Buffers ciphertext and returns the plaintext of every complete non-final frame"""
+        if self._finalized:
+            raise ValueError("Stream already finalized")
+        
+        self._buffer += data
+        if not self._parse_header():
+            return b""
+        
+        out = bytearray()
+        offset = 0
+        view = memoryview(self._buffer)
+        # A record followed by more data is not the last one
+        while (bounds := self._record_at(offset)) and len(self._buffer) > bounds[1]:
+            out += self._open(view[bounds[0]:bounds[1]], final=False)
+            self._index += 1
+            offset = bounds[1]
+        view.release()
+        del self._buffer[:offset]
+        
+        return bytes(out)
+    
+    def finalize(self) -> bytes:
+        """Decrypts the final frame; fails if the stream was truncated"""
+        if self._finalized:
+            raise ValueError("Stream already finalized")
+        self._finalized = True
+        
+        if not self._parse_header() or len(self._buffer) < NONCE_SIZE + TAG_SIZE:
+            raise ValueError("Truncated encrypted stream")
+        
+        if self._stream.codec is None:
+            record = bytes(self._buffer)
+        else:
+            bounds = self._record_at(0)
+            if bounds is None or bounds[1] != len(self._buffer):
+                raise ValueError("Truncated encrypted stream")
+            record = bytes(self._buffer[bounds[0]:])
+        
+        out = self._open(record, final=True)
+        self._buffer.clear()
+        if self._encoder is not None:
+            out += self._encoder.finish()
+        return out
+
+
+def parse_stream_header(data: bytes) -> StreamHeader:
+    """Validates the header at the start of a segmented stream"""
+    magic = bytes(data[:len(FRAME_MAGIC)])
+    if magic == COMPRESSED_MAGIC:
+        _, frame_size, codec_id = struct.unpack_from(COMPRESSED_HEADER_FORMAT, data)
+        header = StreamHeader(frame_size, codec_by_id(codec_id), COMPRESSED_HEADER_SIZE)
+    elif magic == FRAME_MAGIC:
+        _, frame_size = struct.unpack_from(HEADER_FORMAT, data)
+        header = StreamHeader(frame_size, None, HEADER_SIZE)
+    else:
+        raise ValueError("Invalid encrypted stream header")
+    
+    if header.frame_size <= 0:
+        raise ValueError("Invalid encrypted stream header")
+    return header
+
+
+def parse_frame_header(header: bytes) -> int:
+    """Validates a segmented format header and returns its frame size"""
+    return parse_stream_header(header).frame_size
+
+
+def is_framed(encrypted_data: bytes) -> bool:
+    """Checks whether data uses the segmented format (as opposed to legacy CBC)"""
+    return bytes(encrypted_data[:len(FRAME_MAGIC)]) in (FRAME_MAGIC, COMPRESSED_MAGIC)
+
+
+def frame_count(plaintext_size: int, frame_size: int) -> int:
+    """Number of frames of a segmented stream (an empty stream still has its final frame)"""
+    return max(1, -(-plaintext_size // frame_size))
+
+
+def encrypted_size(plaintext_size: int, frame_size: int) -> int:
+    """Size of the uncompressed segmented stream holding `plaintext_size` bytes"""
+    return HEADER_SIZE + plaintext_size + frame_count(plaintext_size, frame_size) * (NONCE_SIZE + TAG_SIZE)
+
+
+def iter_chunks(data: bytes, chunk_size: int = FRAME_SIZE) -> Iterator[memoryview]:
+    """Yields zero-copy slices of a buffer"""
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
 
 
 class DocumentEncryption:
     """Handles document encryption and decryption using AES-256"""
     
-    def __init__(self, key: str):
-        # Ensure key has exactly 32 bytes (256 bits)
-        self.key = self._ensure_key_length(key)
+    def __init__(self, key: Union[str, bytes], frame_size: int = FRAME_SIZE):
+        # Raw keys (data keys) are used as they are; passphrases are fitted to 32 bytes (256 bits)
+        if isinstance(key, bytes):
+            if len(key) != DATA_KEY_SIZE:
+                raise ValueError("Encryption keys must be 32 bytes")
+            self.key = key
+        else:
+            self.key = self._ensure_key_length(key)
+        self.frame_size = frame_size
+        self._aead = AESGCM(self.key)
     
     def _ensure_key_length(self, key: str) -> bytes:
         """Ensures key has exactly 32 bytes"""
@@ -75,11 +308,250 @@ class DocumentEncryption:
         
         return data
     
-    def encrypt_file(self, file_content: bytes) -> bytes:
+    def frame_header(self, codec: Optional[Codec] = None) -> bytes:
+        """Header written at the start of every segmented stream"""
+        if codec is None:
+            return struct.pack(HEADER_FORMAT, FRAME_MAGIC, self.frame_size)
+        return struct.pack(COMPRESSED_HEADER_FORMAT, COMPRESSED_MAGIC, self.frame_size, codec.id)
+    
+    def _seal(self, index: int, plaintext: bytes, final: bool, codec: Optional[Codec], attempt: bool) -> Tuple[bytes, bool]:
+        """Seals one frame; returns the record and whether it was compressed"""
+        nonce = os.urandom(NONCE_SIZE)
+        aad = self.frame_header(codec) + struct.pack(">Q?", index, final)
+        if codec is None:
+            return nonce + self._aead.encrypt(nonce, bytes(plaintext), aad), False
+        
+        body, compressed = FRAME_STORED + plaintext, False
+        if attempt:
+            payload = codec.compress(plaintext)
+            if worth_compressing(len(payload), len(plaintext)):
+                body, compressed = FRAME_COMPRESSED + payload, True
+        sealed = nonce + self._aead.encrypt(nonce, body, aad)
+        return struct.pack(LENGTH_FORMAT, len(sealed)) + sealed, compressed
+    
+    def seal_frame(self, index: int, plaintext: bytes, final: bool, codec: Optional[Codec] = None) -> bytes:
+        """
+        Encrypts one frame using AES-256-GCM
+        Returns: nonce (12 bytes) + ciphertext + tag (16 bytes), length-prefixed
+        when compressed. The header, frame index and final flag are authenticated
+        so frames cannot be reordered, dropped or truncated
+        """
+        return self._seal(index, bytes(plaintext), final, codec, attempt=True)[0]
+    
+    def seal_frames(self, first_index: int, plaintext: bytes, final: bool, codec: Optional[Codec] = None) -> bytes:
+        """
+        Encrypts a frame-aligned slice of a stream, numbering its frames from first_index
+        Slices sealed separately (e.g. chunks of an upload, in any order) join into
+        one stream; only the slice holding the end of the stream is final.
+        With a codec, the first frame of the slice is a probe: if it doesn't
+        compress, the rest of the slice is stored without trying.
+        """
+        view = memoryview(plaintext)
+        offsets = range(0, len(view), self.frame_size)
+        if not offsets and final:
+            offsets = [0]  # An empty stream still has its final frame
+        
+        out = bytearray()
+        attempt = True
+        for number, offset in enumerate(offsets):
+            end = offset + self.frame_size
+            record, compressed = self._seal(
+                first_index + number, bytes(view[offset:end]), final and end >= len(view), codec, attempt
+            )
+            out += record
+            if number == 0:
+                attempt = compressed
+        view.release()
+        return bytes(out)
+    
+    def open_payload(self, header: bytes, index: int, record: bytes, final: bool) -> Tuple[bool, bytes]:
+        """Decrypts and authenticates one frame; returns (compressed, payload)"""
+        record = bytes(record)
+        nonce, ciphertext = record[:NONCE_SIZE], record[NONCE_SIZE:]
+        aad = header + struct.pack(">Q?", index, final)
+        body = self._aead.decrypt(nonce, ciphertext, aad)
+        if bytes(header[:len(COMPRESSED_MAGIC)]) != COMPRESSED_MAGIC:
+            return False, body
+        return body[:1] == FRAME_COMPRESSED, body[1:]
+    
+    def decode_payload(self, stream: StreamHeader, compressed: bool, payload: bytes) -> bytes:
+        if not compressed:
+            return payload
+        return stream.codec.decompress(payload, stream.frame_size)
+    
+    def open_frame(self, header: bytes, index: int, record: bytes, final: bool) -> bytes:
+        """Decrypts and authenticates one frame produced by seal_frame (without its length prefix)"""
+        compressed, payload = self.open_payload(header, index, record, final)
+        if not compressed:
+            return payload
+        return self.decode_payload(parse_stream_header(header), compressed, payload)
+    
+    def encryptor(self, codec: Optional[Codec] = None) -> StreamEncryptor:
+        """Creates an incremental encryptor, compressing frames with codec"""
+        return StreamEncryptor(self, codec)
+    
+    def decryptor(self, encoder: Optional[GzipEncoder] = None) -> StreamDecryptor:
+        """Creates an incremental decryptor"""
+        return StreamDecryptor(self, encoder)
+    
+    def encrypt_stream(self, chunks: Iterable[bytes], codec: Optional[Codec] = None) -> Iterator[bytes]:
+        """Encrypts an iterable of plaintext chunks, yielding ciphertext as frames fill up"""
+        stream = self.encryptor(codec)
+        for chunk in chunks:
+            data = stream.update(chunk)
+            if data:
+                yield data
+        yield stream.finalize()
+    
+    def decrypt_stream(self, chunks: Iterable[bytes], encoder: Optional[GzipEncoder] = None) -> Iterator[bytes]:
+        """
+        Decrypts an iterable of ciphertext chunks, yielding plaintext frame by frame
+        (gzip-encoded with an encoder, for streams compressed with zlib)
+        Legacy CBC content is buffered and decrypted in one piece
+        """
+        chunks = iter(chunks)
+        
+        # Read enough bytes to detect the format
+        head = bytearray()
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= len(FRAME_MAGIC):
+                break
+        
+        if not is_framed(head):
+            yield self.decrypt(bytes(head) + b"".join(bytes(c) for c in chunks))
+            return
+        
+        stream = self.decryptor(encoder)
+        data = stream.update(head)
+        if data:
+            yield data
+        for chunk in chunks:
+            data = stream.update(chunk)
+            if data:
+                yield data
+        yield stream.finalize()
+    
+    def decrypt_range(
+        self,
+        read: Callable[[int, int], bytes],
+        plaintext_size: int,
+        start: int,
+        end: int
+    ) -> Iterator[bytes]:
+        """
+        Decrypts plaintext bytes start..end (inclusive) of a segmented stream
+        Only the frames covering the range are read and authenticated; in a
+        compressed stream the frames before them are skipped by their length.
+        read(offset, length) returns bytes of the stored ciphertext.
+        """
+        head = read(0, COMPRESSED_HEADER_SIZE)
+        stream = parse_stream_header(head)
+        header = head[:stream.size]
+        frame_size = stream.frame_size
+        record_size = NONCE_SIZE + frame_size + TAG_SIZE
+        last_index = frame_count(plaintext_size, frame_size) - 1
+        first, last = start // frame_size, end // frame_size
+        
+        offset = stream.size
+        if stream.codec is None:
+            offset += first * record_size
+        else:
+            for _ in range(first):
+                (length,) = struct.unpack(LENGTH_FORMAT, read(offset, LENGTH_SIZE))
+                offset += LENGTH_SIZE + length
+        
+        for index in range(first, last + 1):
+            if stream.codec is None:
+                record = read(offset, record_size)
+                offset += record_size
+            else:
+                (length,) = struct.unpack(LENGTH_FORMAT, read(offset, LENGTH_SIZE))
+                record = read(offset + LENGTH_SIZE, length)
+                offset += LENGTH_SIZE + length
+            # The final flag is authenticated and frame lengths are checked,
+            # so a wrong plaintext_size fails instead of returning short data
+            plaintext = self.open_frame(header, index, record, final=index == last_index)
+            frame_start = index * frame_size
+            if len(plaintext) != min(frame_size, plaintext_size - frame_start):
+                raise ValueError("Plaintext size does not match the encrypted stream")
+            yield plaintext[max(start - frame_start, 0):end - frame_start + 1]
+    
+    def encrypt_file(self, file_content: bytes, codec: Optional[Codec] = None) -> bytes:
         """Encrypts file content"""
-        return self.encrypt(file_content)
+        return b"".join(self.encrypt_stream(iter_chunks(file_content, self.frame_size), codec))
     
     def decrypt_file(self, encrypted_content: bytes) -> bytes:
-        """Decrypts file content"""
-        return self.decrypt(encrypted_content)
+        """Decrypts file content (segmented or legacy CBC)"""
+        if not is_framed(encrypted_content):
+            return self.decrypt(encrypted_content)
+        return b"".join(self.decrypt_stream(iter_chunks(encrypted_content)))
+
+
+class DataKey(NamedTuple):
+    """A document's data key, and the form it is stored in"""
+    key: bytes  # Plaintext data key (never stored)
+    wrapped: bytes  # Data key wrapped by a master key (AES key wrap, RFC 3394)
+    version: int  # Version of that master key
+
+
+class KeyRing:
+    """
+    Versioned master keys for envelope encryption
+    Every document is encrypted with its own random data key; only the data
+    key, wrapped by the active master key, is stored with the document.
+    Rotating the master key re-wraps these 40-byte keys, never the content.
+    """
+    
+    def __init__(self, keys: Dict[int, str], active_version: int, frame_size: int = FRAME_SIZE):
+        if active_version not in keys:
+            raise ValueError(f"Unknown active encryption key version: {active_version}")
+        self._masters = {version: DocumentEncryption(key, frame_size) for version, key in keys.items()}
+        self.active_version = active_version
+        self.frame_size = frame_size
+    
+    @property
+    def versions(self) -> Tuple[int, ...]:
+        return tuple(sorted(self._masters))
+    
+    def master(self, version: int) -> DocumentEncryption:
+        """Encryption with master key `version` (documents from before envelope encryption)"""
+        if version not in self._masters:
+            raise ValueError(f"Unknown encryption key version: {version}")
+        return self._masters[version]
+    
+    def generate(self) -> DataKey:
+        """Creates a random data key, wrapped by the active master key"""
+        key = os.urandom(DATA_KEY_SIZE)
+        return DataKey(key, self.wrap(key), self.active_version)
+    
+    def wrap(self, key: bytes, version: Optional[int] = None) -> bytes:
+        """Wraps a data key with master key `version` (default: the active one)"""
+        version = self.active_version if version is None else version
+        return aes_key_wrap(self.master(version).key, key)
+    
+    def unwrap(self, wrapped: bytes, version: int) -> bytes:
+        """Recovers a data key wrapped by master key `version`"""
+        try:
+            return aes_key_unwrap(self.master(version).key, bytes(wrapped))
+        except InvalidUnwrap:
+            raise ValueError(f"Data key was not wrapped by encryption key version {version}")
+    
+    def rewrap(self, wrapped: bytes, version: int) -> bytes:
+        """Wraps a data key wrapped by master key `version` with the active master key"""
+        return self.wrap(self.unwrap(wrapped, version))
+    
+    def document_encryption(self, wrapped: Optional[bytes], version: Optional[int]) -> DocumentEncryption:
+        """
+        Encryption of a document from its stored key: the unwrapped data key, or
+        the master key itself for documents without one (older versions)
+        """
+        if wrapped is None:
+            return self.master(LEGACY_KEY_VERSION if version is None else version)
+        return DocumentEncryption(self.unwrap(wrapped, version), self.frame_size)
+
 
+def get_key_ring() -> KeyRing:
+    """Creates the key ring configured in settings (ENCRYPTION_KEY is version 0)"""
+    keys = {LEGACY_KEY_VERSION: settings.ENCRYPTION_KEY, **settings.ENCRYPTION_KEYS}
+    return KeyRing(keys, settings.ENCRYPTION_KEY_VERSION)
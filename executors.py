@@ -0,0 +1,122 @@
+"""
+Bounded worker pools for CPU-heavy work called from async endpoints
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a pool's wait queue is full"""
+    
+    def __init__(self, name: str):
+        super().__init__(f"{name} pool is saturated")
+        self.name = name
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a fixed number of workers and a bounded wait queue
+    At most `max_workers` calls run at once; up to `max_queue` more wait for a
+    worker, and calls beyond that are rejected with ExecutorSaturated.
+    With max_workers <= 0 calls run inline (blocking the caller).
+    """
+    
+    def __init__(self, name: str, max_workers: int, max_queue: Optional[int] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        if max_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+    
+    def _call(self, fn: Callable, args: tuple) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+    
+    def admit(self) -> None:
+        """
+        Raises ExecutorSaturated if a call would be rejected now, for work that
+        must be refused before a side effect it can't undo (e.g. counting a view)
+        """
+        with self._lock:
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name)
+    
+    async def run(self, fn: Callable, *args, reject: bool = True) -> Any:
+        """
+        Runs fn(*args) on the pool and waits for the result
+        With reject=False the call waits even when the queue is full (for work
+        that can't be refused anymore, e.g. the rest of a streamed response)
+        """
+        with self._lock:
+            if reject and self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name)
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        
+        if self._executor is None:
+            return self._call(fn, args)
+        
+        future = self._executor.submit(self._call, fn, args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A call that never started must not stay counted as queued
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+    
+    async def iterate(self, chunks: Iterator[bytes], batch_size: int, reject: bool = True) -> AsyncIterator[bytes]:
+        """
+        Drains a blocking iterator of bytes on the pool, about `batch_size`
+        bytes per hop. Only the first hop can be rejected, and none with
+        reject=False.
+        """
+        def next_batch() -> bytes:
+            batch = bytearray()
+            for chunk in chunks:
+                batch += chunk
+                if len(batch) >= batch_size:
+                    break
+            return bytes(batch)
+        
+        while True:
+            batch = await self.run(next_batch, reject=reject)
+            if not batch:
+                return
+            reject = False
+            yield batch
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+    
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
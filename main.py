@@ -1,28 +1,66 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request, Query
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, and_, case, select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Tuple, Iterator, AsyncIterator
+import asyncio
 import base64
-import io
+import json
+import re
+import secrets
+import time
 
-from database import get_db, init_db
-from models import User, Document
-from auth import authenticate_user, create_access_token, get_current_user, get_password_hash
-from encryption import DocumentEncryption
+from database import get_async_db, init_db, async_engine
+from models import User, Document, UploadSession, UploadChunk
+from auth import authenticate_user_async, create_access_token, create_resume_token, decode_resume_token, get_current_user, get_password_hash, invalidate_user, token_claims, Principal, password_executor, principal_cache
+from encryption import DocumentEncryption, encrypted_size, get_key_ring, iter_chunks
+from compression import GzipEncoder, choose_codec, default_codec, get_codec
+from dedup import ContentHasher, DedupStats, content_digest, piece_hasher
+from archive import stream_zip
+from storage import get_blob_store
+from reaper import release_reaper_lease, run_reaper
+from coordination import INVALIDATION_RETENTION_SECONDS, run_invalidation_listener
+from executors import BoundedExecutor, ExecutorSaturated
+from assets import AssetStore, Resource, REVALIDATE
+from metrics import REGISTRY, MetricsMiddleware, bytes_received, cache_collector, dedup_collector, metered, pool_collector, record_crypto, streamed, transfer
 from config import settings
 from pydantic import BaseModel
 
 app = FastAPI(title="Briefcase - Secure Document Delivery System")
 
-# Initialize encryption
-encryptor = DocumentEncryption(settings.ENCRYPTION_KEY)
+# Initialize encryption and blob storage
+key_ring = get_key_ring()
+compression_codec = default_codec()
+blob_store = get_blob_store()
+dedup_stats = DedupStats()
+# AES runs here instead of on the event loop (cryptography releases the GIL)
+crypto_executor = BoundedExecutor(
+    "crypto",
+    max_workers=settings.CRYPTO_WORKERS,
+    max_queue=settings.CRYPTO_MAX_QUEUE
+)
 
-# Templates and static files
+# Per-route latency and pool occupancy for /metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    REGISTRY.on_collect(pool_collector(crypto_executor, password_executor))
+    REGISTRY.on_collect(cache_collector(principal_cache))
+    REGISTRY.on_collect(dedup_collector(dedup_stats))
+
+# Templates and static files, loaded once: assets under content-hashed URLs,
+# pages rendered at import (they carry no per-request data)
+assets = AssetStore("static")
 templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+templates.env.globals["asset_url"] = assets.url
+pages = {
+    name: Resource(templates.get_template(name).render().encode(), "text/html; charset=utf-8")
+    for name in ("index.html", "dashboard.html")
+}
 
 
 # Pydantic schemas
@@ -37,6 +75,15 @@ class TokenResponse(BaseModel):
     user: dict
 
 
+class UploadSessionRequest(BaseModel):
+    filename: str
+    recipient_id: Optional[int] = None
+    recipient_ids: Optional[List[int]] = None
+    size: int
+    view_limit: Optional[int] = None
+    expires_in_days: Optional[int] = None
+
+
 class DocumentResponse(BaseModel):
     id: int
     filename: str
@@ -58,8 +105,8 @@ class DocumentResponse(BaseModel):
 # Dependency to get current user from token
 async def get_current_user_dependency(
     request: Request,
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(
@@ -67,7 +114,7 @@ async def get_current_user_dependency(
             detail="Not authenticated"
         )
     
-    user = get_current_user(db, token)
+    user = await get_current_user(db, token)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -77,23 +124,66 @@ async def get_current_user_dependency(
     return user
 
 
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    """A saturated worker pool means the server is overloaded: ask the client to retry"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
-    init_db()
+    await run_in_threadpool(init_db)
     print("✅ Database initialized")
+    
+    if settings.REAPER_ENABLED:
+        app.state.reaper_task = asyncio.create_task(
+            run_reaper(
+                blob_store, settings.REAPER_INTERVAL_SECONDS, settings.REAPER_BATCH_SIZE,
+                purge_grace=settings.DOWNLOAD_RESUME_WINDOW_SECONDS,
+                upload_ttl=settings.UPLOAD_SESSION_TTL_SECONDS,
+                invalidation_retention=INVALIDATION_RETENTION_SECONDS,
+                lease_seconds=settings.REAPER_LEASE_SECONDS
+            )
+        )
+    
+    # Users changed through other worker processes
+    if settings.WORKERS > 1:
+        app.state.invalidation_task = asyncio.create_task(
+            run_invalidation_listener(invalidate_user, settings.USER_INVALIDATION_POLL_SECONDS)
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks"""
+    reaper_task = getattr(app.state, "reaper_task", None)
+    if reaper_task:
+        reaper_task.cancel()
+        # Another worker takes over at its next pass instead of when the lease expires
+        await run_in_threadpool(release_reaper_lease)
+    invalidation_task = getattr(app.state, "invalidation_task", None)
+    if invalidation_task:
+        invalidation_task.cancel()
+    password_executor.shutdown()
+    crypto_executor.shutdown()
+    await async_engine.dispose()
 
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Main page - shows login or redirects to dashboard"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return pages["index.html"].response(request, REVALIDATE)
 
 
 @app.post("/api/login")
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Login endpoint - returns JWT token"""
-    user = authenticate_user(db, login_data.email, login_data.password)
+    user = await authenticate_user_async(db, login_data.email, login_data.password)
     
     if not user:
         raise HTTPException(
@@ -101,7 +191,7 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             detail="Incorrect email or password"
         )
     
-    access_token = create_access_token(data={"sub": str(user.id)})
+    access_token = create_access_token(data=token_claims(user))
     
     return JSONResponse(
         content={
@@ -126,7 +216,7 @@ async def logout():
 
 
 @app.get("/api/me")
-async def get_me(current_user: User = Depends(get_current_user_dependency)):
+async def get_me(current_user: Principal = Depends(get_current_user_dependency)):
     """Gets current user information"""
     return {
         "id": current_user.id,
@@ -137,199 +227,1266 @@ async def get_me(current_user: User = Depends(get_current_user_dependency)):
 
 @app.get("/api/users")
 async def list_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dependency)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
 ):
     """Lists all users (to select recipient)"""
-    users = db.query(User).filter(User.id != current_user.id).all()
+    users = (await db.execute(
+        select(User.id, User.username, User.email).where(User.id != current_user.id)
+    )).all()
     return [
         {"id": u.id, "username": u.username, "email": u.email}
         for u in users
     ]
 
 
+def encrypt_into(stream, writer, chunk: bytes, hasher=None) -> None:
+    """Encrypts (and hashes) a batch of plaintext and writes it to the blob (runs on the crypto pool)"""
+    if hasher:
+        hasher.update(chunk)
+    started = time.perf_counter()
+    data = stream.update(chunk)
+    record_crypto("encrypt", len(chunk), time.perf_counter() - started)
+    writer.write(data)
+
+
+def finish_blob(stream, writer):
+    """Seals the final frame and commits the blob (runs on the crypto pool)"""
+    started = time.perf_counter()
+    data = stream.finalize()
+    record_crypto("encrypt", 0, time.perf_counter() - started)
+    writer.write(data)
+    return writer.commit()
+
+
+def document_encryption(row) -> DocumentEncryption:
+    """Encryption of a document or upload session, from its wrapped data key"""
+    return key_ring.document_encryption(row.wrapped_key, row.key_version)
+
+
+async def prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def resolve_recipients(
+    db: AsyncSession,
+    recipient_id: Optional[int],
+    recipient_ids: Optional[List[int]]
+) -> List[int]:
+    """
+    Recipients of an upload (recipient_id and/or recipient_ids), in order and
+    without repeats; all of them must exist
+    """
+    recipients = list(dict.fromkeys(([recipient_id] if recipient_id is not None else []) + (recipient_ids or [])))
+    if not recipients:
+        raise HTTPException(status_code=400, detail="At least one recipient is required")
+    if len(recipients) > settings.MAX_RECIPIENTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.MAX_RECIPIENTS} recipients per document")
+    
+    found = set(await db.scalars(select(User.id).where(User.id.in_(recipients))))
+    if len(found) < len(recipients):
+        raise HTTPException(status_code=404, detail="Recipient not found")
+    return recipients
+
+
+# Columns describing the stored content of a document (shared by the documents
+# of an upload, and by deduplicated uploads)
+CONTENT_COLUMNS = (
+    Document.blob_key,
+    Document.blob_size,
+    Document.blob_digest,
+    Document.plaintext_size,
+    Document.compression,
+    Document.wrapped_key,
+    Document.key_version
+)
+
+
+def stored_content(blob, plaintext_size: int, codec, wrapped_key: bytes, key_version: int) -> dict:
+    """CONTENT_COLUMNS values of an uploaded blob"""
+    return {
+        "blob_key": blob.key,
+        "blob_size": blob.size,
+        "blob_digest": blob.digest,
+        "plaintext_size": plaintext_size,
+        "compression": codec.name if codec else None,
+        "wrapped_key": wrapped_key,
+        "key_version": key_version,
+    }
+
+
+async def find_duplicate(db: AsyncSession, sender_id: int, digest: str) -> Optional[dict]:
+    """
+    CONTENT_COLUMNS of a live document of the sender with the same content
+    The blob outlives it by the purge grace period, longer than it takes to
+    commit the documents that reuse it.
+    """
+    duplicate = (await db.execute(
+        select(*CONTENT_COLUMNS).where(
+            Document.sender_id == sender_id,
+            Document.content_digest == digest,
+            Document.is_deleted == False,
+            Document.blob_key != None
+        ).limit(1)
+    )).first()
+    return dict(duplicate._mapping) if duplicate else None
+
+
+async def deduplicate(
+    db: AsyncSession,
+    sender_id: int,
+    content: dict,
+    digest: Optional[str],
+    pending: Optional[dict] = None
+) -> dict:
+    """
+    Content to store for an upload: that of a live document of the sender with
+    the same digest if there is one (the upload's new blob is then deleted),
+    else the upload's own. `pending` maps digests to the content of uploads of
+    the same request that are not committed yet.
+    """
+    if digest is None:
+        return content
+    
+    duplicate = (pending or {}).get(digest) or await find_duplicate(db, sender_id, digest)
+    if duplicate:
+        await run_in_threadpool(blob_store.delete, content["blob_key"])
+    elif pending is not None:
+        pending[digest] = content
+    dedup_stats.record(content["blob_size"], duplicate is not None)
+    return duplicate or content
+
+
+def new_documents(
+    filename: str,
+    content: dict,
+    digest: Optional[str],
+    sender_id: int,
+    recipient_ids: List[int],
+    view_limit: Optional[int],
+    expires_in_days: Optional[int]
+) -> List[Document]:
+    """
+    Builds the Document rows of an uploaded blob, one per recipient
+    The rows share the blob (`content`, see CONTENT_COLUMNS); each keeps its
+    own view count, limit and expiry
+    """
+    # Calculate expiration date
+    expires_at = None
+    if expires_in_days and expires_in_days > 0:
+        expires_at = datetime.utcnow() + timedelta(days=expires_in_days)
+    
+    return [
+        Document(
+            filename=filename,
+            content_digest=digest,
+            sender_id=sender_id,
+            recipient_id=recipient_id,
+            view_limit=view_limit if view_limit and view_limit > 0 else None,
+            expires_at=expires_at,
+            **content
+        )
+        for recipient_id in recipient_ids
+    ]
+
+
+def upload_result(documents: List[Document]) -> dict:
+    return {
+        "message": "Document uploaded successfully",
+        "document_id": documents[0].id,
+        "document_ids": [document.id for document in documents],
+        "filename": documents[0].filename
+    }
+
+
 @app.post("/api/documents/upload")
 async def upload_document(
     file: UploadFile = File(...),
-    recipient_id: int = Form(...),
+    recipient_id: Optional[int] = Form(None),
+    recipient_ids: List[int] = Form([]),
     view_limit: Optional[int] = Form(None),
     expires_in_days: Optional[int] = Form(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dependency)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
 ):
     """
-    Uploads an encrypted document and assigns it to a recipient
+    Uploads an encrypted document and delivers it to one or more recipients
+    (recipient_id and/or repeated recipient_ids fields). The file is encrypted
+    and stored once, whatever the number of recipients.
     """
-    # Validate recipient
-    recipient = db.query(User).filter(User.id == recipient_id).first()
-    if not recipient:
-        raise HTTPException(status_code=404, detail="Recipient not found")
+    recipients = await resolve_recipients(db, recipient_id, recipient_ids)
+    # Don't hold a pooled connection while the file is encrypted
+    await db.close()
     
-    # Read file content
-    file_content = await file.read()
+    stored, digest = await store_upload(file, current_user.id)
+    try:
+        # Same content already stored for this sender: keep that blob
+        content = await deduplicate(db, current_user.id, stored, digest)
+        
+        documents = new_documents(
+            file.filename, content, digest, current_user.id, recipients, view_limit, expires_in_days
+        )
+        db.add_all(documents)
+        await db.commit()
+    except BaseException:
+        # Nothing was delivered: drop the new blob (already gone if it was a duplicate)
+        await db.rollback()
+        await run_in_threadpool(blob_store.delete, stored["blob_key"])
+        raise
     
-    # Encrypt content
-    encrypted_content = encryptor.encrypt_file(file_content)
+    return upload_result(documents)
+
+
+@app.post("/api/documents/upload/batch")
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    recipient_id: Optional[int] = Form(None),
+    recipient_ids: List[int] = Form([]),
+    view_limit: Optional[int] = Form(None),
+    expires_in_days: Optional[int] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Uploads several documents (repeated files fields) in one request, each
+    delivered to every recipient. The documents are committed in a single
+    transaction: either every file is delivered or none is.
+    """
+    if len(files) > settings.MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.MAX_BATCH_FILES} files per request")
+    recipients = await resolve_recipients(db, recipient_id, recipient_ids)
+    # Don't hold a pooled connection while the files are encrypted
+    await db.close()
     
-    # Calculate expiration date
-    expires_at = None
-    if expires_in_days and expires_in_days > 0:
-        expires_at = datetime.utcnow() + timedelta(days=expires_in_days)
+    stored = []
+    try:
+        for file in files:
+            stored.append(await store_upload(file, current_user.id))
+        
+        pending = {}
+        results = []
+        for file, (content, digest) in zip(files, stored):
+            content = await deduplicate(db, current_user.id, content, digest, pending)
+            documents = new_documents(
+                file.filename, content, digest, current_user.id, recipients, view_limit, expires_in_days
+            )
+            db.add_all(documents)
+            results.append(documents)
+        await db.commit()
+    except BaseException:
+        # Nothing was delivered: drop the new blobs (missing ones are ignored)
+        await db.rollback()
+        for content, _ in stored:
+            await run_in_threadpool(blob_store.delete, content["blob_key"])
+        raise
+    
+    return {
+        "message": f"{len(files)} documents uploaded successfully",
+        "uploads": [upload_result(documents) for documents in results]
+    }
+
+
+async def store_upload(file: UploadFile, sender_id: int) -> Tuple[dict, Optional[str]]:
+    """
+    Encrypts an uploaded file into a new blob; returns its content (see
+    CONTENT_COLUMNS) and, with deduplication on, its digest
+    """
+    # Encrypt content batch by batch on the crypto pool, straight from the upload
+    # spool into the blob store. One batch in flight per upload is the backpressure.
+    data_key = key_ring.generate()
+    encryption = DocumentEncryption(data_key.key)
+    frame_size = encryption.frame_size
+    batch_size = max(frame_size, settings.CRYPTO_BATCH_SIZE // frame_size * frame_size)
+    chunk = await file.read(batch_size)
+    # Files in an already-compressed format (sniffed from their first bytes) are not compressed
+    codec = choose_codec(chunk, compression_codec)
+    stream = encryption.encryptor(codec)
+    # Hashed in upload chunk pieces, like chunked uploads, so both can match
+    hasher = ContentHasher(sender_id, upload_chunk_size()) if settings.DEDUP_ENABLED else None
+    plaintext_size = 0
+    with transfer("upload"), blob_store.writer() as writer:
+        while chunk:
+            # Only the first batch may be refused (503); later ones wait, so a
+            # saturated pool never cuts off an upload that has started
+            await crypto_executor.run(encrypt_into, stream, writer, chunk, hasher, reject=plaintext_size == 0)
+            plaintext_size += len(chunk)
+            bytes_received.inc(len(chunk))
+            chunk = await file.read(batch_size)
+        blob = await crypto_executor.run(finish_blob, stream, writer, reject=plaintext_size == 0)
+    
+    content = stored_content(blob, plaintext_size, codec, data_key.wrapped, data_key.version)
+    return content, hasher.hexdigest() if hasher else None
+
+
+def upload_chunk_size() -> int:
+    """Plaintext bytes per upload chunk: whole frames, so each chunk is sealed on its own"""
+    frame_size = key_ring.frame_size
+    return max(frame_size, settings.UPLOAD_CHUNK_SIZE // frame_size * frame_size)
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    """Number of chunks of an upload (an empty file is sent as one empty chunk)"""
+    return max(1, -(-size // chunk_size))
+
+
+def seal_into(encryption: DocumentEncryption, writer, first_index: int, chunk: bytes, codec, hasher=None) -> None:
+    """Encrypts (and hashes) frame-aligned plaintext of an upload chunk into its part (runs on the crypto pool)"""
+    if hasher:
+        hasher.update(chunk)
+    started = time.perf_counter()
+    data = encryption.seal_frames(first_index, chunk, final=False, codec=codec)
+    record_crypto("encrypt", len(chunk), time.perf_counter() - started)
+    writer.write(data)
+
+
+def finish_part(encryption: DocumentEncryption, writer, first_index: int, chunk: bytes, final: bool, codec, hasher=None):
+    """Seals the end of an upload chunk and commits its part (runs on the crypto pool)"""
+    if hasher:
+        hasher.update(chunk)
+    started = time.perf_counter()
+    data = encryption.seal_frames(first_index, chunk, final, codec)
+    record_crypto("encrypt", len(chunk), time.perf_counter() - started)
+    writer.write(data)
+    return writer.commit()
+
+
+def format_upload(upload: UploadSession, received: List[int]) -> dict:
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": chunk_count(upload.size, upload.chunk_size),
+        "received": received
+    }
+
+
+async def owned_upload(db: AsyncSession, upload_id: str, user_id: int) -> UploadSession:
+    """Loads an upload session of the current user"""
+    upload = await db.scalar(
+        select(UploadSession).where(UploadSession.id == upload_id, UploadSession.sender_id == user_id)
+    )
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+async def received_chunks(db: AsyncSession, upload_id: str) -> List[int]:
+    return list(await db.scalars(
+        select(UploadChunk.chunk_index)
+        .where(UploadChunk.upload_id == upload_id)
+        .order_by(UploadChunk.chunk_index)
+    ))
+
+
+async def discard_upload(db: AsyncSession, upload_id: str) -> None:
+    """Deletes the rows of an upload session (not committed); its staged parts stay"""
+    await db.execute(delete(UploadChunk).where(UploadChunk.upload_id == upload_id))
+    await db.execute(
+        delete(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def release_upload(db: AsyncSession, upload_id: str) -> None:
+    """Gives up the claim of a complete request that failed"""
+    await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .values(is_completing=False)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+@app.post("/api/uploads")
+async def create_upload(
+    upload_data: UploadSessionRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Starts a chunked upload
+    Send every chunk with PUT /api/uploads/{id}/chunks/{index} (in any order,
+    in parallel, retrying as needed), then POST /api/uploads/{id}/complete
+    """
+    if upload_data.size < 0 or not upload_data.filename:
+        raise HTTPException(status_code=400, detail="Invalid file name or size")
+    
+    recipients = await resolve_recipients(db, upload_data.recipient_id, upload_data.recipient_ids)
+    # Every chunk is encrypted with the data key of the future document
+    data_key = key_ring.generate()
     
-    # Create document in database
-    document = Document(
-        filename=file.filename,
-        encrypted_content=encrypted_content,
+    upload = UploadSession(
+        id=secrets.token_urlsafe(24),
+        filename=upload_data.filename,
         sender_id=current_user.id,
-        recipient_id=recipient_id,
-        view_limit=view_limit if view_limit and view_limit > 0 else None,
-        expires_at=expires_at
+        recipient_id=recipients[0],
+        recipient_ids=recipients,
+        size=upload_data.size,
+        chunk_size=upload_chunk_size(),
+        # Chunks arrive in any order, so the format can't be sniffed: frames that
+        # don't compress are stored as they are
+        compression=compression_codec.name if compression_codec else None,
+        wrapped_key=data_key.wrapped,
+        key_version=data_key.version,
+        view_limit=upload_data.view_limit,
+        expires_in_days=upload_data.expires_in_days
     )
+    db.add(upload)
+    await db.commit()
     
-    db.add(document)
-    db.commit()
-    db.refresh(document)
+    return format_upload(upload, [])
+
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """Returns the state of a chunked upload (received chunks), to resume it"""
+    upload = await owned_upload(db, upload_id, current_user.id)
+    return format_upload(upload, await received_chunks(db, upload_id))
+
+
+@app.put("/api/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Receives one chunk of a chunked upload (raw request body)
+    The chunk is encrypted as it streams in and staged. Sending a chunk
+    again replaces it, so an interrupted chunk is simply retried.
+    """
+    upload = await owned_upload(db, upload_id, current_user.id)
+    if upload.is_completing:
+        raise HTTPException(status_code=409, detail="Upload is being completed")
+    
+    count = chunk_count(upload.size, upload.chunk_size)
+    if not 0 <= index < count:
+        raise HTTPException(status_code=400, detail="Invalid chunk index")
+    expected = min(upload.chunk_size, upload.size - index * upload.chunk_size)
+    # Don't hold a pooled connection while the chunk is received
+    await db.close()
+    
+    # Frames are numbered across the whole file, so the parts join into one stream
+    codec = get_codec(upload.compression)
+    encryption = document_encryption(upload)
+    frame_size = encryption.frame_size
+    first_index = index * upload.chunk_size // frame_size
+    batch_size = max(frame_size, settings.CRYPTO_BATCH_SIZE // frame_size * frame_size)
+    hasher = piece_hasher() if settings.DEDUP_ENABLED else None
+    received = 0
+    buffer = bytearray()
+    # Only the first pool hop may be refused (503): a started chunk is not cut off
+    started = False
+    with transfer("upload"), blob_store.part_writer(upload_id, index) as writer:
+        async for data in request.stream():
+            received += len(data)
+            bytes_received.inc(len(data))
+            if received > expected:
+                raise HTTPException(status_code=413, detail=f"Chunk {index} must be {expected} bytes")
+            buffer += data
+            
+            # Seal whole batches as they arrive; the end of the chunk is kept back
+            # because the last chunk ends with the final frame
+            while len(buffer) > batch_size or (len(buffer) == batch_size and received < expected):
+                batch = bytes(buffer[:batch_size])
+                del buffer[:batch_size]
+                await crypto_executor.run(
+                    seal_into, encryption, writer, first_index, batch, codec, hasher, reject=not started
+                )
+                started = True
+                first_index += batch_size // frame_size
+        
+        if received != expected:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes")
+        await crypto_executor.run(
+            finish_part, encryption, writer, first_index, bytes(buffer), index == count - 1, codec, hasher,
+            reject=not started
+        )
+    digest = hasher.hexdigest() if hasher else None
+    
+    # Record the chunk, unless the upload was completed or discarded meanwhile
+    touched = await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id, UploadSession.is_completing == False)
+        .values(updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if touched.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Upload is no longer accepting chunks")
+    
+    known = await db.scalar(
+        select(UploadChunk.chunk_index).where(
+            UploadChunk.upload_id == upload_id,
+            UploadChunk.chunk_index == index
+        )
+    )
+    if known is None:
+        db.add(UploadChunk(upload_id=upload_id, chunk_index=index, digest=digest))
+    else:
+        # The retried chunk replaced the staged part
+        await db.execute(
+            update(UploadChunk)
+            .where(UploadChunk.upload_id == upload_id, UploadChunk.chunk_index == index)
+            .values(digest=digest)
+            .execution_options(synchronize_session=False)
+        )
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry of the same chunk recorded it first
+        await db.rollback()
+    
+    return {"upload_id": upload_id, "index": index, "size": received}
+
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Assembles the staged chunks of an upload into a blob and creates the document
+    """
+    upload = await owned_upload(db, upload_id, current_user.id)
+    count = chunk_count(upload.size, upload.chunk_size)
+    missing = count - len(await received_chunks(db, upload_id))
+    if missing:
+        raise HTTPException(status_code=409, detail=f"{missing} chunks are missing")
+    
+    # The chunk digests combine into the file's digest (chunks sent while
+    # deduplication was off have none)
+    digest = None
+    if settings.DEDUP_ENABLED:
+        digests = list(await db.scalars(
+            select(UploadChunk.digest).where(UploadChunk.upload_id == upload_id).order_by(UploadChunk.chunk_index)
+        ))
+        if None not in digests:
+            digest = content_digest(current_user.id, upload.chunk_size, (bytes.fromhex(d) for d in digests))
+    
+    # Claim the upload: one request completes it, and no chunk changes meanwhile
+    claimed = await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id, UploadSession.is_completing == False)
+        .values(is_completing=True, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if claimed.rowcount == 0:
+        raise HTTPException(status_code=409, detail="Upload is being completed")
+    
+    # Same content already stored for this sender: the chunks are not assembled
+    content = await find_duplicate(db, current_user.id, digest) if digest else None
+    # Don't hold a pooled connection while the blob is assembled
+    await db.close()
+    
+    if content is None:
+        codec = get_codec(upload.compression)
+        encryption = document_encryption(upload)
+        try:
+            blob = await run_in_threadpool(blob_store.assemble, upload_id, count, encryption.frame_header(codec))
+        except Exception:
+            await release_upload(db, upload_id)
+            raise HTTPException(status_code=500, detail="Error assembling upload")
+        # Compressed blobs have no predictable size; their frames are checked on download
+        if codec is None and blob.size != encrypted_size(upload.size, encryption.frame_size):
+            await run_in_threadpool(blob_store.delete, blob.key)
+            await release_upload(db, upload_id)
+            raise HTTPException(status_code=500, detail="Error assembling upload")
+        content = stored_content(blob, upload.size, codec, upload.wrapped_key, upload.key_version)
+        if digest:
+            dedup_stats.record(blob.size, False)
+    else:
+        dedup_stats.record(content["blob_size"], True)
+    
+    documents = new_documents(
+        upload.filename, content, digest, current_user.id,
+        upload.recipient_ids or [upload.recipient_id], upload.view_limit, upload.expires_in_days
+    )
+    db.add_all(documents)
+    await discard_upload(db, upload_id)
+    await db.commit()
+    await run_in_threadpool(blob_store.discard_parts, upload_id)
+    
+    return upload_result(documents)
+
+
+@app.delete("/api/uploads/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """Cancels a chunked upload and discards its staged chunks"""
+    await owned_upload(db, upload_id, current_user.id)
+    
+    # Locked, so no chunk or complete request changes it meanwhile
+    open_upload = await db.scalar(
+        select(UploadSession.id)
+        .where(UploadSession.id == upload_id, UploadSession.is_completing == False)
+        .with_for_update()
+    )
+    if open_upload is None:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Upload is being completed")
+    await discard_upload(db, upload_id)
+    await db.commit()
+    await run_in_threadpool(blob_store.discard_parts, upload_id)
+    
+    return {"message": "Upload cancelled"}
+
+
+# User aliases for the two joins of the listing query
+Sender = aliased(User)
+Recipient = aliased(User)
+
+
+def document_listing_query():
+    """
+    Selects exactly the columns the listings serialize, usernames included,
+    in one statement (no per-document lazy loads of sender/recipient)
+    """
+    return select(
+        Document.id,
+        Document.filename,
+        Document.sender_id,
+        Sender.username.label("sender_username"),
+        Document.recipient_id,
+        Recipient.username.label("recipient_username"),
+        Document.view_limit,
+        Document.view_count,
+        Document.expires_at,
+        Document.created_at
+    ).join(
+        Sender, Document.sender_id == Sender.id
+    ).join(
+        Recipient, Document.recipient_id == Recipient.id
+    )
+
+
+def format_document(doc, now: datetime) -> dict:
+    """Serializes a row of document_listing_query"""
+    is_expired = doc.expires_at and doc.expires_at <= now
+    is_limit_reached = doc.view_limit and doc.view_count >= doc.view_limit
     
     return {
-        "message": "Document uploaded successfully",
-        "document_id": document.id,
-        "filename": document.filename
+        "id": doc.id,
+        "filename": doc.filename,
+        "sender_id": doc.sender_id,
+        "sender_username": doc.sender_username,
+        "recipient_id": doc.recipient_id,
+        "recipient_username": doc.recipient_username,
+        "view_limit": doc.view_limit,
+        "view_count": doc.view_count,
+        "expires_at": doc.expires_at.isoformat() if doc.expires_at else None,
+        "created_at": doc.created_at.isoformat(),
+        "is_expired": is_expired,
+        "is_limit_reached": is_limit_reached
+    }
+
+
+def encode_cursor(doc) -> str:
+    """Encodes the keyset position (created_at, id) of a document"""
+    raw = json.dumps([doc.created_at.isoformat(), doc.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Decodes a cursor produced by encode_cursor"""
+    try:
+        created_at, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(document_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def list_document_page(
+    db: AsyncSession,
+    owner_column,
+    counterpart_column,
+    owner_id: int,
+    limit: int,
+    cursor: Optional[str],
+    counterpart: Optional[int],
+    filename_prefix: Optional[str],
+    expiring_before: Optional[datetime]
+) -> dict:
+    """
+    Returns one page of live documents, newest first
+    Keyset pagination on (created_at, id): each page is an index range scan
+    """
+    query = document_listing_query().where(
+        owner_column == owner_id,
+        Document.is_deleted == False
+    )
+    
+    if counterpart is not None:
+        query = query.where(counterpart_column == counterpart)
+    if filename_prefix:
+        query = query.where(Document.filename.startswith(filename_prefix, autoescape=True))
+    if expiring_before is not None:
+        query = query.where(Document.expires_at != None, Document.expires_at < expiring_before)
+    
+    if cursor:
+        created_at, document_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Document.created_at < created_at,
+            and_(Document.created_at == created_at, Document.id < document_id)
+        ))
+    
+    # One extra row tells whether there is a next page
+    docs = (await db.execute(
+        query.order_by(Document.created_at.desc(), Document.id.desc()).limit(limit + 1)
+    )).all()
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    
+    now = datetime.utcnow()
+    return {
+        "items": [format_document(doc, now) for doc in docs],
+        "next_cursor": encode_cursor(docs[-1]) if has_more else None
     }
 
 
 @app.get("/api/documents")
 async def list_documents(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dependency)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
 ):
     """
     Lists user documents (sent and received)
-    Applies automatic deletion rules
+    Expired documents are deleted by the background reaper
     """
-    # Delete expired documents or those that reached view limit
     now = datetime.utcnow()
-    expired_docs = db.query(Document).filter(
-        Document.is_deleted == False,
-        ((Document.expires_at != None) & (Document.expires_at <= now))
-    ).all()
-    
-    for doc in expired_docs:
-        doc.is_deleted = True
-    
-    # Documents that reached the limit
-    limit_reached_docs = db.query(Document).filter(
-        Document.is_deleted == False,
-        Document.view_limit != None,
-        Document.view_count >= Document.view_limit
-    ).all()
-    
-    for doc in limit_reached_docs:
-        doc.is_deleted = True
-    
-    db.commit()
     
     # Get sent documents
-    sent_docs = db.query(Document).filter(
+    sent_docs = (await db.execute(document_listing_query().where(
         Document.sender_id == current_user.id,
         Document.is_deleted == False
-    ).all()
+    ))).all()
     
     # Get received documents
-    received_docs = db.query(Document).filter(
+    received_docs = (await db.execute(document_listing_query().where(
         Document.recipient_id == current_user.id,
         Document.is_deleted == False
-    ).all()
-    
-    def format_doc(doc: Document):
-        is_expired = doc.expires_at and doc.expires_at <= now
-        is_limit_reached = doc.view_limit and doc.view_count >= doc.view_limit
-        
-        return {
-            "id": doc.id,
-            "filename": doc.filename,
-            "sender_id": doc.sender_id,
-            "sender_username": doc.sender.username,
-            "recipient_id": doc.recipient_id,
-            "recipient_username": doc.recipient.username,
-            "view_limit": doc.view_limit,
-            "view_count": doc.view_count,
-            "expires_at": doc.expires_at.isoformat() if doc.expires_at else None,
-            "created_at": doc.created_at.isoformat(),
-            "is_expired": is_expired,
-            "is_limit_reached": is_limit_reached
-        }
+    ))).all()
     
     return {
-        "sent": [format_doc(doc) for doc in sent_docs],
-        "received": [format_doc(doc) for doc in received_docs]
+        "sent": [format_document(doc, now) for doc in sent_docs],
+        "received": [format_document(doc, now) for doc in received_docs]
     }
 
 
-@app.get("/api/documents/{document_id}/download")
-# auth_verify(request_user, )
-async def download_document(
-    document_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_dependency)
+@app.get("/api/documents/sent")
+async def list_sent_documents(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    counterpart: Optional[int] = None,
+    filename_prefix: Optional[str] = None,
+    expiring_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
 ):
     """
-    Downloads a document (only if user is sender or recipient)
-    Increments view counter
+    Lists documents sent by the user, one page at a time
+    Filters: recipient (counterpart), filename prefix, expiring before a date
     """
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.is_deleted == False
-    ).first()
+    return await list_document_page(
+        db, Document.sender_id, Document.recipient_id, current_user.id,
+        limit, cursor, counterpart, filename_prefix, expiring_before
+    )
+
+
+@app.get("/api/documents/received")
+async def list_received_documents(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    counterpart: Optional[int] = None,
+    filename_prefix: Optional[str] = None,
+    expiring_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Lists documents received by the user, one page at a time
+    Filters: sender (counterpart), filename prefix, expiring before a date
+    """
+    return await list_document_page(
+        db, Document.recipient_id, Document.sender_id, current_user.id,
+        limit, cursor, counterpart, filename_prefix, expiring_before
+    )
+
+
+async def delete_document(db: AsyncSession, document_id: int) -> None:
+    """Soft-deletes a document"""
+    await db.execute(
+        update(Document)
+        .where(Document.id == document_id)
+        .values(is_deleted=True, deleted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+# Columns a download needs to serve the content
+DOWNLOAD_COLUMNS = (
+    Document.filename,
+    Document.blob_key,
+    Document.blob_size,
+    Document.blob_digest,
+    Document.plaintext_size,
+    Document.compression,
+    Document.wrapped_key,
+    Document.key_version,
+    Document.encrypted_content
+)
+
+# Ranges accepted in one request; more are ignored and the whole file is sent
+MAX_RANGES = 16
+# One range of a Range header: first and last byte, either may be omitted
+# (ASCII digits only: str.isdigit() accepts digits int() can't parse)
+RANGE_SPEC = re.compile(r"([0-9]*)-([0-9]*)")
+
+
+def counted_view(now: datetime, *criteria):
+    """
+    Conditional UPDATE ... RETURNING that counts a view of the documents
+    matching `criteria` that are live, not expired and under their view limit,
+    and returns their id and DOWNLOAD_COLUMNS. Checking and counting in one
+    statement means concurrent downloads can't exceed the limit.
+    """
+    last_view = and_(Document.view_limit != None, Document.view_count + 1 >= Document.view_limit)
+    return (
+        update(Document)
+        .where(
+            *criteria,
+            Document.is_deleted == False,
+            or_(Document.expires_at == None, Document.expires_at > now),
+            or_(Document.view_limit == None, Document.view_count < Document.view_limit)
+        )
+        .values(
+            view_count=Document.view_count + 1,
+            # The last allowed view deletes the document (SET sees the old view_count)
+            is_deleted=case((last_view, True), else_=False),
+            deleted_at=case((last_view, now), else_=Document.deleted_at)
+        )
+        .returning(Document.id, *DOWNLOAD_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def authorize_download(db: AsyncSession, document_id: int, user_id: int, now: datetime):
+    """
+    Checks access to a document and counts the view; returns its DOWNLOAD_COLUMNS
+    Recipient: authorize, check expiry and limit, and count the view in one
+    conditional statement (counted_view)
+    """
+    document = (await db.execute(
+        counted_view(now, Document.id == document_id, Document.recipient_id == user_id)
+    )).first()
+    
+    if document is not None:
+        await db.commit()
+        return document
+    
+    # Not counted: find out why, or serve the sender (who doesn't count views)
+    document = (await db.execute(
+        select(
+            Document.sender_id, Document.recipient_id, Document.expires_at,
+            Document.view_limit, Document.view_count, *DOWNLOAD_COLUMNS
+        ).where(
+            Document.id == document_id,
+            Document.is_deleted == False
+        )
+    )).first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Check permissions: only sender and recipient can access
-    if document.sender_id != current_user.id and document.recipient_id != current_user.id:
+    if document.sender_id != user_id and document.recipient_id != user_id:
         raise HTTPException(status_code=403, detail="You don't have permission to access this document")
     
     # Check if expired
-    if document.expires_at and document.expires_at <= datetime.utcnow():
-        document.is_deleted = True
-        db.commit()
+    if document.expires_at and document.expires_at <= now:
+        await delete_document(db, document_id)
         raise HTTPException(status_code=410, detail="The document has expired")
     
     # Check if reached view limit
     if document.view_limit and document.view_count >= document.view_limit:
-        document.is_deleted = True
-        db.commit()
+        await delete_document(db, document_id)
         raise HTTPException(status_code=410, detail="The document reached the view limit")
     
-    # Increment view counter (only for recipient)
-    if current_user.id == document.recipient_id:
-        document.view_count += 1
+    return document
+
+
+async def resumable_document(
+    db: AsyncSession,
+    request: Request,
+    token: str,
+    document_id: int,
+    user_id: int,
+    now: datetime
+):
+    """
+    Returns the DOWNLOAD_COLUMNS of a document for a valid resume token, without
+    counting a view; None if the token does not apply. Works after the last view
+    deleted the document, until the reaper purges its content, but not after
+    the document was deleted for another reason. Only ranges that all start
+    after the token's offset continue a transfer: anything else (the whole
+    document, or its first byte again) is a new view.
+    """
+    claims = decode_resume_token(token)
+    if claims is None or claims.get("uid") != user_id or claims.get("doc") != document_id:
+        return None
+    
+    document = (await db.execute(
+        select(*DOWNLOAD_COLUMNS).where(
+            Document.id == document_id,
+            Document.blob_key != None,
+            Document.blob_digest == claims.get("etag"),
+            or_(Document.sender_id == user_id, Document.recipient_id == user_id),
+            or_(Document.expires_at == None, Document.expires_at > now),
+            or_(
+                Document.is_deleted == False,
+                and_(Document.view_limit != None, Document.view_count >= Document.view_limit)
+            )
+        )
+    )).first()
+    if document is None:
+        return None
+    
+    ranges = requested_ranges(request, document)
+    offset = claims.get("off", 0)
+    if ranges is None or any(start <= offset for start, _ in ranges):
+        return None
+    return document
+
+
+def requested_ranges(request: Request, document) -> Optional[List[Tuple[int, int]]]:
+    """Byte ranges the request asks for and may get (None: send the whole document)"""
+    if document.plaintext_size is None or not document.blob_key or "Range" not in request.headers:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range is not None and if_range != f'"{document.blob_digest}"':
+        return None
+    return parse_range_header(request.headers["Range"], document.plaintext_size)
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses a Range header into inclusive (start, end) byte ranges
+    Returns None when the header must be ignored (malformed, other unit, too
+    many ranges); raises 416 when none of the ranges can be satisfied
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(","):
+        match = RANGE_SPEC.fullmatch(part.strip())
+        if not match or not any(match.groups()):
+            return None
+        first, last = match.groups()
         
-        # If reached limit, mark as deleted
-        if document.view_limit and document.view_count >= document.view_limit:
-            document.is_deleted = True
+        if not first:
+            # Suffix range: the last N bytes
+            if int(last) == 0:
+                continue
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
         
-        db.commit()
+        if start < size:
+            ranges.append((start, end))
     
-    # Decrypt content
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return ranges
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (q=0 refuses it)"""
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        if coding.strip().lower() not in ("gzip", "x-gzip", "*"):
+            continue
+        weight = params.strip().lower()
+        try:
+            return not (weight.startswith("q=") and float(weight[2:]) == 0)
+        except ValueError:
+            return False
+    return False
+
+
+def byterange_part_header(boundary: str, start: int, end: int, size: int) -> bytes:
+    """Headers of one part of a multipart/byteranges body"""
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: application/octet-stream\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode()
+
+
+def decrypted_chunks(document, encryption: DocumentEncryption, encoder: Optional[GzipEncoder] = None) -> Iterator[bytes]:
+    """Decrypts a whole document frame by frame (blob store or legacy inline content)"""
+    if document.blob_key:
+        encrypted_chunks = blob_store.read_chunks(document.blob_key, encryption.frame_size)
+    else:
+        encrypted_chunks = iter_chunks(document.encrypted_content)
+    return encryption.decrypt_stream(encrypted_chunks, encoder)
+
+
+async def decrypted_response(
+    chunks: Iterator[bytes],
+    status_code: int = status.HTTP_200_OK,
+    media_type: str = "application/octet-stream",
+    headers: Optional[dict] = None,
+    reject: bool = True
+) -> StreamingResponse:
+    """
+    Streams blocking decrypted chunks from the crypto pool
+    The first batch is decrypted (and authenticated) before responding, so a
+    bad document still gets an error status. Pass reject=False once a view
+    was counted: the response can't be refused anymore (see admit).
+    """
+    batches = crypto_executor.iterate(metered("decrypt", chunks), settings.CRYPTO_BATCH_SIZE, reject)
     try:
-        decrypted_content = encryptor.decrypt_file(document.encrypted_content)
+        first_batch = await batches.__anext__()
+    except StopAsyncIteration:
+        first_batch = b""
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error decrypting document")
     
-    # Return file
     return StreamingResponse(
-        io.BytesIO(decrypted_content),
-        media_type="application/octet-stream",
-        headers={
-            "Content-Disposition": f"attachment; filename={document.filename}"
-        }
+        streamed(prepend(first_batch, batches)),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+def decrypt_ranges(
+    document,
+    encryption: DocumentEncryption,
+    ranges: List[Tuple[int, int]],
+    boundary: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Decrypts byte ranges of a document, reading only the frames that cover them
+    With a boundary, the ranges are sent as multipart/byteranges parts
+    """
+    with blob_store.open(document.blob_key) as blob:
+        def read(offset: int, length: int) -> bytes:
+            blob.seek(offset)
+            return blob.read(length)
+        
+        for start, end in ranges:
+            if boundary:
+                yield byterange_part_header(boundary, start, end, document.plaintext_size)
+            yield from encryption.decrypt_range(read, document.plaintext_size, start, end)
+    
+    if boundary:
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+
+@app.get("/api/documents/{document_id}/download")
+# auth_verify(request_user, )
+async def download_document(
+    document_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Downloads a document (only if user is sender or recipient)
+    Increments view counter, except when a transfer is resumed with the
+    X-Resume-Token of an earlier response: a token only serves ranges after the
+    first byte of the response it came with (never the whole document, nor a
+    replay from its start), and resumed responses return the same token (same
+    expiry).
+    Supports single and multiple byte ranges (Range, If-Range).
+    Each recipient of a file has their own document, so the view counter,
+    limit and expiry checked here are the current user's.
+    """
+    now = datetime.utcnow()
+    
+    document = None
+    resume_token = request.headers.get("X-Resume-Token")
+    if resume_token and "Range" in request.headers:
+        document = await resumable_document(db, request, resume_token, document_id, current_user.id, now)
+    if document is None:
+        resume_token = None
+        # Refuse a busy server before counting the view: a 503 must not spend it
+        crypto_executor.admit()
+        document = await authorize_download(db, document_id, current_user.id, now)
+    
+    # Don't hold a pooled connection while the file streams
+    await db.close()
+    
+    try:
+        encryption = document_encryption(document)
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Error decrypting document")
+    
+    headers = {"Content-Disposition": f"attachment; filename={document.filename}"}
+    status_code = status.HTTP_200_OK
+    size = document.plaintext_size
+    ranges = None
+    
+    # Ranges need the plaintext size, which documents uploaded by older versions lack
+    if size is not None and document.blob_key:
+        ranges = requested_ranges(request, document)
+        offset = min(start for start, _ in ranges) if ranges else 0
+        headers.update({
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{document.blob_digest}"',
+            "X-Resume-Token": resume_token or create_resume_token(
+                current_user.id, document_id, document.blob_digest, offset
+            ),
+        })
+    
+    # zlib-compressed documents can be sent gzip-encoded without recompressing,
+    # when their content did compress
+    encoder = None
+    if (
+        document.compression == "zlib"
+        and settings.COMPRESSION_GZIP_DOWNLOADS
+        and document.blob_size < document.plaintext_size
+    ):
+        headers["Vary"] = "Accept-Encoding"
+        if ranges is None and accepts_gzip(request.headers.get("Accept-Encoding", "")):
+            encoder = GzipEncoder()
+    
+    media_type = "application/octet-stream"
+    if ranges is None:
+        chunks = decrypted_chunks(document, encryption, encoder)
+        if encoder:
+            headers["Content-Encoding"] = "gzip"
+            headers["ETag"] = f'"{document.blob_digest}-gzip"'
+        elif size is not None:
+            headers["Content-Length"] = str(size)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        chunks = decrypt_ranges(document, encryption, ranges)
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        chunks = decrypt_ranges(document, encryption, ranges, boundary)
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        media_type = f"multipart/byteranges; boundary={boundary}"
+        length = sum(
+            len(byterange_part_header(boundary, start, end, size)) + end - start + 1
+            for start, end in ranges
+        ) + len(f"\r\n--{boundary}--\r\n")
+        headers["Content-Length"] = str(length)
+    
+    return await decrypted_response(chunks, status_code, media_type, headers, reject=resume_token is not None)
+
+
+@app.get("/api/documents/archive")
+async def download_archive(
+    ids: List[int] = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user_dependency)
+):
+    """
+    Downloads several received documents (repeated ids) as one zip archive,
+    decrypted and zipped as it streams. A view of every document is counted
+    in one conditional statement; documents that can't be served (not
+    received, deleted, expired or at their view limit) are left out and
+    listed in X-Skipped-Documents.
+    """
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > settings.MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.MAX_BATCH_FILES} documents per archive")
+    
+    # Refuse a busy server before counting the views: a 503 must not spend them
+    crypto_executor.admit()
+    rows = (await db.execute(
+        counted_view(datetime.utcnow(), Document.id.in_(ids), Document.recipient_id == current_user.id)
+    )).all()
+    await db.commit()
+    # Don't hold a pooled connection while the archive streams
+    await db.close()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    by_id = {row.id: row for row in rows}
+    documents = [by_id[document_id] for document_id in ids if document_id in by_id]
+    try:
+        encryptions = [document_encryption(document) for document in documents]
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Error decrypting document")
+    
+    entries = (
+        (document.filename, decrypted_chunks(document, encryption))
+        for document, encryption in zip(documents, encryptions)
     )
+    headers = {"Content-Disposition": "attachment; filename=documents.zip"}
+    skipped = [str(document_id) for document_id in ids if document_id not in by_id]
+    if skipped:
+        headers["X-Skipped-Documents"] = ",".join(skipped)
+    
+    return await decrypted_response(stream_zip(entries), media_type="application/zip", headers=headers, reject=False)
+
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """
+    Metrics in the Prometheus text format (404 unless METRICS_ENABLED)
+    They are those of this process only: under serve.py, each scrape reaches one
+    of the workers, and nothing aggregates them.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.METRICS_TOKEN and not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(REGISTRY.expose(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Dashboard page"""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return pages["dashboard.html"].response(request, REVALIDATE)
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(path: str, request: Request):
+    """Static asset from memory (immutable under its hashed name); HEAD lets caches revalidate"""
+    asset = assets.get(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    resource, cache_control = asset
+    return resource.response(request, cache_control)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,425 @@
+"""
+Prometheus-style metrics: counters, gauges and histograms exposed on /metrics
+With METRICS_ENABLED off, instruments return at once and no middleware or
+database hooks are installed, so instrumented code costs one attribute check.
+"""
+import bisect
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import event
+
+from config import settings
+
+# Latency buckets (seconds), from sub-millisecond queries to long transfers
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Throughput buckets (bytes per second), 1 MB/s to 4 GB/s
+THROUGHPUT_BUCKETS = tuple(2 ** power for power in range(20, 33))
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class Registry:
+    """Metrics of the process, and callbacks that refresh gauges before a scrape"""
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []
+    
+    def register(self, metric: "Metric") -> None:
+        self._metrics.append(metric)
+    
+    def on_collect(self, collector: Callable[[], None]) -> None:
+        """Registers a callback run before each exposition (e.g. to copy pool stats into gauges)"""
+        self._collectors.append(collector)
+    
+    def expose(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(settings.METRICS_ENABLED)
+
+
+class Metric:
+    """A metric with a fixed set of label names; values are kept per label values"""
+    type = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}" for labels, value in values]
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+    type = "counter"
+    
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def set_total(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        """Copies a running total kept by another object (for collectors)"""
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(Metric):
+    """Value that goes up and down"""
+    type = "gauge"
+    
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def dec(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        self.inc(-amount, labels)
+    
+    def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values, in cumulative buckets"""
+    type = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(names, labels + (format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# Application metrics
+http_request_seconds = Histogram(
+    "briefcase_http_request_duration_seconds",
+    "Request latency per route, until the response body is sent",
+    ("method", "route", "status")
+)
+stage_seconds = Histogram(
+    "briefcase_stage_duration_seconds",
+    "Latency of a stage of request handling (jwt_decode, user_lookup, bcrypt, response_stream)",
+    ("stage",)
+)
+db_query_seconds = Histogram(
+    "briefcase_db_query_duration_seconds",
+    "Database statement latency, per statement type",
+    ("statement",)
+)
+crypto_seconds = Counter(
+    "briefcase_crypto_seconds_total",
+    "Time spent encrypting or decrypting (decrypt includes blob reads)",
+    ("operation",)
+)
+crypto_bytes = Counter(
+    "briefcase_crypto_bytes_total",
+    "Plaintext bytes encrypted or decrypted",
+    ("operation",)
+)
+crypto_throughput = Histogram(
+    "briefcase_crypto_throughput_bytes_per_second",
+    "Throughput of each encrypted or decrypted batch",
+    ("operation",),
+    buckets=THROUGHPUT_BUCKETS
+)
+bytes_received = Counter(
+    "briefcase_bytes_received_total",
+    "Document bytes received in uploads"
+)
+bytes_sent = Counter(
+    "briefcase_bytes_sent_total",
+    "Document bytes sent in downloads"
+)
+active_transfers = Gauge(
+    "briefcase_active_transfers",
+    "Uploads and downloads in progress",
+    ("direction",)
+)
+reaper_documents = Counter(
+    "briefcase_reaper_documents_total",
+    "Documents deleted (expired or at their view limit) and purged by the reaper",
+    ("action",)
+)
+pool_tasks = Gauge(
+    "briefcase_pool_tasks",
+    "Calls running and waiting on a worker pool",
+    ("pool", "state")
+)
+user_cache_lookups = Counter(
+    "briefcase_user_cache_lookups_total",
+    "Principal cache lookups by authenticated requests, by result (hit, miss)",
+    ("result",)
+)
+user_cache_evictions = Counter(
+    "briefcase_user_cache_evictions_total",
+    "Principals evicted from the cache to stay within USER_CACHE_SIZE"
+)
+user_cache_entries = Gauge(
+    "briefcase_user_cache_entries",
+    "Principals in the cache"
+)
+dedup_uploads = Counter(
+    "briefcase_dedup_uploads_total",
+    "Uploads by whether their content was already stored (deduplicated, stored)",
+    ("result",)
+)
+dedup_bytes = Counter(
+    "briefcase_dedup_bytes_total",
+    "Encrypted bytes of every upload (uploaded) and of those not stored thanks to an existing blob (saved)",
+    ("kind",)
+)
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+    
+    def __init__(self, stage: str):
+        self.stage = stage
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        stage_seconds.observe(time.perf_counter() - self.started, (self.stage,))
+
+
+class _NoSpan:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _Transfer:
+    __slots__ = ("direction",)
+    
+    def __init__(self, direction: str):
+        self.direction = direction
+    
+    def __enter__(self):
+        active_transfers.inc(labels=(self.direction,))
+        return self
+    
+    def __exit__(self, *exc_info):
+        active_transfers.dec(labels=(self.direction,))
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage: str):
+    """Context manager timing a stage of request handling into stage_seconds"""
+    if not REGISTRY.enabled:
+        return _NO_SPAN
+    return _Span(stage)
+
+
+def transfer(direction: str):
+    """Context manager counting an upload or download as active in active_transfers"""
+    if not REGISTRY.enabled:
+        return _NO_SPAN
+    return _Transfer(direction)
+
+
+def record_crypto(operation: str, size: int, seconds: float) -> None:
+    """Records a batch of crypto work: time, bytes and throughput"""
+    if not REGISTRY.enabled:
+        return
+    crypto_seconds.inc(seconds, (operation,))
+    crypto_bytes.inc(size, (operation,))
+    if size and seconds > 0:
+        crypto_throughput.observe(size / seconds, (operation,))
+
+
+def metered(operation: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Records the time spent producing each chunk of a blocking iterator as crypto work"""
+    if not REGISTRY.enabled:
+        return chunks
+    return _metered(operation, chunks)
+
+
+def _metered(operation: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    chunks = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        record_crypto(operation, len(chunk), time.perf_counter() - started)
+        yield chunk
+
+
+def streamed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Counts the bytes and duration of a streamed download, and the download as active meanwhile"""
+    if not REGISTRY.enabled:
+        return chunks
+    return _streamed(chunks)
+
+
+async def _streamed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    with transfer("download"), span("response_stream"):
+        async for chunk in chunks:
+            bytes_sent.inc(len(chunk))
+            yield chunk
+
+
+def instrument_engine(engine) -> None:
+    """Times every statement run by a (sync) engine into db_query_seconds"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        db_query_seconds.observe(time.perf_counter() - context._metrics_started, (verb,))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every request per route template
+    (not per path, so document ids don't multiply the series)
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+    
+    def route_of(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            route = next(
+                (r.path for r in scope["app"].router.routes if getattr(r, "endpoint", getattr(r, "app", None)) is endpoint),
+                "unmatched"
+            )
+            self._routes[endpoint] = route
+        return route
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        response_status = [500]
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_status[0] = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                (scope["method"], self.route_of(scope), str(response_status[0]))
+            )
+
+
+def pool_collector(*executors) -> Callable[[], None]:
+    """Collector copying the active and queued calls of BoundedExecutors into pool_tasks"""
+    def collect():
+        for executor in executors:
+            stats = executor.stats()
+            pool_tasks.set(stats["active"], (executor.name, "active"))
+            pool_tasks.set(stats["queued"], (executor.name, "queued"))
+    return collect
+
+
+def cache_collector(cache) -> Callable[[], None]:
+    """Collector copying the hits, misses, evictions and size of a TTLCache"""
+    def collect():
+        stats = cache.stats()
+        user_cache_lookups.set_total(stats["hits"], ("hit",))
+        user_cache_lookups.set_total(stats["misses"], ("miss",))
+        user_cache_evictions.set_total(stats["evictions"])
+        user_cache_entries.set(stats["size"])
+    return collect
+
+
+def dedup_collector(stats) -> Callable[[], None]:
+    """Collector copying the counters of a DedupStats"""
+    def collect():
+        counts = stats.stats()
+        dedup_uploads.set_total(counts["deduplicated"], ("deduplicated",))
+        dedup_uploads.set_total(counts["uploads"] - counts["deduplicated"], ("stored",))
+        dedup_bytes.set_total(counts["bytes_uploaded"], ("uploaded",))
+        dedup_bytes.set_total(counts["bytes_saved"], ("saved",))
+    return collect
@@ -0,0 +1,89 @@
+"""
+Script to move encrypted content stored in the documents table to the blob store
+Safe to interrupt and run again: each batch is committed on its own
+"""
+from database import SessionLocal, engine, init_db
+from models import Document
+from sqlalchemy.orm import undefer
+from storage import get_blob_store
+from encryption import iter_chunks
+import argparse
+import sys
+import io
+
+# Configure UTF-8 output for Windows
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+
+def migrate_blobs(batch_size: int = 100, vacuum: bool = False):
+    """Moves inline encrypted_content of every document into the blob store"""
+    
+    # Make sure the blob columns exist
+    init_db()
+    
+    blob_store = get_blob_store()
+    db = SessionLocal()
+    
+    pending = db.query(Document).filter(
+        Document.encrypted_content != None,
+        Document.blob_key == None
+    ).count()
+    print(f"\n[*] Documents to migrate: {pending}\n")
+    
+    migrated = 0
+    moved_bytes = 0
+    
+    try:
+        while True:
+            ids = [
+                row.id for row in db.query(Document.id).filter(
+                    Document.encrypted_content != None,
+                    Document.blob_key == None
+                ).order_by(Document.id).limit(batch_size)
+            ]
+            if not ids:
+                break
+            
+            for document_id in ids:
+                document = db.query(Document).options(
+                    undefer(Document.encrypted_content)
+                ).filter(Document.id == document_id).first()
+                
+                with blob_store.writer() as writer:
+                    for chunk in iter_chunks(document.encrypted_content):
+                        writer.write(chunk)
+                    blob = writer.commit()
+                
+                document.blob_key = blob.key
+                document.blob_size = blob.size
+                document.blob_digest = blob.digest
+                document.encrypted_content = None
+                moved_bytes += blob.size
+            
+            db.commit()
+            # Release the content of the migrated batch
+            db.expunge_all()
+            
+            migrated += len(ids)
+            print(f"[OK] Migrated {migrated}/{pending} documents ({moved_bytes / (1024 * 1024):.1f} MB)")
+    finally:
+        db.close()
+    
+    if vacuum and engine.dialect.name == "sqlite":
+        print("\n[*] Compacting database file...")
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    
+    print("\n" + "="*50)
+    print(f"[OK] Migration completed: {migrated} documents moved to blob storage")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents committed per batch")
+    parser.add_argument("--vacuum", action="store_true", help="Compact the SQLite file afterwards")
+    args = parser.parse_args()
+    
+    migrate_blobs(batch_size=args.batch_size, vacuum=args.vacuum)
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary, Boolean
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, LargeBinary, Boolean, Index, JSON
+from sqlalchemy.orm import relationship, declarative_base, deferred
 from datetime import datetime
 
 Base = declarative_base()
@@ -24,7 +24,11 @@ class Document(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
-    encrypted_content = Column(LargeBinary, nullable=False)  # Encrypted content
+    blob_key = Column(String, nullable=True)  # Encrypted content location in the blob store (shared by the recipients of an upload)
+    blob_size = Column(BigInteger, nullable=True)  # Encrypted content size in bytes
+    blob_digest = Column(String, nullable=True)  # SHA-256 of the encrypted content
+    plaintext_size = Column(BigInteger, nullable=True)  # Decrypted size (enables range requests)
+    compression = Column(String, nullable=True)  # Codec applied before encryption (None: not compressed)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     view_limit = Column(Integer, nullable=True)  # View limit (optional)
@@ -32,8 +36,121 @@ class Document(Base):
     expires_at = Column(DateTime, nullable=True)  # Expiration date (optional)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)  # Soft delete
+    deleted_at = Column(DateTime, nullable=True)  # When it was soft-deleted (content purge grace)
+    wrapped_key = Column(LargeBinary, nullable=True)  # Data key, wrapped by master key key_version (None: older versions)
+    key_version = Column(Integer, nullable=True)  # Master key version wrapping the data key
+    content_digest = Column(String, nullable=True)  # Keyed plaintext digest, per sender (deduplication)
+    # Legacy inline encrypted content, deferred so metadata queries never load it.
+    # Kept as the last column: SQLite must walk a large value's overflow pages
+    # to read any column stored after it.
+    encrypted_content = deferred(Column(LargeBinary, nullable=True))
     
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_documents")
     recipient = relationship("User", foreign_keys=[recipient_id], back_populates="received_documents")
+    
+    # Indexes matched to the access paths in main.py and reaper.py
+    __table_args__ = (
+        # Sent / received listings
+        Index("ix_documents_sender_live", sender_id, is_deleted, created_at),
+        Index("ix_documents_recipient_live", recipient_id, is_deleted, created_at),
+        # Live blob references (purge checks whether a blob is still used)
+        Index(
+            "ix_documents_live_blob_key", blob_key,
+            sqlite_where=(is_deleted == False) & (blob_key != None),
+            postgresql_where=(is_deleted == False) & (blob_key != None)
+        ),
+        # Deduplication: a live document of the sender with the same content
+        Index(
+            "ix_documents_sender_content", sender_id, content_digest,
+            sqlite_where=(is_deleted == False) & (content_digest != None),
+            postgresql_where=(is_deleted == False) & (content_digest != None)
+        ),
+        # Reaper: live documents with an expiration date
+        Index(
+            "ix_documents_live_expires_at", expires_at,
+            sqlite_where=(is_deleted == False) & (expires_at != None),
+            postgresql_where=(is_deleted == False) & (expires_at != None)
+        ),
+        # Reaper: live documents with a view limit
+        Index(
+            "ix_documents_live_view_limit", view_limit, view_count,
+            sqlite_where=(is_deleted == False) & (view_limit != None),
+            postgresql_where=(is_deleted == False) & (view_limit != None)
+        ),
+        # Reaper: deleted documents whose blob was not purged yet
+        Index(
+            "ix_documents_deleted_blob", blob_key,
+            sqlite_where=(is_deleted == True) & (blob_key != None),
+            postgresql_where=(is_deleted == True) & (blob_key != None)
+        ),
+    )
+
+
+class UploadSession(Base):
+    """A chunked upload in progress; becomes a Document once every chunk has arrived"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True)  # Random id, used in URLs and staging paths
+    filename = Column(String, nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # First recipient
+    recipient_ids = Column(JSON, nullable=True)  # Every recipient, in order (None: only recipient_id)
+    size = Column(BigInteger, nullable=False)  # Declared plaintext size
+    chunk_size = Column(Integer, nullable=False)  # Plaintext bytes per chunk (multiple of the frame size)
+    compression = Column(String, nullable=True)  # Codec the chunks are compressed with
+    wrapped_key = Column(LargeBinary, nullable=True)  # Data key the chunks are encrypted with, wrapped
+    key_version = Column(Integer, nullable=True)  # Master key version wrapping the data key
+    view_limit = Column(Integer, nullable=True)
+    expires_in_days = Column(Integer, nullable=True)
+    is_completing = Column(Boolean, default=False)  # Claimed by a finalize request
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Last chunk received
+    
+    __table_args__ = (
+        # Reaper: idle sessions
+        Index("ix_upload_sessions_updated_at", updated_at),
+    )
+
+
+class UploadChunk(Base):
+    """A chunk of an upload session that was encrypted and staged"""
+    __tablename__ = "upload_chunks"
+    
+    upload_id = Column(String, ForeignKey("upload_sessions.id"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    digest = Column(String, nullable=True)  # Keyed digest of the chunk plaintext (deduplication)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Lease(Base):
+    """A named lock held by one process until it expires (e.g. the reaper leader)"""
+    __tablename__ = "leases"
+    
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)  # host:pid:random of the holding process
+    expires_at = Column(DateTime, nullable=False)  # Taken over by another process after this
+
+
+class UserInvalidation(Base):
+    """A committed user change; worker processes drop the user from their principal cache"""
+    __tablename__ = "user_invalidations"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Listeners read recent rows, the reaper removes old ones
+        Index("ix_user_invalidations_created_at", created_at),
+    )
+
+
+# Reaper: deleted documents whose legacy inline content was not purged yet
+# (declared on the mapped class because encrypted_content is a deferred column)
+Index(
+    "ix_documents_deleted_inline", Document.id,
+    sqlite_where=(Document.is_deleted == True) & (Document.encrypted_content != None),
+    postgresql_where=(Document.is_deleted == True) & (Document.encrypted_content != None)
+)
 
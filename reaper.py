@@ -0,0 +1,232 @@
+"""
+Background task that deletes expired documents and purges their encrypted content
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, delete, and_, or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Document, UploadSession, UploadChunk
+from storage import BlobStore
+from metrics import reaper_documents
+from coordination import hold_lease, process_id, purge_user_invalidations, release_lease
+
+
+def expire_documents(db: Session, batch_size: int) -> int:
+    """Soft-deletes expired and view-limit-reached documents with set-based updates"""
+    now = datetime.utcnow()
+    
+    # One statement per rule so each can use its partial index
+    rules = [
+        and_(Document.expires_at != None, Document.expires_at <= now),
+        and_(Document.view_limit != None, Document.view_count >= Document.view_limit),
+    ]
+    
+    total = 0
+    for rule in rules:
+        while True:
+            batch = select(Document.id).where(
+                Document.is_deleted == False,
+                rule
+            ).limit(batch_size)
+            
+            result = db.execute(
+                update(Document)
+                .where(Document.id.in_(batch.scalar_subquery()))
+                .values(is_deleted=True, deleted_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                break
+    
+    return total
+
+
+def purge_deleted(db: Session, blob_store: BlobStore, batch_size: int, grace_seconds: float = 0) -> int:
+    """
+    Removes the encrypted content of deleted documents
+    A blob is deleted with the last document that references it: blobs shared
+    with a live document are kept, and so are blobs of documents deleted less
+    than `grace_seconds` ago (resumable downloads)
+    """
+    purged = 0
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    
+    # Legacy inline content
+    while True:
+        batch = select(Document.id).where(
+            Document.is_deleted == True,
+            Document.encrypted_content != None
+        ).limit(batch_size)
+        result = db.execute(
+            update(Document)
+            .where(Document.id.in_(batch.scalar_subquery()))
+            .values(encrypted_content=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        purged += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    
+    # Blob store content
+    while True:
+        rows = db.execute(
+            select(Document.id, Document.blob_key).where(
+                Document.is_deleted == True,
+                Document.blob_key != None,
+                or_(Document.deleted_at == None, Document.deleted_at <= cutoff)
+            ).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        
+        # Drop the references first: a crash can leave an orphan file, never a dangling key
+        keys = {row.blob_key for row in rows}
+        db.execute(
+            update(Document)
+            .where(Document.id.in_([row.id for row in rows]))
+            .values(blob_key=None)
+            .execution_options(synchronize_session=False)
+        )
+        
+        # Documents of other recipients may still use the blob: live ones, and
+        # deleted ones within the grace period (purged with a later batch).
+        # One query per state, so each uses its partial index.
+        referenced = set()
+        for is_deleted in (False, True):
+            referenced.update(db.scalars(
+                select(Document.blob_key).where(
+                    Document.blob_key.in_(keys),
+                    Document.is_deleted == is_deleted
+                ).distinct()
+            ))
+        db.commit()
+        
+        for key in keys - referenced:
+            blob_store.delete(key)
+        purged += len(rows)
+    
+    return purged
+
+
+def purge_stale_uploads(db: Session, blob_store: BlobStore, batch_size: int, ttl_seconds: float) -> int:
+    """
+    Discards upload sessions idle for longer than `ttl_seconds` and their staged
+    parts, then staged parts left behind without a session
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    discarded = 0
+    
+    while True:
+        # Locked, so a chunk arriving meanwhile waits and then finds its session gone
+        upload_ids = db.scalars(
+            select(UploadSession.id)
+            .where(UploadSession.updated_at < cutoff)
+            .limit(batch_size)
+            .with_for_update()
+        ).all()
+        if upload_ids:
+            db.execute(delete(UploadChunk).where(UploadChunk.upload_id.in_(upload_ids)))
+            db.execute(
+                delete(UploadSession)
+                .where(UploadSession.id.in_(upload_ids))
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        
+        # Drop the rows first: a crash leaves orphan parts, swept below
+        for upload_id in upload_ids:
+            blob_store.discard_parts(upload_id)
+        discarded += len(upload_ids)
+        if len(upload_ids) < batch_size:
+            break
+    
+    staged = blob_store.staged_uploads()
+    for offset in range(0, len(staged), batch_size):
+        batch = staged[offset:offset + batch_size]
+        live = set(db.scalars(select(UploadSession.id).where(UploadSession.id.in_(batch))))
+        for upload_id in set(batch) - live:
+            blob_store.discard_parts(upload_id)
+    db.rollback()
+    
+    return discarded
+
+
+def reap_once(
+    blob_store: BlobStore,
+    batch_size: int,
+    purge_grace: float = 0,
+    upload_ttl: Optional[float] = None,
+    invalidation_retention: Optional[float] = None
+) -> Tuple[int, int, int]:
+    """Runs one reaper pass; returns (documents deleted, documents purged, uploads discarded)"""
+    db = SessionLocal()
+    try:
+        deleted = expire_documents(db, batch_size)
+        purged = purge_deleted(db, blob_store, batch_size, purge_grace)
+        discarded = 0
+        if upload_ttl is not None:
+            discarded = purge_stale_uploads(db, blob_store, batch_size, upload_ttl)
+        if invalidation_retention is not None:
+            purge_user_invalidations(db, invalidation_retention)
+    finally:
+        db.close()
+    reaper_documents.inc(deleted, ("deleted",))
+    reaper_documents.inc(purged, ("purged",))
+    return deleted, purged, discarded
+
+
+def lease_reaper(seconds: float) -> bool:
+    """Takes or renews the reaper lease for this process"""
+    db = SessionLocal()
+    try:
+        return hold_lease(db, "reaper", process_id(), seconds)
+    finally:
+        db.close()
+
+
+def release_reaper_lease() -> None:
+    db = SessionLocal()
+    try:
+        release_lease(db, "reaper", process_id())
+    finally:
+        db.close()
+
+
+async def run_reaper(
+    blob_store: BlobStore,
+    interval: float,
+    batch_size: int,
+    purge_grace: float = 0,
+    upload_ttl: Optional[float] = None,
+    invalidation_retention: Optional[float] = None,
+    lease_seconds: Optional[float] = None
+):
+    """
+    Runs the reaper every `interval` seconds until cancelled
+    With lease_seconds, only the process holding the "reaper" lease runs
+    passes, so one worker of a deployment reaps and another takes over if it dies
+    """
+    while True:
+        try:
+            leader = lease_seconds is None or await run_in_threadpool(lease_reaper, lease_seconds)
+            if leader:
+                deleted, purged, discarded = await run_in_threadpool(
+                    reap_once, blob_store, batch_size, purge_grace, upload_ttl, invalidation_retention
+                )
+                if deleted or purged:
+                    print(f"🧹 Reaper: {deleted} documents deleted, {purged} purged")
+                if discarded:
+                    print(f"🧹 Reaper: {discarded} stale uploads discarded")
+        except Exception as e:
+            print(f"[!] Reaper error: {e}")
+        
+        await asyncio.sleep(interval)
@@ -0,0 +1,103 @@
+"""
+Script to re-wrap document data keys with the active master key (ENCRYPTION_KEY_VERSION)
+Only the wrapped data keys are rewritten, never the encrypted content.
+Safe to interrupt and run again: each batch is committed on its own and keys
+already wrapped with the active master key are skipped.
+"""
+from database import SessionLocal, init_db
+from models import Document, UploadSession
+from encryption import get_key_ring
+from sqlalchemy import func, select, update
+import argparse
+import sys
+import io
+import time
+
+# Configure UTF-8 output for Windows
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+
+def rotate_table(db, model, key_ring, batch_size: int, max_rate: float) -> int:
+    """
+    Re-wraps the data keys of one table, in primary key order
+    At most `max_rate` keys per second (0: no limit)
+    """
+    stale = (model.wrapped_key != None) & (model.key_version != key_ring.active_version)
+    pending = db.scalar(select(func.count()).select_from(model).where(stale))
+    print(f"\n[*] {model.__tablename__}: {pending} data keys to re-wrap")
+    
+    rotated = 0
+    last_id = None
+    started = time.monotonic()
+    while True:
+        query = select(model.id, model.wrapped_key, model.key_version).where(stale)
+        if last_id is not None:
+            query = query.where(model.id > last_id)
+        rows = db.execute(query.order_by(model.id).limit(batch_size)).all()
+        if not rows:
+            break
+        
+        batch_started = time.monotonic()
+        db.execute(update(model), [
+            {
+                "id": row.id,
+                "wrapped_key": key_ring.rewrap(row.wrapped_key, row.key_version),
+                "key_version": key_ring.active_version
+            }
+            for row in rows
+        ])
+        db.commit()
+        
+        last_id = rows[-1].id
+        rotated += len(rows)
+        elapsed = time.monotonic() - started
+        print(f"[OK] {rotated}/{pending} re-wrapped ({rotated / max(elapsed, 1e-6):.0f} keys/s)")
+        
+        # Throttle: spread the writes so the database keeps serving requests
+        if max_rate > 0:
+            time.sleep(max(0.0, len(rows) / max_rate - (time.monotonic() - batch_started)))
+    
+    return rotated
+
+
+def rotate_keys(batch_size: int = 500, max_rate: float = 0):
+    """Re-wraps every data key not wrapped by the active master key"""
+    
+    # Make sure the key columns exist
+    init_db()
+    
+    key_ring = get_key_ring()
+    print(f"\n[*] Active encryption key version: {key_ring.active_version} (ring: {list(key_ring.versions)})")
+    
+    db = SessionLocal()
+    try:
+        rotated = sum(
+            rotate_table(db, model, key_ring, batch_size, max_rate)
+            for model in (Document, UploadSession)
+        )
+        
+        # Documents from before envelope encryption are encrypted with a master key itself
+        legacy = db.scalar(
+            select(func.count()).select_from(Document).where(
+                Document.wrapped_key == None,
+                Document.is_deleted == False
+            )
+        )
+    finally:
+        db.close()
+    
+    print("\n" + "="*50)
+    print(f"[OK] Rotation completed: {rotated} data keys re-wrapped")
+    if legacy:
+        print(f"[!] {legacy} documents have no data key and still need ENCRYPTION_KEY")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500, help="Keys committed per batch")
+    parser.add_argument("--max-rate", type=float, default=0, help="Keys re-wrapped per second (0: no limit)")
+    args = parser.parse_args()
+    
+    rotate_keys(batch_size=args.batch_size, max_rate=args.max_rate)
@@ -1,18 +1,232 @@
 """
 Script to populate database with test users
+With --users / --documents it seeds a synthetic dataset instead, without
+prompting: bulk inserts in large transactions, bcrypt on a process pool (or
+one shared hash), and realistic expiry and view-limit distributions.
 """
-from database import SessionLocal, init_db
-from models import User
+from database import SessionLocal, engine, init_db
+from models import User, Document
 from auth import get_password_hash
+from benchmarks.harness import parse_distribution
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from typing import Dict, Iterator, List, Sequence, Tuple
+import argparse
+import bisect
+import itertools
+import os
+import random
 import sys
 import io
+import time
 
 # Configure UTF-8 output for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# Lifecycle of synthetic documents: (value, weight)
+EXPIRY_DAYS = [(None, 40), (1, 10), (7, 25), (30, 15), (90, 10)]
+VIEW_LIMITS = [(None, 60), (1, 20), (3, 10), (5, 5), (10, 5)]
 
-def seed_database():
+
+def weighted(choices: Sequence[Tuple[object, float]]):
+    """Picker of a value of (value, weight) pairs: pick(rng) -> value"""
+    values, weights = zip(*choices)
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    return lambda rng: values[bisect.bisect(cumulative, rng.random() * total)]
+
+
+def hash_passwords(passwords: Sequence[str], workers: int) -> List[str]:
+    """bcrypt hashes of passwords, computed on `workers` processes (inline with 0 or 1)"""
+    if workers <= 1 or len(passwords) < 2:
+        return [get_password_hash(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def batches(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_rows(table, rows: Iterator[dict], batch_size: int, label: str) -> int:
+    """
+    Inserts rows with executemany, one transaction per batch, and reports
+    progress in rows per second
+    """
+    inserted = 0
+    started = time.perf_counter()
+    for batch in batches(rows, batch_size):
+        with engine.begin() as conn:
+            conn.execute(insert(table), batch)
+        inserted += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"  {label}: {inserted} rows ({inserted / elapsed:,.0f} rows/s)", end="\r")
+    elapsed = time.perf_counter() - started
+    if inserted:
+        print(f"[OK] {inserted} {label} inserted in {elapsed:.1f} s ({inserted / elapsed:,.0f} rows/s)")
+    return inserted
+
+
+def insert_users(
+    count: int,
+    hashed_passwords: Sequence[str],
+    prefix: str = "user",
+    domain: str = "seed.briefcase",
+    batch_size: int = 10000
+) -> List[int]:
+    """
+    Inserts users {prefix}{i}@{domain}; passwords cycle through hashed_passwords
+    (a single hash shared by every user is the fastest). Returns their ids.
+    """
+    rows = (
+        {
+            "email": f"{prefix}{i}@{domain}",
+            "username": f"{prefix}{i}",
+            "hashed_password": hashed_passwords[i % len(hashed_passwords)],
+        }
+        for i in range(count)
+    )
+    insert_rows(User.__table__, rows, batch_size, "users")
+    db = SessionLocal()
+    try:
+        return list(db.scalars(
+            select(User.id).where(User.email.like(f"{prefix}%@{domain}")).order_by(User.id)
+        ))
+    finally:
+        db.close()
+
+
+def shared_contents(distribution: Sequence[Tuple[int, float]], rng: random.Random) -> Dict[int, dict]:
+    """
+    Encrypts one blob per size of the distribution; documents of that size all
+    reference it, so seeding costs one encryption per size whatever the count.
+    Returns the content columns (see main.CONTENT_COLUMNS) by size.
+    """
+    from encryption import DocumentEncryption, get_key_ring
+    from storage import get_blob_store
+    
+    key_ring = get_key_ring()
+    blob_store = get_blob_store()
+    contents = {}
+    for size, _ in distribution:
+        data_key = key_ring.generate()
+        stream = DocumentEncryption(data_key.key).encryptor()
+        with blob_store.writer() as writer:
+            writer.write(stream.update(rng.randbytes(size)))
+            writer.write(stream.finalize())
+            blob = writer.commit()
+        contents[size] = {
+            "blob_key": blob.key,
+            "blob_size": blob.size,
+            "blob_digest": blob.digest,
+            "plaintext_size": size,
+            "compression": None,
+            "wrapped_key": data_key.wrapped,
+            "key_version": data_key.version,
+        }
+    return contents
+
+
+def document_rows(
+    user_ids: Sequence[int],
+    count: int,
+    contents: Dict[int, dict],
+    distribution: Sequence[Tuple[int, float]],
+    rng: random.Random,
+    days: int = 180,
+    lifecycle: bool = True
+) -> Iterator[dict]:
+    """
+    Yields synthetic documents between random users, created over the last
+    `days` days. Recipients are skewed (a few users receive most documents).
+    With lifecycle, expiries and view limits follow EXPIRY_DAYS and
+    VIEW_LIMITS, so some documents are already expired or used up.
+    """
+    now = datetime.utcnow()
+    users = len(user_ids)
+    pick_expiry, pick_view_limit, pick_size = weighted(EXPIRY_DAYS), weighted(VIEW_LIMITS), weighted(distribution)
+    for i in range(count):
+        sender = rng.randrange(users)
+        recipient = int(users * rng.random() ** 2)
+        if recipient == sender:
+            recipient = (sender + 1) % users
+        created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+        
+        expires_at = view_limit = None
+        view_count = 0
+        if lifecycle:
+            expiry = pick_expiry(rng)
+            expires_at = created_at + timedelta(days=expiry) if expiry else None
+            view_limit = pick_view_limit(rng)
+            view_count = rng.randint(0, view_limit) if view_limit else min(int(rng.expovariate(0.5)), 20)
+        
+        content = contents[pick_size(rng)] if contents else {}
+        yield {
+            "filename": f"document-{i}.pdf",
+            "sender_id": user_ids[sender],
+            "recipient_id": user_ids[recipient],
+            "view_limit": view_limit,
+            "view_count": view_count,
+            "expires_at": expires_at,
+            "created_at": created_at,
+            "is_deleted": False,
+            **content
+        }
+
+
+def seed_synthetic(args):
+    """Seeds --users users and --documents documents without prompting"""
+    init_db()
+    rng = random.Random(args.seed)
+    
+    db = SessionLocal()
+    try:
+        taken = db.scalar(select(User.id).where(User.email == f"{args.prefix}0@{args.domain}"))
+    finally:
+        db.close()
+    if taken:
+        print(f"[X] Users {args.prefix}*@{args.domain} already exist; choose another --prefix")
+        sys.exit(1)
+    
+    started = time.perf_counter()
+    if args.hash_each:
+        print(f"\n[*] Hashing {args.users} passwords on {args.hash_workers} processes...")
+        hashes = hash_passwords([args.password] * args.users, args.hash_workers)
+    else:
+        hashes = [get_password_hash(args.password)]
+    print(f"[OK] Passwords hashed in {time.perf_counter() - started:.1f} s")
+    
+    print(f"\n[*] Creating {args.users} users...")
+    user_ids = insert_users(args.users, hashes, args.prefix, args.domain, args.batch_size)
+    
+    if args.documents:
+        if len(user_ids) < 2:
+            print("[X] Documents need at least 2 users")
+            sys.exit(1)
+        contents = None
+        if not args.no_content:
+            print("\n[*] Encrypting shared content...")
+            contents = shared_contents(parse_distribution(args.sizes), rng)
+        print(f"\n[*] Creating {args.documents} documents...")
+        rows = document_rows(
+            user_ids, args.documents, contents, parse_distribution(args.sizes), rng, args.days
+        )
+        insert_rows(Document.__table__, rows, args.batch_size, "documents")
+    
+    print("\n" + "="*50)
+    print(f"[OK] Seeded in {time.perf_counter() - started:.1f} s")
+    print("="*50)
+    print(f"\n[INFO] Users log in as {args.prefix}<n>@{args.domain} / {args.password}\n")
+
+
+def seed_database(assume_yes: bool = False):
     """Creates test users in the database"""
     
     # Initialize database
@@ -22,7 +236,7 @@ def seed_database():
     
     # Check if users already exist
     existing_users = db.query(User).count()
-    if existing_users > 0:
+    if existing_users > 0 and not assume_yes:
         print(f"[!] {existing_users} users already exist in database")
         response = input("Do you want to continue and add more users? (y/n): ")
         if response.lower() != 'y':
@@ -51,17 +265,21 @@ def seed_database():
     
     print("\n[*] Creating test users...\n")
     
+    # One query for the users that already exist
+    existing = set(db.scalars(
+        select(User.email).where(User.email.in_([user_data["email"] for user_data in test_users]))
+    ))
+    new_users = [user_data for user_data in test_users if user_data["email"] not in existing]
     for user_data in test_users:
-        # Check if user already exists
-        existing = db.query(User).filter(User.email == user_data["email"]).first()
-        if existing:
+        if user_data["email"] in existing:
             print(f"[!] User {user_data['email']} already exists, skipping...")
-            continue
-        
+    
+    hashes = hash_passwords([user_data["password"] for user_data in new_users], os.cpu_count() or 1)
+    for user_data, hashed_password in zip(new_users, hashes):
         user = User(
             email=user_data["email"],
             username=user_data["username"],
-            hashed_password=get_password_hash(user_data["password"])
+            hashed_password=hashed_password
         )
         db.add(user)
         print(f"[OK] User created: {user_data['username']} ({user_data['email']})")
@@ -82,5 +300,26 @@ def seed_database():
 
 
 if __name__ == "__main__":
-    seed_database()
-
+    parser = argparse.ArgumentParser(description="Creates test users, or a synthetic dataset with --users")
+    parser.add_argument("--yes", action="store_true", help="Don't ask before adding test users to a non-empty database")
+    parser.add_argument("--users", type=int, help="Synthetic users to create (non-interactive)")
+    parser.add_argument("--documents", type=int, default=0, help="Synthetic documents to create")
+    parser.add_argument("--password", default="password123", help="Password of the synthetic users")
+    parser.add_argument("--hash-each", action="store_true",
+                        help="Hash the password once per user (distinct salts) instead of sharing one hash")
+    parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes hashing passwords with --hash-each")
+    parser.add_argument("--sizes", default="4KB:60,256KB:30,4MB:10",
+                        help="Document size distribution (size:weight); one shared blob per size")
+    parser.add_argument("--no-content", action="store_true", help="Create documents without encrypted content")
+    parser.add_argument("--days", type=int, default=180, help="Documents are created over this many past days")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per insert transaction")
+    parser.add_argument("--prefix", default="user", help="Synthetic user names are <prefix><n>")
+    parser.add_argument("--domain", default="seed.briefcase", help="Email domain of the synthetic users")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (same seed, same dataset)")
+    args = parser.parse_args()
+    
+    if args.users:
+        seed_synthetic(args)
+    else:
+        seed_database(assume_yes=args.yes)
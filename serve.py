@@ -0,0 +1,289 @@
+"""
+Production launcher for Briefcase: a master process and N uvicorn workers
+The master binds the socket, creates the schema and (by default) imports the
+application once; workers are forked from it and share the socket, the
+imported code and the loaded templates. Signals to the master:
+  SIGTERM / SIGINT  graceful stop: workers finish their requests, then exit
+  SIGHUP            graceful reload: new workers start, then the old ones drain
+A worker that dies is replaced. Workers coordinate through the database (see
+coordination.py), so any number of them can run against one DATABASE_URL.
+In-memory state stays per worker: the metrics registry, the deduplication
+counters and the principal cache (whose entries are invalidated across workers,
+but whose counters are not shared).
+Use run.py for development (auto-reload, single process).
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import io
+from typing import Callable, Dict, Tuple
+
+# Time a stopping worker keeps its connections open after it stops accepting
+DRAIN_SECONDS = 0.5
+
+# Configure UTF-8 output for Windows
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (the container or affinity limit, not the host's)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configure_workers(workers: int) -> None:
+    """
+    Tells the application how many processes share the machine, before it reads
+    its settings: per-process pools default to a share of the CPUs instead of
+    all of them each (explicit settings win)
+    """
+    cpus = available_cpus()
+    os.environ["WORKERS"] = str(workers)
+    os.environ.setdefault("CRYPTO_WORKERS", str(max(1, cpus // workers)))
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, min(4, cpus // workers))))
+
+
+def load_app():
+    return importlib.import_module("main").app
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_worker(sock: socket.socket, ready_fd: int, app_loader: Callable, args) -> None:
+    """Runs in a forked worker: serves the shared socket until SIGTERM"""
+    import uvicorn
+    
+    # uvicorn installs its own SIGINT/SIGTERM handlers; reloads are the master's
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    
+    app = app_loader()
+    # Pooled connections opened by the master must not be shared with it
+    from database import async_engine, engine
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    
+    class Worker(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets)
+            # Tell the master this worker accepts connections (it doesn't wait
+            # for replacements of dead workers, whose pipe is closed)
+            try:
+                if not self.should_exit:
+                    os.write(ready_fd, b"1")
+            except BrokenPipeError:
+                pass
+            os.close(ready_fd)
+        
+        async def shutdown(self, sockets=None):
+            # Stop accepting first: connections accepted a moment ago get to send
+            # their request, instead of being closed as idle
+            for server in self.servers:
+                server.close()
+            await asyncio.sleep(DRAIN_SECONDS)
+            await super().shutdown(sockets)
+    
+    config = uvicorn.Config(
+        app,
+        log_level=args.log_level,
+        proxy_headers=args.proxy_headers,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout
+    )
+    Worker(config).run(sockets=[sock])
+
+
+class Master:
+    """Forks workers, replaces those that die, and relays stop and reload signals"""
+    
+    def __init__(self, sock: socket.socket, app_loader: Callable, args):
+        self.sock = sock
+        self.app_loader = app_loader
+        self.args = args
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self.retiring: Dict[int, float] = {}  # pid -> SIGTERM time
+        self.stopping = False
+        self.reloading = False
+    
+    def spawn(self) -> Tuple[int, int]:
+        """Forks a worker; returns its pid and the pipe it reports readiness on"""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                serve_worker(self.sock, write_fd, self.app_loader, self.args)
+            except BaseException as e:
+                print(f"[X] Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        self.workers[pid] = time.monotonic()
+        return pid, read_fd
+    
+    def wait_ready(self, pipes: Dict[int, int], timeout: float) -> int:
+        """Waits until the workers of `pipes` (pid -> fd) accept connections; returns how many do"""
+        ready = 0
+        deadline = time.monotonic() + timeout
+        pending = dict(pipes)
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending.values()), [], [], deadline - time.monotonic())
+            for fd in readable:
+                pid = next(pid for pid, pipe in pending.items() if pipe == fd)
+                ready += os.read(fd, 1) == b"1"
+                del pending[pid]
+        for fd in pipes.values():
+            os.close(fd)
+        return ready
+    
+    def retire(self, pids) -> None:
+        for pid in pids:
+            if pid in self.workers:
+                del self.workers[pid]
+                self.retiring[pid] = time.monotonic()
+                self.signal(pid, signal.SIGTERM)
+    
+    def signal(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+    
+    def reload(self) -> None:
+        """Starts a new generation of workers, then drains the old one"""
+        old = list(self.workers)
+        print(f"[*] Reloading {len(old)} workers...")
+        pipes = dict(self.spawn() for _ in range(self.args.workers))
+        ready = self.wait_ready(pipes, self.args.boot_timeout)
+        if ready < len(pipes):
+            print(f"[!] Only {ready} of {len(pipes)} new workers started; old workers are kept")
+            self.retire(pipes)
+            return
+        self.retire(old)
+        print(f"[OK] {ready} new workers serving")
+    
+    def reap(self) -> None:
+        """Collects exited workers and replaces those that were not retired"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.retiring.pop(pid, None) is not None:
+                continue
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"[!] Worker {pid} exited (status {status}); starting another")
+            # Don't spin when workers can't boot (e.g. an import error without preload)
+            if time.monotonic() - started < 5:
+                time.sleep(1)
+            _, fd = self.spawn()
+            os.close(fd)
+    
+    def kill_stragglers(self) -> None:
+        """SIGKILLs workers still draining after the graceful timeout"""
+        limit = self.args.graceful_timeout + 5
+        for pid, since in list(self.retiring.items()):
+            if time.monotonic() - since > limit:
+                print(f"[!] Worker {pid} did not stop in time; killing it")
+                self.signal(pid, signal.SIGKILL)
+                self.retiring[pid] = float("inf")
+    
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        
+        pipes = dict(self.spawn() for _ in range(self.args.workers))
+        ready = self.wait_ready(pipes, self.args.boot_timeout)
+        print(f"[OK] {ready} workers serving on http://{self.args.host}:{self.args.port} (master pid {os.getpid()})")
+        
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            self.reap()
+            self.kill_stragglers()
+            time.sleep(0.2)
+        
+        print("[*] Stopping workers...")
+        self.retire(list(self.workers))
+        while self.retiring:
+            self.reap()
+            self.kill_stragglers()
+            time.sleep(0.1)
+        print("[OK] Stopped")
+    
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+    
+    def handle_reload(self, signum, frame):
+        self.reloading = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs Briefcase with several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=available_cpus(), help="Worker processes (default: one per CPU)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Import the application in each worker, so SIGHUP also loads new code")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Seconds a stopping worker has to finish its requests")
+    parser.add_argument("--boot-timeout", type=float, default=60, help="Seconds a new worker has to start")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Keep-alive timeout of idle connections")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--proxy-headers", action="store_true", help="Trust X-Forwarded-For / X-Forwarded-Proto")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    
+    if not hasattr(os, "fork"):
+        print("[X] serve.py needs fork (Linux, macOS); use run.py on this platform")
+        sys.exit(1)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    configure_workers(args.workers)
+    sock = bind(args.host, args.port, args.backlog)
+    
+    # Schema changes run once, not in every worker at the same time
+    from database import engine, init_db
+    init_db()
+    engine.dispose()
+    print("[OK] Database initialized")
+    
+    app_loader = load_app
+    if not args.no_preload:
+        app = load_app()
+        app_loader = lambda: app
+        print("[OK] Application preloaded")
+    
+    print(f"[*] Starting {args.workers} workers...")
+    Master(sock, app_loader, args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
 // Variable to control downloading documents
 const downloadingDocuments = new Set();
 
+// Paginated document lists (infinite scroll)
+const PAGE_SIZE = 50;
+const MAX_PAGE_SIZE = 200;
+const documentLists = {
+    sent: { url: '/api/documents/sent', containerId: 'sentDocuments', sentinelId: 'sentSentinel', cursor: null, count: 0, done: false, loading: null },
+    received: { url: '/api/documents/received', containerId: 'receivedDocuments', sentinelId: 'receivedSentinel', cursor: null, count: 0, done: false, loading: null }
+};
+
 // Verify authentication when loading
 window.addEventListener('DOMContentLoaded', async () => {
     try {
@@ -17,6 +25,7 @@ window.addEventListener('DOMContentLoaded', async () => {
         
         // Load documents
         await loadDocuments();
+        observeSentinels();
     } catch (error) {
         window.location.href = '/';
     }
@@ -48,77 +57,248 @@ async function loadUsers() {
     }
 }
 
+// Files up to this size are sent together in one batch request;
+// larger ones go through chunked uploads
+const BATCH_UPLOAD_MAX_FILE_SIZE = 8 * 1024 * 1024;
+const BATCH_UPLOAD_MAX_FILES = 100;
+
+// Chunked uploads: several chunks in flight, each retried with backoff.
+// The session id is remembered, so submitting the same file again resumes it.
+const UPLOAD_PARALLEL_CHUNKS = 4;
+const UPLOAD_CHUNK_RETRIES = 5;
+
+class UploadError extends Error {}
+
+async function errorDetail(response, fallback) {
+    const error = await response.json().catch(() => ({}));
+    return typeof error.detail === 'string' ? error.detail : fallback;
+}
+
+// Start an upload session, or resume the unfinished one for the same file and options
+async function startUpload(file, options) {
+    const key = `briefcase-upload:${file.name}:${file.size}:${file.lastModified}:${JSON.stringify(options)}`;
+    const saved = localStorage.getItem(key);
+    if (saved) {
+        const response = await fetch(`/api/uploads/${saved}`);
+        if (response.ok) return { key, upload: await response.json() };
+        localStorage.removeItem(key);
+    }
+    
+    const response = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, ...options })
+    });
+    if (!response.ok) {
+        throw new UploadError(await errorDetail(response, 'Error uploading document'));
+    }
+    
+    const upload = await response.json();
+    localStorage.setItem(key, upload.upload_id);
+    return { key, upload };
+}
+
+async function sendChunk(upload, file, index) {
+    const start = index * upload.chunk_size;
+    const body = file.slice(start, start + upload.chunk_size);
+    
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(`/api/uploads/${upload.upload_id}/chunks/${index}`, { method: 'PUT', body });
+            if (response.ok) return;
+            // Only server errors (e.g. 503 when busy) are worth retrying
+            if (response.status < 500 || attempt >= UPLOAD_CHUNK_RETRIES) {
+                throw new UploadError(await errorDetail(response, 'Error uploading document'));
+            }
+        } catch (error) {
+            if (error instanceof UploadError || attempt >= UPLOAD_CHUNK_RETRIES) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+    }
+}
+
+async function uploadFile(file, options, onProgress) {
+    const { key, upload } = await startUpload(file, options);
+    
+    const received = new Set(upload.received);
+    const pending = [];
+    for (let index = 0; index < upload.chunk_count; index++) {
+        if (!received.has(index)) pending.push(index);
+    }
+    
+    let done = received.size;
+    onProgress(done, upload.chunk_count);
+    
+    // Each worker sends the next pending chunk until none are left
+    const workers = Array.from({ length: Math.min(UPLOAD_PARALLEL_CHUNKS, pending.length) }, async () => {
+        while (pending.length) {
+            await sendChunk(upload, file, pending.shift());
+            onProgress(++done, upload.chunk_count);
+        }
+    });
+    await Promise.all(workers);
+    
+    const response = await fetch(`/api/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+    if (!response.ok) {
+        throw new UploadError(await errorDetail(response, 'Error uploading document'));
+    }
+    localStorage.removeItem(key);
+    return response.json();
+}
+
+// Upload small files in one request (one transaction for all of them)
+async function uploadBatch(files, options) {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    options.recipient_ids.forEach(id => formData.append('recipient_ids', id));
+    if (options.view_limit) formData.append('view_limit', options.view_limit);
+    if (options.expires_in_days) formData.append('expires_in_days', options.expires_in_days);
+    
+    const response = await fetch('/api/documents/upload/batch', { method: 'POST', body: formData });
+    if (!response.ok) {
+        throw new UploadError(await errorDetail(response, 'Error uploading documents'));
+    }
+    return response.json();
+}
+
 // Upload form button
 document.getElementById('uploadForm').addEventListener('submit', async (e) => {
     e.preventDefault();
     
-    const formData = new FormData();
-    const fileInput = document.getElementById('file');
-    const recipientId = document.getElementById('recipient').value;
+    const files = Array.from(document.getElementById('file').files);
+    const recipientIds = Array.from(document.getElementById('recipient').selectedOptions, option => Number(option.value));
     const viewLimit = document.getElementById('viewLimit').value;
     const expiresInDays = document.getElementById('expiresInDays').value;
     
-    formData.append('file', fileInput.files[0]);
-    formData.append('recipient_id', recipientId);
-    if (viewLimit) formData.append('view_limit', viewLimit);
-    if (expiresInDays) formData.append('expires_in_days', expiresInDays);
+    // One upload for every recipient: each gets their own view count and limit
+    const options = { recipient_ids: recipientIds };
+    if (viewLimit) options.view_limit = Number(viewLimit);
+    if (expiresInDays) options.expires_in_days = Number(expiresInDays);
     
     const uploadMsg = document.getElementById('upload-message');
     const uploadError = document.getElementById('upload-error');
     uploadMsg.style.display = 'none';
     uploadError.style.display = 'none';
     
+    const small = files.filter(file => file.size <= BATCH_UPLOAD_MAX_FILE_SIZE);
+    const large = files.filter(file => file.size > BATCH_UPLOAD_MAX_FILE_SIZE);
+    
     try {
-        const response = await fetch('/api/documents/upload', {
-            method: 'POST',
-            body: formData
-        });
-        
-        if (response.ok) {
-            const result = await response.json();
-            uploadMsg.textContent = `✓ ${result.message}`;
+        let uploaded = 0;
+        for (let start = 0; start < small.length; start += BATCH_UPLOAD_MAX_FILES) {
+            uploadMsg.textContent = '⏳ Uploading...';
             uploadMsg.style.display = 'block';
-            
-            // Reset form
-            e.target.reset();
-            
-            // Reload documents
-            await loadDocuments();
-        } else {
-            const error = await response.json();
-            uploadError.textContent = error.detail || 'Error uploading document';
-            uploadError.style.display = 'block';
+            await uploadBatch(small.slice(start, start + BATCH_UPLOAD_MAX_FILES), options);
+            uploaded += Math.min(BATCH_UPLOAD_MAX_FILES, small.length - start);
         }
+        
+        for (const file of large) {
+            await uploadFile(file, options, (done, total) => {
+                uploadMsg.textContent = `⏳ Uploading ${file.name}... ${Math.floor(done * 100 / total)}%`;
+                uploadMsg.style.display = 'block';
+            });
+            uploaded++;
+        }
+        
+        uploadMsg.textContent = uploaded === 1
+            ? '✓ Document uploaded successfully'
+            : `✓ ${uploaded} documents uploaded successfully`;
+        uploadMsg.style.display = 'block';
+        
+        // Reset form
+        e.target.reset();
+        
+        // Reload documents
+        await loadDocuments();
     } catch (error) {
-        uploadError.textContent = 'Connection error';
+        uploadMsg.style.display = 'none';
+        uploadError.textContent = error instanceof UploadError
+            ? error.message
+            : 'Connection error - submit the same file again to resume the upload';
         uploadError.style.display = 'block';
     }
 });
 
-// Load documents
+// Load documents (first page of each list)
 async function loadDocuments() {
-    try {
-        const response = await fetch('/api/documents');
+    await Promise.all([loadPage('sent', true), loadPage('received', true)]);
+}
+
+// Load the next page of a list, or reload it from the start when reset is true
+async function loadPage(type, reset = false) {
+    const list = documentLists[type];
+    
+    if (list.loading) {
+        if (!reset) return;
+        await list.loading;
+    }
+    if (!reset && list.done) return;
+    
+    list.loading = (async () => {
+        // A reload fetches as many documents as are already on screen
+        const limit = reset ? Math.min(Math.max(PAGE_SIZE, list.count), MAX_PAGE_SIZE) : PAGE_SIZE;
+        const params = new URLSearchParams({ limit });
+        if (!reset && list.cursor) params.set('cursor', list.cursor);
+        
+        const response = await fetch(`${list.url}?${params}`);
         if (!response.ok) return;
         
-        const data = await response.json();
+        const page = await response.json();
+        const container = document.getElementById(list.containerId);
+        
+        if (reset) {
+            container.innerHTML = '';
+            list.count = 0;
+        }
         
-        displayDocuments(data.sent, 'sentDocuments', 'sent');
-        displayDocuments(data.received, 'receivedDocuments', 'received');
+        appendDocuments(container, page.items, type);
+        list.count += page.items.length;
+        list.cursor = page.next_cursor;
+        list.done = !page.next_cursor;
+        
+        if (list.count === 0) {
+            container.innerHTML = '<p class="no-documents">No documents</p>';
+        }
+    })();
+    
+    try {
+        await list.loading;
     } catch (error) {
         console.error('Error loading documents:', error);
+    } finally {
+        list.loading = null;
+    }
+    
+    // Keep loading while the end of the list is still visible
+    if (!list.done && isInViewport(document.getElementById(list.sentinelId))) {
+        await loadPage(type);
     }
 }
 
-function displayDocuments(documents, containerId, type) {
-    const container = document.getElementById(containerId);
+function isInViewport(element) {
+    const rect = element.getBoundingClientRect();
+    return rect.top < window.innerHeight && rect.bottom >= 0;
+}
+
+// Load the next page when the end of a list scrolls into view
+function observeSentinels() {
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                loadPage(entry.target.dataset.list);
+            }
+        });
+    }, { rootMargin: '200px' });
     
-    if (documents.length === 0) {
-        container.innerHTML = '<p class="no-documents">No documents</p>';
-        return;
-    }
+    Object.values(documentLists).forEach(list => {
+        observer.observe(document.getElementById(list.sentinelId));
+    });
+}
+
+function appendDocuments(container, documents, type) {
+    const fragment = document.createElement('div');
     
-    container.innerHTML = documents.map(doc => {
+    fragment.innerHTML = documents.map(doc => {
         const isExpired = doc.is_expired || doc.is_limit_reached;
         const expiresAt = doc.expires_at ? new Date(doc.expires_at).toLocaleString('en-US') : 'No expiration';
         
@@ -139,7 +319,9 @@ function displayDocuments(documents, containerId, type) {
         return `
             <div class="document-card">
                 <div class="document-header">
-                    <div class="document-filename">📄 ${doc.filename}</div>
+                    <div class="document-filename">
+                        ${type === 'received' && !isExpired ? `<input type="checkbox" class="document-select" data-doc-id="${doc.id}">` : ''}📄 ${doc.filename}
+                    </div>
                     ${statusBadge}
                 </div>
                 <div class="document-info">
@@ -154,7 +336,7 @@ function displayDocuments(documents, containerId, type) {
     }).join('');
     
     // Add event listeners for the download buttons
-    container.querySelectorAll('.download-btn').forEach(button => {
+    fragment.querySelectorAll('.download-btn').forEach(button => {
         button.addEventListener('click', async (e) => {
             e.preventDefault();
             e.stopPropagation();
@@ -177,8 +359,47 @@ function displayDocuments(documents, containerId, type) {
             }
         });
     });
+    
+    fragment.querySelectorAll('.document-select').forEach(checkbox => {
+        checkbox.addEventListener('change', updateDownloadSelected);
+    });
+    
+    container.append(...fragment.children);
+    updateDownloadSelected();
+}
+
+function selectedDocumentIds() {
+    return Array.from(
+        document.querySelectorAll('#receivedDocuments .document-select:checked'),
+        checkbox => checkbox.getAttribute('data-doc-id')
+    );
+}
+
+function updateDownloadSelected() {
+    document.getElementById('downloadSelectedBtn').disabled = selectedDocumentIds().length === 0;
 }
 
+// Download the selected received documents as one zip, streamed straight to disk.
+// Each document counts one view.
+document.getElementById('downloadSelectedBtn').addEventListener('click', async () => {
+    const ids = selectedDocumentIds();
+    if (ids.length === 0) return;
+    
+    const params = new URLSearchParams();
+    ids.forEach(id => params.append('ids', id));
+    const a = document.createElement('a');
+    a.href = `/api/documents/archive?${params}`;
+    a.download = 'documents.zip';
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+    
+    // Reload documents after a delay to update counters
+    setTimeout(async () => {
+        await loadDocuments();
+    }, 1000);
+});
+
 async function downloadDocument(documentId, filename) {
     // Verify if the document is already being downloaded
     if (downloadingDocuments.has(documentId)) {
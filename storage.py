@@ -0,0 +1,255 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+from config import settings
+
+
+class StoredBlob(NamedTuple):
+    """Location and integrity data of a stored blob"""
+    key: str
+    size: int
+    digest: str  # SHA-256 of the stored (encrypted) bytes, hex encoded
+
+
+class BlobWriter:
+    """
+    Incremental writer for a new blob
+    Use as a context manager: data is discarded unless commit() is called
+    """
+    
+    def write(self, data: bytes) -> None:
+        raise NotImplementedError
+    
+    def commit(self) -> StoredBlob:
+        raise NotImplementedError
+    
+    def abort(self) -> None:
+        raise NotImplementedError
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.abort()
+        return False
+
+
+class BlobStore:
+    """Interface for encrypted blob storage backends"""
+    
+    def writer(self) -> BlobWriter:
+        """Starts a new blob; its key is only known once committed"""
+        raise NotImplementedError
+    
+    def open(self, key: str) -> BinaryIO:
+        """Opens a stored blob for reading"""
+        raise NotImplementedError
+    
+    def read_chunks(self, key: str, chunk_size: int) -> Iterator[bytes]:
+        """Yields a stored blob in chunks"""
+        with self.open(key) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+    
+    def delete(self, key: str) -> None:
+        """Deletes a blob (missing blobs are ignored)"""
+        raise NotImplementedError
+    
+    # Staged parts of chunked uploads, assembled into a blob once complete
+    
+    def part_writer(self, upload_id: str, index: int) -> BlobWriter:
+        """Starts writing part `index` of an upload; a committed part replaces any earlier copy"""
+        raise NotImplementedError
+    
+    def open_part(self, upload_id: str, index: int) -> BinaryIO:
+        """Opens a staged part for reading"""
+        raise NotImplementedError
+    
+    def discard_parts(self, upload_id: str) -> None:
+        """Deletes every staged part of an upload"""
+        raise NotImplementedError
+    
+    def staged_uploads(self) -> List[str]:
+        """Lists the uploads that have staged parts"""
+        raise NotImplementedError
+    
+    def assemble(self, upload_id: str, part_count: int, header: bytes = b"", chunk_size: int = 1024 * 1024) -> StoredBlob:
+        """Writes `header` followed by parts 0..part_count-1 into a new blob"""
+        with self.writer() as writer:
+            writer.write(header)
+            for index in range(part_count):
+                with self.open_part(upload_id, index) as part:
+                    while True:
+                        chunk = part.read(chunk_size)
+                        if not chunk:
+                            break
+                        writer.write(chunk)
+            return writer.commit()
+
+
+class LocalBlobWriter(BlobWriter):
+    """Writes to a temporary file and moves it into place on commit"""
+    
+    def __init__(self, store: "LocalBlobStore"):
+        self._store = store
+        self._hash = hashlib.sha256()
+        self._size = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.tmp_dir, prefix="blob-")
+        self._file = os.fdopen(fd, "wb")
+        self._done = False
+    
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._hash.update(data)
+        self._size += len(data)
+    
+    def commit(self) -> StoredBlob:
+        # Make the content durable before it becomes visible under its key
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        
+        digest = self._hash.hexdigest()
+        key = self._store.key_for_digest(digest)
+        path = self._store.path_for(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        
+        if os.path.exists(path):
+            # Same content already stored
+            os.remove(self._tmp_path)
+        else:
+            os.replace(self._tmp_path, path)
+            _fsync_directory(directory)
+        
+        self._done = True
+        return StoredBlob(key=key, size=self._size, digest=digest)
+    
+    def abort(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class LocalPartWriter(LocalBlobWriter):
+    """Writes a staged upload part; commit atomically replaces an earlier copy"""
+    
+    def __init__(self, store: "LocalBlobStore", upload_id: str, index: int):
+        super().__init__(store)
+        self._path = store.part_path(upload_id, index)
+        self._key = f"{upload_id}/{index}"
+    
+    def commit(self) -> StoredBlob:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        
+        directory = os.path.dirname(self._path)
+        os.makedirs(directory, exist_ok=True)
+        os.replace(self._tmp_path, self._path)
+        _fsync_directory(directory)
+        
+        self._done = True
+        return StoredBlob(key=self._key, size=self._size, digest=self._hash.hexdigest())
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Content-addressed blobs on the local filesystem
+    Keys are sharded paths derived from the SHA-256 digest: ab/cd/abcd...
+    """
+    
+    KEY_PATTERN = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}$")
+    UPLOAD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+    
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        self.uploads_dir = os.path.join(self.root, "uploads")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(self.uploads_dir, exist_ok=True)
+    
+    def key_for_digest(self, digest: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}"
+    
+    def path_for(self, key: str) -> str:
+        # Keys are validated so they can never escape the storage root
+        if not self.KEY_PATTERN.match(key):
+            raise ValueError(f"Invalid blob key: {key}")
+        return os.path.join(self.root, *key.split("/"))
+    
+    def writer(self) -> LocalBlobWriter:
+        return LocalBlobWriter(self)
+    
+    def open(self, key: str) -> BinaryIO:
+        # Unbuffered: reads go straight from the OS into the returned chunk
+        return open(self.path_for(key), "rb", buffering=0)
+    
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+    
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+    
+    def upload_dir(self, upload_id: str) -> str:
+        # Upload ids are validated like keys: staged parts stay under uploads/
+        if not self.UPLOAD_ID_PATTERN.match(upload_id):
+            raise ValueError(f"Invalid upload id: {upload_id}")
+        return os.path.join(self.uploads_dir, upload_id)
+    
+    def part_path(self, upload_id: str, index: int) -> str:
+        return os.path.join(self.upload_dir(upload_id), f"{int(index)}.part")
+    
+    def part_writer(self, upload_id: str, index: int) -> LocalPartWriter:
+        return LocalPartWriter(self, upload_id, index)
+    
+    def open_part(self, upload_id: str, index: int) -> BinaryIO:
+        return open(self.part_path(upload_id, index), "rb", buffering=0)
+    
+    def discard_parts(self, upload_id: str) -> None:
+        shutil.rmtree(self.upload_dir(upload_id), ignore_errors=True)
+    
+    def staged_uploads(self) -> List[str]:
+        return [name for name in os.listdir(self.uploads_dir) if self.UPLOAD_ID_PATTERN.match(name)]
+
+
+def _fsync_directory(directory: str) -> None:
+    """Persists a rename by syncing its directory (not supported on Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+BACKENDS = {
+    "local": lambda: LocalBlobStore(settings.BLOB_STORAGE_PATH),
+}
+
+
+def get_blob_store(backend: Optional[str] = None) -> BlobStore:
+    """Creates the blob store configured in settings"""
+    backend = backend or settings.BLOB_STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown blob storage backend: {backend}")
+    return BACKENDS[backend]()
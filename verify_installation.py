@@ -14,6 +14,7 @@ def verify_modules():
         'fastapi',
         'uvicorn',
         'sqlalchemy',
+        'aiosqlite',
         'pydantic',
         'pydantic_settings',
         'jose',